@@ -0,0 +1,103 @@
+"""
+SUPERMERCAI - Alérgenos y restricciones de dieta
+Cada ingrediente se marca con bits de alérgenos y de origen animal; la
+máscara de una receta es el OR de las de sus ingredientes
+"""
+
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from texto import normalizar
+
+
+# Palabras clave (sin tildes) que identifican alérgenos en los ingredientes
+ALERGENOS = {
+    "gluten": ("pasta", "pan", "harina", "trigo", "fideos", "masa", "avena", "cuscus"),
+    "lactosa": ("leche", "queso", "yogur", "mozzarella", "parmesano", "nata", "mantequilla"),
+    "huevo": ("huevo",),
+    "frutos_secos": ("almendra", "nuez", "nueces", "avellana", "cacahuete", "pistacho"),
+    "pescado": ("salmon", "atun", "merluza", "bacalao", "pescado"),
+    "marisco": ("gamba", "langostino", "mejillon", "calamar", "marisco"),
+    "soja": ("soja", "tofu", "edamame"),
+    "sesamo": ("sesamo", "tahini"),
+}
+
+# Marcas de origen animal que no son alérgenos pero cuentan para las dietas
+ORIGEN_ANIMAL = {
+    "carne": ("pollo", "ternera", "cerdo", "jamon", "chorizo", "carne", "pavo", "cordero"),
+    "miel": ("miel",),
+}
+
+BITS = {marca: 1 << i for i, marca in enumerate({**ALERGENOS, **ORIGEN_ANIMAL})}
+BITS_ALERGENOS = {alergeno: BITS[alergeno] for alergeno in ALERGENOS}
+
+# Dieta -> marcas que la incumplen
+DIETAS = {
+    "vegetariana": BITS["carne"] | BITS["pescado"] | BITS["marisco"],
+}
+DIETAS["vegana"] = DIETAS["vegetariana"] | BITS["lactosa"] | BITS["huevo"] | BITS["miel"]
+
+# Formas habituales de escribir una alergia (ya normalizadas)
+SINONIMOS = {
+    "lacteos": "lactosa",
+    "leche": "lactosa",
+    "huevos": "huevo",
+    "frutos secos": "frutos_secos",
+    "nueces": "frutos_secos",
+    "celiaco": "gluten",
+    "celiaquia": "gluten",
+    "trigo": "gluten",
+    "mariscos": "marisco",
+    "crustaceos": "marisco",
+}
+
+
+@lru_cache(maxsize=65536)
+def marcas_ingrediente(nombre: str) -> int:
+    """Bits de alérgenos y de origen animal de un ingrediente"""
+    nombre = normalizar(nombre)
+    mascara = 0
+    for marca, claves in (*ALERGENOS.items(), *ORIGEN_ANIMAL.items()):
+        if any(clave in nombre for clave in claves):
+            mascara |= BITS[marca]
+    return mascara
+
+
+def analizar_receta(receta: dict) -> Tuple[int, str]:
+    """Máscara de la receta y el texto normalizado de sus ingredientes"""
+    return _analizar_nombres(tuple(ing["nombre"] for ing in receta["ingredientes"]))
+
+
+@lru_cache(maxsize=65536)
+def _analizar_nombres(nombres: Tuple[str, ...]) -> Tuple[int, str]:
+    # Las mismas listas de ingredientes se repiten mucho entre recetas
+    mascara = 0
+    for nombre in nombres:
+        mascara |= marcas_ingrediente(nombre)
+    return mascara, " | ".join(normalizar(nombre) for nombre in nombres)
+
+
+def mascara_exclusion(alergias: Iterable[str],
+                      dieta: Optional[str] = None) -> Tuple[int, List[str]]:
+    """
+    Máscara de las marcas que descartan una receta y lista de las alergias
+    sin bit propio (se buscan como texto en los ingredientes)
+
+    `dieta` puede ser cualquier valor; solo cuentan los de DIETAS.
+    """
+    mascara, libres = DIETAS.get(dieta, 0), []
+    for alergia in alergias or []:
+        alergia = normalizar(alergia.strip()).replace("_", " ")
+        alergia = SINONIMOS.get(alergia, alergia).replace(" ", "_")
+        if alergia in BITS_ALERGENOS:
+            mascara |= BITS_ALERGENOS[alergia]
+        elif alergia:
+            libres.append(alergia.replace("_", " "))
+    return mascara, libres
+
+
+def compatibles(mascaras: np.ndarray, excluidos: int) -> np.ndarray:
+    """Array booleano con las recetas que no tienen ninguna marca excluida"""
+    return (mascaras & np.uint32(excluidos)) == 0
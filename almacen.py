@@ -0,0 +1,319 @@
+"""
+SUPERMERCAI - Almacén compacto de recetas
+Columnas de NumPy y cadenas internadas en lugar de diccionarios anidados
+"""
+
+from typing import Dict, Iterable, Iterator, List, Sequence, Union
+
+import numpy as np
+
+# Campos con columna propia, en el orden en que se devuelven
+CAMPOS = ("id", "nombre", "descripcion", "tiempo_preparacion", "calorias",
+          "imagen_url", "tipo_comida", "ingredientes", "pasos", "estilo_cocina")
+CAMPOS_INGREDIENTE = ("nombre", "cantidad", "unidad", "producto_id", "precio")
+
+AUSENTE = -1  # índice de cadena de un campo que la receta no trae
+
+_ESCALARES = ("id", "calorias", "tiempo", "tipo", "imagen", "estilo", "descripcion", "pasos")
+# Atributos de AlmacenRecetas que son columnas
+COLUMNAS = ("ids", "calorias", "tiempo", "tipo", "imagen", "estilo", "descripcion", "pasos",
+            "ing_inicio", "ing_longitud", "ing_nombre", "ing_cantidad", "ing_unidad",
+            "ing_producto", "ing_precio")
+
+
+# ==================== COLUMNAS ====================
+
+class Internador:
+    """Cada valor distinto se guarda una vez y se referencia por su índice"""
+
+    __slots__ = ("valores", "_indices")
+
+    def __init__(self):
+        self.valores: List = []
+        self._indices: Dict = {}
+
+    def indice(self, valor) -> int:
+        if valor is None:
+            return AUSENTE
+        indice = self._indices.get(valor)
+        if indice is None:
+            indice = self._indices[valor] = len(self.valores)
+            self.valores.append(valor)
+        return indice
+
+    def __getitem__(self, indice: int):
+        return self.valores[indice]
+
+    def __len__(self) -> int:
+        return len(self.valores)
+
+    @classmethod
+    def de_valores(cls, valores: Iterable) -> "Internador":
+        """Internador con esos valores (distintos) en ese orden"""
+        internador = cls()
+        for valor in valores:
+            internador.indice(valor)
+        return internador
+
+
+class Columna:
+    """Array de NumPy con capacidad de sobra para añadir al final en O(1) amortizado"""
+
+    __slots__ = ("datos", "n")
+
+    def __init__(self, dtype, valores=()):
+        self.datos = np.asarray(valores, dtype=dtype)
+        self.n = len(self.datos)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def vista(self) -> np.ndarray:
+        """Los valores ocupados (una vista: deja de verse al crecer la columna)"""
+        return self.datos[:self.n]
+
+    def _reservar(self, extra: int) -> None:
+        if self.n + extra > len(self.datos):
+            nuevos = np.empty(max(2 * len(self.datos), self.n + extra, 16), dtype=self.datos.dtype)
+            nuevos[:self.n] = self.datos[:self.n]
+            self.datos = nuevos
+
+    def anadir(self, valor) -> None:
+        self._reservar(1)
+        self.datos[self.n] = valor
+        self.n += 1
+
+    def extender(self, valores) -> None:
+        valores = np.asarray(valores, dtype=self.datos.dtype)
+        self._reservar(len(valores))
+        self.datos[self.n:self.n + len(valores)] = valores
+        self.n += len(valores)
+
+
+def _numero(valor: float) -> Union[int, float]:
+    """Las cantidades enteras vuelven como int, igual que se escribieron"""
+    return int(valor) if valor.is_integer() else valor
+
+
+# ==================== ALMACÉN ====================
+
+class AlmacenRecetas(Sequence):
+    """
+    Recetas guardadas por columnas, una posición por receta
+
+    Los ingredientes de la receta en la posición i son las filas
+    ing_inicio[i]:ing_inicio[i] + ing_longitud[i] de las columnas ing_*.
+    Las cadenas que se repiten (tipos, imágenes, estilos, nombres de
+    ingredientes y unidades) se guardan una vez en `cadenas`, y las
+    descripciones y los pasos en `textos`. Los diccionarios solo se
+    construyen al leer una receta, para la respuesta; las claves que no
+    tienen columna se conservan aparte en `extras`.
+    """
+
+    def __init__(self, recetas: Iterable[dict] = ()):
+        self.cadenas = Internador()
+        self.textos = Internador()
+        self.nombre: List[str] = []
+        self.extras: Dict[int, dict] = {}
+
+        escalares = {campo: [] for campo in _ESCALARES + ("ing_inicio", "ing_longitud")}
+        filas = {campo: [] for campo in CAMPOS_INGREDIENTE}
+        for posicion, receta in enumerate(recetas):
+            self._guardar_texto(posicion, receta)
+            for campo, valor in zip(_ESCALARES, self._valores(receta)):
+                escalares[campo].append(valor)
+            escalares["ing_inicio"].append(len(filas["nombre"]))
+            escalares["ing_longitud"].append(len(receta["ingredientes"]))
+            for campo, columna in zip(CAMPOS_INGREDIENTE, self._filas(receta)):
+                filas[campo].extend(columna)
+
+        self.ids = Columna(np.int64, escalares["id"])
+        self.calorias = Columna(np.int32, escalares["calorias"])
+        self.tiempo = Columna(np.int32, escalares["tiempo"])
+        self.tipo = Columna(np.int32, escalares["tipo"])
+        self.imagen = Columna(np.int32, escalares["imagen"])
+        self.estilo = Columna(np.int32, escalares["estilo"])
+        self.descripcion = Columna(np.int32, escalares["descripcion"])
+        self.pasos = Columna(np.int32, escalares["pasos"])
+        self.ing_inicio = Columna(np.int64, escalares["ing_inicio"])
+        self.ing_longitud = Columna(np.int32, escalares["ing_longitud"])
+        self.ing_nombre = Columna(np.int32, filas["nombre"])
+        self.ing_cantidad = Columna(np.float64, filas["cantidad"])
+        self.ing_unidad = Columna(np.int32, filas["unidad"])
+        self.ing_producto = Columna(np.int64, filas["producto_id"])
+        self.ing_precio = Columna(np.float64, filas["precio"])
+
+    @classmethod
+    def desde_columnas(cls, columnas: Dict[str, np.ndarray], cadenas: Internador, textos,
+                       nombre, extras: Dict[int, dict]) -> "AlmacenRecetas":
+        """
+        Almacén sobre columnas ya construidas (p. ej. mapeadas de una
+        instantánea), sin copiarlas; `columnas` va por nombre de atributo
+        """
+        almacen = cls.__new__(cls)
+        almacen.cadenas = cadenas
+        almacen.textos = textos
+        almacen.nombre = nombre
+        almacen.extras = extras
+        for atributo in COLUMNAS:
+            setattr(almacen, atributo, Columna(columnas[atributo].dtype, columnas[atributo]))
+        return almacen
+
+    def columnas(self) -> Dict[str, np.ndarray]:
+        """Valores ocupados de cada columna, por nombre de atributo"""
+        return {atributo: getattr(self, atributo).vista() for atributo in COLUMNAS}
+
+    def _escalares(self) -> tuple:
+        """Columnas por receta, en el orden de _ESCALARES"""
+        return (self.ids, self.calorias, self.tiempo, self.tipo, self.imagen,
+                self.estilo, self.descripcion, self.pasos)
+
+    def _columnas_filas(self) -> tuple:
+        """Columnas de ingredientes, en el orden de CAMPOS_INGREDIENTE"""
+        return (self.ing_nombre, self.ing_cantidad, self.ing_unidad,
+                self.ing_producto, self.ing_precio)
+
+    def _guardar_texto(self, posicion: int, receta: dict) -> None:
+        """Nombre y claves sin columna de una receta"""
+        if posicion == len(self.nombre):
+            self.nombre.append(receta.get("nombre"))
+        else:
+            self.nombre[posicion] = receta.get("nombre")
+        extras = {k: v for k, v in receta.items() if k not in CAMPOS}
+        if extras:
+            self.extras[posicion] = extras
+        else:
+            self.extras.pop(posicion, None)
+
+    def _valores(self, receta: dict) -> tuple:
+        """Valores de las columnas por receta, en el orden de _ESCALARES"""
+        pasos = receta.get("pasos")
+        return (
+            receta["id"], receta["calorias"], receta["tiempo_preparacion"],
+            self.cadenas.indice(receta["tipo_comida"]),
+            self.cadenas.indice(receta.get("imagen_url")),
+            self.cadenas.indice(receta.get("estilo_cocina")),
+            self.textos.indice(receta.get("descripcion")),
+            self.textos.indice(tuple(pasos) if pasos is not None else None),
+        )
+
+    def _filas(self, receta: dict) -> tuple:
+        """Columnas de los ingredientes de una receta, en el orden de CAMPOS_INGREDIENTE"""
+        ingredientes = receta["ingredientes"]
+        return (
+            [self.cadenas.indice(ing["nombre"]) for ing in ingredientes],
+            [ing["cantidad"] for ing in ingredientes],
+            [self.cadenas.indice(ing["unidad"]) for ing in ingredientes],
+            [ing["producto_id"] for ing in ingredientes],
+            [ing["precio"] for ing in ingredientes],
+        )
+
+    # ---------- Escritura ----------
+
+    def anadir(self, receta: dict) -> int:
+        """Añade una receta al final y devuelve su posición"""
+        posicion = len(self)
+        self._guardar_texto(posicion, receta)
+        for columna, valor in zip(self._escalares(), self._valores(receta)):
+            columna.anadir(valor)
+        self.ing_inicio.anadir(len(self.ing_nombre))
+        self.ing_longitud.anadir(len(receta["ingredientes"]))
+        self._extender_filas(receta)
+        return posicion
+
+    def sustituir(self, posicion: int, receta: dict) -> None:
+        """
+        Sobrescribe la receta de una posición
+
+        Si el número de ingredientes no cambia, sus filas se reescriben en su
+        sitio; si cambia, se añaden al final y las antiguas quedan sin uso.
+        """
+        self._guardar_texto(posicion, receta)
+        for columna, valor in zip(self._escalares(), self._valores(receta)):
+            columna.datos[posicion] = valor
+
+        longitud = len(receta["ingredientes"])
+        if longitud == self.ing_longitud.datos[posicion]:
+            filas = self.filas(posicion)
+            for columna, valores in zip(self._columnas_filas(), self._filas(receta)):
+                columna.datos[filas] = valores
+        else:
+            self.ing_inicio.datos[posicion] = len(self.ing_nombre)
+            self.ing_longitud.datos[posicion] = longitud
+            self._extender_filas(receta)
+
+    def _extender_filas(self, receta: dict) -> None:
+        for columna, valores in zip(self._columnas_filas(), self._filas(receta)):
+            columna.extender(valores)
+
+    # ---------- Lectura ----------
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def filas(self, posicion: int) -> slice:
+        """Filas de los ingredientes de una receta"""
+        inicio = int(self.ing_inicio.datos[posicion])
+        return slice(inicio, inicio + int(self.ing_longitud.datos[posicion]))
+
+    def filas_de(self, posiciones) -> np.ndarray:
+        """Filas de los ingredientes de varias recetas, receta a receta"""
+        posiciones = np.asarray(posiciones, dtype=np.int64)
+        longitudes = self.ing_longitud.datos[posiciones].astype(np.int64)
+        # Inicio de cada receta repetido por fila, más el desfase dentro de ella
+        desfases = np.arange(int(longitudes.sum()), dtype=np.int64) - np.repeat(
+            np.cumsum(longitudes) - longitudes, longitudes
+        )
+        return np.repeat(self.ing_inicio.datos[posiciones], longitudes) + desfases
+
+    def id_en(self, posicion: int) -> int:
+        return int(self.ids.datos[posicion])
+
+    def tipo_en(self, posicion: int) -> str:
+        return self.cadenas[int(self.tipo.datos[posicion])]
+
+    def productos(self, posicion: int) -> List[int]:
+        """producto_id distintos de una receta, en orden de aparición"""
+        return list(dict.fromkeys(self.ing_producto.datos[self.filas(posicion)].tolist()))
+
+    def receta(self, posicion: int) -> dict:
+        """Diccionario de la receta, construido para la respuesta"""
+        if not 0 <= posicion < len(self):
+            raise IndexError(posicion)
+        cadenas, textos = self.cadenas.valores, self.textos.valores
+        filas = self.filas(posicion)
+        ingredientes = [
+            {"nombre": cadenas[nombre], "cantidad": _numero(cantidad), "unidad": cadenas[unidad],
+             "producto_id": producto, "precio": _numero(precio)}
+            for nombre, cantidad, unidad, producto, precio in zip(
+                self.ing_nombre.datos[filas].tolist(), self.ing_cantidad.datos[filas].tolist(),
+                self.ing_unidad.datos[filas].tolist(), self.ing_producto.datos[filas].tolist(),
+                self.ing_precio.datos[filas].tolist(),
+            )
+        ]
+        valores = {
+            "id": int(self.ids.datos[posicion]),
+            "nombre": self.nombre[posicion],
+            "descripcion": textos[d] if (d := int(self.descripcion.datos[posicion])) != AUSENTE else None,
+            "tiempo_preparacion": int(self.tiempo.datos[posicion]),
+            "calorias": int(self.calorias.datos[posicion]),
+            "imagen_url": cadenas[i] if (i := int(self.imagen.datos[posicion])) != AUSENTE else None,
+            "tipo_comida": cadenas[int(self.tipo.datos[posicion])],
+            "ingredientes": ingredientes,
+            "pasos": list(textos[p]) if (p := int(self.pasos.datos[posicion])) != AUSENTE else None,
+            "estilo_cocina": cadenas[e] if (e := int(self.estilo.datos[posicion])) != AUSENTE else None,
+        }
+        receta = {campo: valor for campo, valor in valores.items() if valor is not None}
+        if posicion in self.extras:
+            receta.update(self.extras[posicion])
+        return receta
+
+    def __getitem__(self, posicion):
+        if isinstance(posicion, slice):
+            return [self.receta(p) for p in range(*posicion.indices(len(self)))]
+        if posicion < 0:
+            posicion += len(self)
+        return self.receta(posicion)
+
+    def __iter__(self) -> Iterator[dict]:
+        return (self.receta(posicion) for posicion in range(len(self)))
@@ -0,0 +1,4 @@
+"""
+SUPERMERCAI - Benchmarks de rendimiento
+Ejecutar desde la raíz del proyecto: python -m benchmarks.<nombre>
+"""
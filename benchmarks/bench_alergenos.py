@@ -0,0 +1,98 @@
+"""
+Benchmark: filtro de alérgenos y dieta con máscaras de bits frente a
+buscar las palabras clave en los ingredientes de cada receta
+
+Uso: python -m benchmarks.bench_alergenos
+"""
+
+import asyncio
+import time
+
+import numpy as np
+
+from alergenos import ALERGENOS, DIETAS, ORIGEN_ANIMAL, mascara_exclusion
+from catalogo import CatalogoRecetas
+from repositorio import RepositorioMemoria
+from resumenes import ResumenesRecetas
+from texto import normalizar
+from benchmarks.sinteticos import generar_recetas
+
+RECETAS = 100_000
+REPETICIONES = 20
+
+COMBINACIONES = [
+    (["gluten"], None),
+    (["gluten", "lactosa"], None),
+    (["gluten", "lactosa", "huevo", "frutos_secos"], None),
+    (["pescado", "marisco", "soja"], "vegetariana"),
+    (["frutos_secos", "sesamo"], "vegana"),
+]
+
+
+def _claves(alergias, dieta):
+    """Palabras clave que descartan una receta (para la búsqueda por texto)"""
+    claves = [clave for alergia in alergias for clave in ALERGENOS[alergia]]
+    if dieta in DIETAS:
+        claves += ORIGEN_ANIMAL["carne"] + ALERGENOS["pescado"] + ALERGENOS["marisco"]
+        if dieta == "vegana":
+            claves += ALERGENOS["lactosa"] + ALERGENOS["huevo"] + ORIGEN_ANIMAL["miel"]
+    return claves
+
+
+def _por_texto(recetas, claves) -> int:
+    """Normaliza y busca en cada ingrediente en cada petición"""
+    return sum(
+        not any(clave in normalizar(ing["nombre"]) for ing in receta["ingredientes"] for clave in claves)
+        for receta in recetas
+    )
+
+
+def _por_texto_normalizado(textos, claves) -> int:
+    """Busca en el texto de ingredientes ya normalizado de la tabla de resúmenes"""
+    return sum(not any(clave in texto for clave in claves) for texto in textos)
+
+
+def _ms(funcion, repeticiones: int = REPETICIONES):
+    """Milisegundos medios por llamada y el último resultado"""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1000, resultado
+
+
+async def _ms_pagina(repositorio, excluidos: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(REPETICIONES):
+        await repositorio.pagina(None, 50, excluidos)
+    return (time.perf_counter() - inicio) / REPETICIONES * 1000
+
+
+def main():
+    recetas = generar_recetas(RECETAS)
+    catalogo = CatalogoRecetas(recetas)
+    resumenes = ResumenesRecetas(catalogo)
+    inicio = time.perf_counter()
+    tabla = resumenes.tabla()
+    print(f"Tabla de resúmenes con máscaras ({RECETAS} recetas): "
+          f"{(time.perf_counter() - inicio) * 1000:.0f} ms")
+    repositorio = RepositorioMemoria(catalogo, resumenes)
+
+    print(f"\n{'exclusión':<48} {'compatibles':>11} {'texto':>9} {'normalizado':>12} "
+          f"{'máscara':>9} {'página 50':>10}")
+    for alergias, dieta in COMBINACIONES:
+        excluidos, _ = mascara_exclusion(alergias, dieta)
+        claves = _claves(alergias, dieta)
+        t_texto, n_texto = _ms(lambda: _por_texto(recetas, claves), 1)
+        t_normalizado, n_normalizado = _ms(lambda: _por_texto_normalizado(tabla.texto, claves), 3)
+        t_mascara, compatibles = _ms(lambda: tabla.compatibles(excluidos))
+        n_mascara = int(np.count_nonzero(compatibles))
+        assert n_texto == n_normalizado == n_mascara, (n_texto, n_normalizado, n_mascara)
+        t_pagina = asyncio.run(_ms_pagina(repositorio, excluidos))
+
+        nombre = "+".join(alergias) + (f" ({dieta})" if dieta else "")
+        print(f"{nombre:<48} {n_mascara:>11} {t_texto:>7.0f}ms {t_normalizado:>10.1f}ms "
+              f"{t_mascara:>7.3f}ms {t_pagina:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Benchmark: arranque y memoria con varios trabajadores
+
+Sirve un catálogo SQLite sintético con `servidor.py` (catálogo precargado
+antes de bifurcar), con `uvicorn --workers` (cada trabajador lo carga por
+su cuenta) y con `servidor.py` sobre la instantánea binaria del mismo
+catálogo (mapeada en memoria en lugar de leída de SQLite). Mide el tiempo hasta que todos los trabajadores están listos y
+la memoria de todos los procesos: RSS cuenta en cada proceso las páginas
+compartidas y PSS las reparte entre quienes las comparten, así que la suma
+de PSS es la memoria real que ocupa el servidor. Solo Linux (/proc).
+
+Uso: python -m benchmarks.bench_arranque
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from instantanea import escribir
+from productos import PRODUCTOS_EJEMPLO
+from repositorio import importar
+from benchmarks.carga import _puerto_libre
+from benchmarks.sinteticos import generar_recetas
+
+RECETAS = 100_000
+TRABAJADORES = [1, 2, 4]
+REPOSO = 1.0  # segundos sin consumir CPU para dar un arranque por terminado
+
+
+def _descendientes(pid: int) -> list:
+    pendientes, todos = [pid], []
+    while pendientes:
+        actual = pendientes.pop()
+        todos.append(actual)
+        try:
+            with open(f"/proc/{actual}/task/{actual}/children") as hijos:
+                pendientes.extend(int(h) for h in hijos.read().split())
+        except OSError:
+            pass
+    return todos
+
+
+def _cpu(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            campos = stat.read().rsplit(")", 1)[1].split()
+        return int(campos[11]) + int(campos[12])  # utime + stime
+    except OSError:
+        return 0
+
+
+def _memoria_kb(pid: int) -> tuple:
+    """(RSS, PSS) en KiB de un proceso"""
+    rss = pss = 0
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as smaps:
+            for linea in smaps:
+                if linea.startswith("Rss:"):
+                    rss = int(linea.split()[1])
+                elif linea.startswith("Pss:"):
+                    pss = int(linea.split()[1])
+    except OSError:
+        pass
+    return rss, pss
+
+
+def _esperar_listo(proceso: subprocess.Popen, base: str, procesos: int) -> float:
+    """
+    Instante (perf_counter) en que, respondiendo ya, todos los procesos
+    dejaron de gastar CPU durante al menos REPOSO segundos
+    """
+    respondido, ultimo_cambio, anterior = False, time.perf_counter(), None
+    while True:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor terminó con código {proceso.returncode}")
+        if not respondido:
+            try:
+                respondido = httpx.get(f"{base}/api/hello", timeout=1.0).status_code == 200
+            except httpx.TransportError:
+                pass
+        pids = _descendientes(proceso.pid)
+        actual = (len(pids), sum(_cpu(pid) for pid in pids))
+        ahora = time.perf_counter()
+        if actual != anterior:
+            anterior, ultimo_cambio = actual, ahora
+        elif respondido and len(pids) >= procesos and ahora - ultimo_cambio >= REPOSO:
+            return ultimo_cambio
+        time.sleep(0.05)
+
+
+def _medir(comando: list, trabajadores: int, entorno: dict, puerto: int) -> dict:
+    base = f"http://127.0.0.1:{puerto}"
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(comando, env=entorno, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    # Con más de un trabajador, el principal y los trabajadores
+    procesos = trabajadores + 1 if trabajadores > 1 else 1
+    try:
+        listo = _esperar_listo(proceso, base, procesos) - inicio
+        # Peticiones que construyen el planificador, el carrito y los
+        # fragmentos en los trabajadores que no los heredan ya hechos; su
+        # tiempo de respuesta cuenta como parte del arranque
+        inicio_peticiones = time.perf_counter()
+        with httpx.Client(base_url=base, timeout=60.0) as cliente:
+            for i in range(20 * trabajadores):
+                cliente.post("/api/generar-menu", json={"objetivo": "definir", "tiempo_cocina": "medio",
+                                                        "presupuesto": 40 + i},
+                             headers={"Connection": "close"})
+                cliente.post("/api/agregar-a-carrito", json={"recetas_ids": [1, 2, 3]},
+                             headers={"Connection": "close"})
+        calentado = _esperar_listo(proceso, base, procesos) - inicio_peticiones + listo
+        memoria = [_memoria_kb(pid) for pid in _descendientes(proceso.pid)]
+        return {
+            "listo_s": listo,
+            "calentado_s": calentado,
+            "rss_mb": sum(rss for rss, _ in memoria) / 1024,
+            "pss_mb": sum(pss for _, pss in memoria) / 1024,
+        }
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "catalogo.db")
+        recetas = generar_recetas(RECETAS)
+        importar(recetas, ruta)
+        ruta_instantanea = os.path.join(directorio, "catalogo.inst")
+        escribir(ruta_instantanea, recetas, PRODUCTOS_EJEMPLO)
+        del recetas
+        entorno = {**os.environ, "SUPERMERCAI_DB": ruta}
+        entorno_instantanea = {**os.environ, "SUPERMERCAI_INSTANTANEA": ruta_instantanea}
+
+        print(f"{RECETAS} recetas en SQLite; memoria sumada de todos los procesos")
+        print("listo: responde; calentado: tras 20 menús y carritos por trabajador")
+        print(f"{'servidor':<18} {'trabajadores':>12} {'listo (s)':>10} {'calentado (s)':>14} {'RSS (MB)':>9} "
+              f"{'PSS (MB)':>9} {'PSS/trab. (MB)':>15}")
+        for trabajadores in TRABAJADORES:
+            puerto = _puerto_libre()
+            servidor = [sys.executable, "servidor.py", "--workers", str(trabajadores),
+                        "--port", str(puerto), "--log-level", "warning"]
+            modos = [
+                ("servidor.py", servidor, entorno),
+                ("uvicorn --workers", [sys.executable, "-m", "uvicorn", "main:app",
+                                       "--workers", str(trabajadores), "--port", str(puerto),
+                                       "--log-level", "warning"], entorno),
+                ("servidor.py inst.", servidor, entorno_instantanea),
+            ]
+            for nombre, comando, entorno_modo in modos:
+                r = _medir(comando, trabajadores, entorno_modo, puerto)
+                print(f"{nombre:<18} {trabajadores:>12} {r['listo_s']:>10.2f} {r['calentado_s']:>14.2f} "
+                      f"{r['rss_mb']:>9.0f} "
+                      f"{r['pss_mb']:>9.0f} {r['pss_mb'] / trabajadores:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: búsqueda de recetas con índice invertido frente a recorrido lineal
+
+El recorrido lineal compara las palabras de la consulta con el texto ya
+normalizado de cada receta (el mejor caso para él: no normaliza en cada
+consulta). Se mide también la construcción del índice y el parche de
+recetas sueltas.
+
+Uso: python -m benchmarks.bench_busqueda
+"""
+
+import random
+import time
+
+from busqueda import IndiceBusqueda, tokenizar
+from catalogo import CatalogoRecetas
+from resumenes import ResumenesRecetas
+from benchmarks.bench_planificador import _percentil
+from benchmarks.carga import BUSQUEDAS
+from benchmarks.sinteticos import generar_recetas
+
+TAMANOS = [10_000, 100_000]
+CONSULTAS = 300
+PARCHES = 200
+
+
+def _consultas(semilla: int = 0):
+    rng = random.Random(semilla)
+    consultas = []
+    for _ in range(CONSULTAS):
+        productos = rng.sample(range(1, 46), 6) if rng.random() < 0.3 else []
+        consultas.append((rng.choice(BUSQUEDAS), productos))
+    return consultas
+
+
+def _lineal(textos, consulta: str, limite: int = 20):
+    terminos = tokenizar(consulta)
+    puntuadas = []
+    for posicion, texto in enumerate(textos):
+        coincidencias = sum(1 for t in terminos if t in texto)
+        if coincidencias:
+            puntuadas.append((-coincidencias, posicion))
+    puntuadas.sort()
+    return puntuadas[:limite]
+
+
+def _medir(funcion, consultas):
+    tiempos = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        funcion(*consulta)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return _percentil(tiempos, 0.5), _percentil(tiempos, 0.99)
+
+
+def main():
+    consultas = _consultas()
+    print(f"{CONSULTAS} consultas (30 % con productos), 20 resultados")
+    print(f"{'recetas':>8} {'modo':<10} {'p50 (ms)':>9} {'p99 (ms)':>9}   construir / parche")
+    for n in TAMANOS:
+        recetas = generar_recetas(n)
+        catalogo = CatalogoRecetas(recetas)
+        busqueda = IndiceBusqueda(catalogo, ResumenesRecetas(catalogo))
+        inicio = time.perf_counter()
+        busqueda.datos()
+        construir = time.perf_counter() - inicio
+
+        rng = random.Random(1)
+        inicio = time.perf_counter()
+        for _ in range(PARCHES):
+            receta = recetas[rng.randrange(n)]
+            catalogo.actualizar_receta({**receta, "nombre": receta["nombre"] + " casera"})
+            busqueda.datos()
+        parche = (time.perf_counter() - inicio) / PARCHES * 1000
+
+        textos = [set(tokenizar(" ".join([r["nombre"], r.get("descripcion", "")]
+                                         + [i["nombre"] for i in r["ingredientes"]])))
+                  for r in catalogo.todas()]
+        p50, p99 = _medir(lambda q, productos: _lineal(textos, q), consultas[:30])
+        print(f"{n:>8} {'lineal':<10} {p50:>9.2f} {p99:>9.2f}")
+        p50, p99 = _medir(lambda q, productos: busqueda.buscar(q, productos, limite=20), consultas)
+        print(f"{n:>8} {'índice':<10} {p50:>9.2f} {p99:>9.2f}   {construir:.2f} s / {parche:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark: agregación del carrito con bucle de diccionarios frente a la
+reducción agrupada sobre la tabla columnar
+
+Uso: python -m benchmarks.bench_carrito
+"""
+
+import random
+import time
+
+from carrito import TablaIngredientes
+from catalogo import CatalogoRecetas
+from benchmarks.sinteticos import generar_recetas
+
+RECETAS = 100_000
+CARRITOS = [21, 84, 336, 1_000]  # 1 semana, 4 semanas, 16 semanas, lote grande
+REPETICIONES = 200
+
+
+def agregar_con_bucle(catalogo: CatalogoRecetas, recetas_ids):
+    """Implementación anterior: diccionario construido ingrediente a ingrediente"""
+    carrito = {}
+    for receta in catalogo.obtener_varias(recetas_ids):
+        for ing in receta["ingredientes"]:
+            key = str(ing["producto_id"])
+            if key in carrito:
+                carrito[key]["cantidad"] += ing["cantidad"]
+                carrito[key]["precio"] += ing["precio"]
+                carrito[key]["recetas"].append(receta["id"])
+            else:
+                carrito[key] = {**ing, "recetas": [receta["id"]]}
+    return list(carrito.values())
+
+
+def _medir(funcion, *args) -> float:
+    inicio = time.perf_counter()
+    for _ in range(REPETICIONES):
+        funcion(*args)
+    return (time.perf_counter() - inicio) / REPETICIONES * 1e6
+
+
+def main():
+    recetas = generar_recetas(RECETAS)
+    catalogo = CatalogoRecetas(recetas)
+    inicio = time.perf_counter()
+    tabla = TablaIngredientes(recetas)
+    print(f"Tabla de {len(tabla.linea)} filas construida en "
+          f"{(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+    print(f"{'recetas':>8} {'bucle (µs)':>12} {'columnar (µs)':>14}")
+    for tamano in CARRITOS:
+        # Recetas repetidas, como en un carrito de varias semanas
+        distintas = random.sample(range(1, RECETAS + 1), max(1, tamano // 3))
+        ids = [random.choice(distintas) for _ in range(tamano)]
+        bucle = _medir(agregar_con_bucle, catalogo, ids)
+        columnar = _medir(tabla.agregar, ids)
+        print(f"{tamano:>8} {bucle:>12.0f} {columnar:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Benchmark: búsqueda por id con índice frente a recorrido lineal
+
+Uso: python -m benchmarks.bench_catalogo
+"""
+
+import random
+import time
+
+from catalogo import CatalogoRecetas
+from benchmarks.sinteticos import generar_recetas
+
+TAMANOS = [1_000, 10_000, 100_000]
+CONSULTAS = 2_000
+
+
+def _medir(funcion, ids) -> float:
+    """Microsegundos medios por consulta"""
+    inicio = time.perf_counter()
+    for receta_id in ids:
+        funcion(receta_id)
+    return (time.perf_counter() - inicio) / len(ids) * 1e6
+
+
+def main():
+    print(f"{'recetas':>10} {'carga (ms)':>12} {'índice (µs)':>12} {'lineal (µs)':>12}")
+    for n in TAMANOS:
+        recetas = generar_recetas(n)
+        ids = [random.randint(1, n) for _ in range(CONSULTAS)]
+
+        inicio = time.perf_counter()
+        catalogo = CatalogoRecetas(recetas)
+        carga_ms = (time.perf_counter() - inicio) * 1000
+
+        indexado = _medir(catalogo.obtener, ids)
+        # El recorrido lineal es O(n): se mide con menos consultas
+        lineal = _medir(lambda rid: next((r for r in recetas if r["id"] == rid), None), ids[:50])
+
+        print(f"{n:>10} {carga_ms:>12.1f} {indexado:>12.3f} {lineal:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
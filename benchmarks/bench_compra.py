@@ -0,0 +1,80 @@
+"""
+Benchmark: elección de envases para carritos grandes con tablas precalculadas
+
+Uso: python -m benchmarks.bench_compra
+"""
+
+import random
+import statistics
+import time
+
+from productos import CatalogoProductos
+
+PRODUCTOS = 2_000
+LINEAS = [50, 500, 2_000]
+REPETICIONES = 50
+
+# (unidad de venta, tamaños de envase posibles, precio orientativo por unidad)
+FORMATOS = [
+    ("g", [100, 125, 200, 250, 400, 500, 570, 750, 1000], 0.004),
+    ("ml", [200, 330, 500, 750, 1000, 1500, 5000], 0.002),
+    ("unidad", [1, 2, 3, 4, 6, 8, 10, 12], 0.5),
+]
+
+
+def generar_productos(n: int, semilla: int = 0) -> list:
+    """Productos con 1-4 envases de marca blanca, fabricante o granel"""
+    rng = random.Random(semilla)
+    productos = []
+    for producto_id in range(1, n + 1):
+        unidad, tamanos, precio_base = rng.choice(FORMATOS)
+        envases = []
+        for tamano in sorted(rng.sample(tamanos, rng.randint(1, 4))):
+            # Los envases grandes salen algo más baratos por unidad
+            precio = tamano * precio_base * rng.uniform(0.7, 1.3) * (1 - 0.05 * len(envases))
+            envases.append({
+                "nombre": f"{tamano} {unidad}",
+                "tipo": rng.choice(["marca_blanca", "fabricante", "granel"]),
+                "cantidad": tamano,
+                "precio": round(max(precio, 0.05), 2),
+            })
+        productos.append({"id": producto_id, "nombre": f"Producto {producto_id}",
+                          "unidad": unidad, "envases": envases})
+    return productos
+
+
+def generar_lineas(productos: list, n: int, rng: random.Random) -> list:
+    """Líneas agregadas de carrito con necesidades de hasta ~10 envases grandes"""
+    lineas = []
+    for producto in rng.sample(productos, n):
+        mayor = max(e["cantidad"] for e in producto["envases"])
+        lineas.append({"producto_id": producto["id"], "nombre": producto["nombre"],
+                       "cantidad": round(rng.uniform(0.05, 10) * mayor, 2),
+                       "unidad": producto["unidad"], "precio": 1.0})
+    return lineas
+
+
+def main():
+    productos = generar_productos(PRODUCTOS)
+    inicio = time.perf_counter()
+    catalogo = CatalogoProductos(productos)
+    print(f"Tablas de {PRODUCTOS} productos (2 preferencias) en "
+          f"{(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+    rng = random.Random(1)
+    print(f"{'líneas':>8} {'mediana (ms)':>13} {'p95 (ms)':>9}")
+    for n in LINEAS:
+        carritos = [generar_lineas(productos, n, rng) for _ in range(REPETICIONES)]
+        tiempos = []
+        for i, lineas in enumerate(carritos):
+            preferencia = "marca_blanca" if i % 2 else "otras"
+            inicio = time.perf_counter()
+            catalogo.resolver(lineas, preferencia)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        tiempos.sort()
+        print(f"{n:>8} {statistics.median(tiempos):>13.2f} "
+              f"{tiempos[int(len(tiempos) * 0.95) - 1]:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
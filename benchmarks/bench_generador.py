@@ -0,0 +1,113 @@
+"""
+Benchmark: latencia de generar-menu con un generador lento, en ráfagas
+
+El backend simulado tarda 0.4 s ± 50 % (un 5 % de llamadas, 8 veces más) y,
+como un proveedor con límite de uso, atiende como mucho 8 llamadas a la vez.
+Se comparan las llamadas directas (una por petición) con el servicio, que
+agrupa las peticiones idénticas, limita la concurrencia y responde con el
+catálogo si la generación tarda más de `TIMEOUT`.
+
+Uso: python -m benchmarks.bench_generador
+"""
+
+import asyncio
+import random
+import time
+from collections import Counter
+
+from catalogo import CatalogoRecetas
+from generador import GeneradorSimulado, ServicioGeneracion
+from main import UserPreferences
+from planificador import PlanificadorMenus
+from resumenes import ResumenesRecetas
+from benchmarks.sinteticos import generar_recetas
+from benchmarks.bench_planificador import PREFERENCIAS, _percentil
+
+RECETAS = 10_000
+RAFAGAS = 3
+PETICIONES_RAFAGA = 400
+PREFERENCIAS_DISTINTAS = 40  # por ráfaga; la mitad se repite de la anterior
+CAPACIDAD_PROVEEDOR = 8
+TIMEOUT = 1.0
+
+
+class GeneradorLimitado(GeneradorSimulado):
+    """Generador simulado que encola las llamadas por encima de la capacidad del proveedor"""
+
+    def __init__(self, *args, capacidad: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._capacidad = asyncio.Semaphore(capacidad)
+
+    async def generar(self, preferencias):
+        async with self._capacidad:
+            return await super().generar(preferencias)
+
+
+def _rafagas(semilla: int = 0):
+    rng = random.Random(semilla)
+    conjuntos = [
+        UserPreferences(**PREFERENCIAS[i % len(PREFERENCIAS)], presupuesto=40 + 5 * i)
+        for i in range(PREFERENCIAS_DISTINTAS * (RAFAGAS + 1))
+    ]
+    rafagas = []
+    for r in range(RAFAGAS):
+        inicio = r * PREFERENCIAS_DISTINTAS // 2
+        distintas = conjuntos[inicio:inicio + PREFERENCIAS_DISTINTAS]
+        rafagas.append([rng.choice(distintas) for _ in range(PETICIONES_RAFAGA)])
+    return rafagas
+
+
+async def _medir(atender, rafagas):
+    tiempos, origenes = [], Counter()
+
+    async def peticion(preferencias):
+        inicio = time.perf_counter()
+        menu = await atender(preferencias)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        origenes[menu.get("origen", "generado") if menu else "ninguno"] += 1
+
+    for rafaga in rafagas:
+        await asyncio.gather(*(peticion(p) for p in rafaga))
+    return tiempos, origenes
+
+
+async def _directo(planificador, rafagas):
+    generador = GeneradorLimitado(planificador, latencia=0.4, semilla=1,
+                                  capacidad=CAPACIDAD_PROVEEDOR)
+
+    async def atender(preferencias):
+        recetas = await generador.generar(preferencias)
+        return {"recetas": recetas}
+
+    tiempos, origenes = await _medir(atender, rafagas)
+    return tiempos, origenes, generador.llamadas
+
+
+async def _servicio(planificador, rafagas):
+    generador = GeneradorLimitado(planificador, latencia=0.4, semilla=1,
+                                  capacidad=CAPACIDAD_PROVEEDOR)
+    servicio = ServicioGeneracion(generador, planificador.planificar,
+                                  max_concurrentes=CAPACIDAD_PROVEEDOR, timeout=TIMEOUT)
+    tiempos, origenes = await _medir(servicio.menu, rafagas)
+    return tiempos, origenes, generador.llamadas
+
+
+def main():
+    catalogo = CatalogoRecetas(generar_recetas(RECETAS))
+    planificador = PlanificadorMenus(catalogo, ResumenesRecetas(catalogo))
+    planificador.datos()
+    rafagas = _rafagas()
+
+    print(f"{RAFAGAS} ráfagas de {PETICIONES_RAFAGA} peticiones simultáneas, "
+          f"{PREFERENCIAS_DISTINTAS} preferencias distintas por ráfaga, timeout {TIMEOUT} s")
+    print(f"{'modo':<10} {'p50 (ms)':>9} {'p99 (ms)':>9} {'máx (ms)':>9} {'llamadas':>9}  origen")
+    for nombre, modo in (("directo", _directo), ("servicio", _servicio)):
+        tiempos, origenes, llamadas = asyncio.run(modo(planificador, rafagas))
+        tiempos.sort()
+        print(f"{nombre:<10} {_percentil(tiempos, 0.5):>9.0f} {_percentil(tiempos, 0.99):>9.0f} "
+              f"{tiempos[-1]:>9.0f} {llamadas:>9}  "
+              + ", ".join(f"{k}={v}" for k, v in sorted(origenes.items())))
+
+
+if __name__ == "__main__":
+    main()
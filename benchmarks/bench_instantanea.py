@@ -0,0 +1,107 @@
+"""
+Benchmark: arranque en frío desde la instantánea binaria frente a SQLite
+
+Cada arranque es un proceso nuevo que importa main y construye lo que el
+servidor necesita antes de atender (resúmenes, tabla del carrito, índice
+de búsqueda, vectores de las recomendaciones y JSON de las recetas).
+Desde SQLite eso es leer y deserializar todas las recetas y recalcularlo
+todo; desde la instantánea es mapear el fichero. Se mide también la
+primera petición de carrito y el primer menú (el planificador no se
+guarda en la instantánea: se construye en el primer menú). Con un millón
+de recetas solo se arranca desde la instantánea: cargarlas desde SQLite no
+cabe en la memoria de una máquina modesta.
+
+Uso: python -m benchmarks.bench_instantanea [--recetas 100000 1000000]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+RECETAS = [100_000, 1_000_000]
+LIMITE_BD = 100_000  # recetas máximas con las que se arranca desde SQLite
+
+
+def _arrancar():
+    """Proceso hijo: arranca la aplicación e imprime sus tiempos en JSON"""
+    inicio = time.perf_counter()
+    import main
+
+    for derivado in (main.resumenes, main.agregador_carrito, main.fragmentos, main.busqueda,
+                     main.recomendador):
+        if derivado is not None:
+            derivado.datos()
+    listo = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    main.agregador_carrito.agregar([1, 2, 3])
+    main.fragmentos.de_ids([1, 2, 3])
+    carrito = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    main.planificador.planificar(main.UserPreferences(objetivo="definir", tiempo_cocina="medio",
+                                                      presupuesto=60))
+    menu = time.perf_counter() - inicio
+
+    with open(f"/proc/{os.getpid()}/status") as estado:
+        rss = next(int(linea.split()[1]) for linea in estado if linea.startswith("VmRSS:"))
+    print(json.dumps({"listo_s": listo, "carrito_ms": carrito * 1000, "menu_s": menu,
+                      "rss_mb": rss / 1024}))
+
+
+def _medir(entorno: dict) -> dict:
+    inicio = time.perf_counter()
+    salida = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_instantanea", "_arrancar"],
+        env={**os.environ, **entorno}, capture_output=True, text=True, check=True,
+    ).stdout
+    total = time.perf_counter() - inicio
+    return {**json.loads(salida.splitlines()[-1]), "proceso_s": total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("comando", nargs="?")
+    parser.add_argument("--recetas", type=int, nargs="+", default=RECETAS)
+    argumentos = parser.parse_args()
+    if argumentos.comando == "_arrancar":
+        _arrancar()
+        return
+    # Aquí y no arriba: sinteticos importa main, que el hijo debe importar dentro de la medida
+    from instantanea import escribir
+    from productos import PRODUCTOS_EJEMPLO
+    from repositorio import importar
+    from benchmarks.sinteticos import iterar_recetas
+
+    print("listo: import main + resúmenes, carrito, búsqueda, recomendaciones y JSON de las recetas; "
+          "proceso: incluye arrancar el intérprete")
+    print(f"{'recetas':>9} {'origen':<12} {'construir (s)':>14} {'tamaño (MB)':>12} {'listo (s)':>10} "
+          f"{'proceso (s)':>12} {'1.er carrito (ms)':>18} {'1.er menú (s)':>14} {'RSS (MB)':>9}")
+    for n in argumentos.recetas:
+        with tempfile.TemporaryDirectory() as directorio:
+            origenes = []
+            if n <= LIMITE_BD:
+                ruta_bd = os.path.join(directorio, "catalogo.db")
+                inicio = time.perf_counter()
+                importar(iterar_recetas(n), ruta_bd)
+                origenes.append(("sqlite", {"SUPERMERCAI_DB": ruta_bd},
+                                 time.perf_counter() - inicio, os.path.getsize(ruta_bd)))
+            ruta = os.path.join(directorio, "catalogo.inst")
+            inicio = time.perf_counter()
+            meta = escribir(ruta, iterar_recetas(n), PRODUCTOS_EJEMPLO)
+            origenes.append(("instantánea", {"SUPERMERCAI_INSTANTANEA": ruta},
+                             time.perf_counter() - inicio, meta["bytes"]))
+
+            for nombre, entorno, construccion, tamano in origenes:
+                r = _medir(entorno)
+                print(f"{n:>9} {nombre:<12} {construccion:>14.1f} {tamano / 2 ** 20:>12.0f} "
+                      f"{r['listo_s']:>10.2f} {r['proceso_s']:>12.2f} {r['carrito_ms']:>18.1f} "
+                      f"{r['menu_s']:>14.2f} {r['rss_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark: peticiones por segundo de /api/generar-menu y /api/recetas-guardadas
+codificando con json y diccionarios frente a orjson y recetas ya codificadas
+
+Las peticiones pasan por la aplicación completa (httpx sobre ASGI, sin red)
+con la caché de respuestas desactivada, para medir la construcción y la
+codificación de cada respuesta.
+
+Uso: python -m benchmarks.bench_json
+"""
+
+import asyncio
+import time
+
+import httpx
+
+import cache
+import main as aplicacion
+from cache import CacheRespuestas
+from catalogo import CatalogoRecetas
+from fragmentos import FragmentosRecetas
+from planificador import PlanificadorMenus
+from repositorio import RepositorioMemoria
+from resumenes import ResumenesRecetas
+from benchmarks.sinteticos import generar_recetas
+
+RECETAS = 10_000
+PETICIONES = 400
+
+PREFERENCIAS = {"objetivo": "definir", "tiempo_cocina": "medio", "presupuesto": 60}
+
+
+def _configurar(rapido: bool) -> None:
+    """Sustituye el estado global de main por un catálogo sintético"""
+    catalogo = CatalogoRecetas(generar_recetas(RECETAS))
+    resumenes = ResumenesRecetas(catalogo)
+    fragmentos = FragmentosRecetas(catalogo) if rapido else None
+    aplicacion.catalogo = catalogo
+    aplicacion.resumenes = resumenes
+    aplicacion.fragmentos = fragmentos
+    aplicacion.repositorio = RepositorioMemoria(catalogo, resumenes, fragmentos)
+    aplicacion.planificador = PlanificadorMenus(catalogo, resumenes)
+    aplicacion.cache_respuestas = CacheRespuestas(max_entradas=0)  # sin aciertos
+    cache._json = cache._json_stdlib if not rapido or cache.orjson is None else cache._json_orjson
+    aplicacion.planificador.datos()
+    if fragmentos is not None:
+        fragmentos.datos()
+
+
+async def _peticiones_por_segundo(peticion) -> float:
+    transporte = httpx.ASGITransport(app=aplicacion.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        for i in range(10):
+            await peticion(cliente, i)
+        inicio = time.perf_counter()
+        for i in range(PETICIONES):
+            respuesta = await peticion(cliente, i)
+            assert respuesta.status_code == 200, respuesta.text
+        return PETICIONES / (time.perf_counter() - inicio)
+
+
+async def _menu(cliente, i):
+    # Presupuestos distintos para que cada petición resuelva su menú
+    return await cliente.post("/api/generar-menu",
+                              json={**PREFERENCIAS, "presupuesto": 40 + i % 80})
+
+
+def _pagina(limite: int):
+    async def peticion(cliente, i):
+        return await cliente.get("/api/recetas-guardadas", params={"limite": limite})
+    return peticion
+
+
+def main():
+    casos = [
+        ("/api/generar-menu", _menu),
+        ("/api/recetas-guardadas limite=50", _pagina(50)),
+        ("/api/recetas-guardadas limite=500", _pagina(500)),
+    ]
+    resultados = {}
+    for rapido in (False, True):
+        _configurar(rapido)
+        for nombre, peticion in casos:
+            resultados[nombre, rapido] = asyncio.run(_peticiones_por_segundo(peticion))
+
+    print(f"{RECETAS} recetas, {PETICIONES} peticiones por caso, sin caché")
+    print(f"{'ruta':<36} {'json (req/s)':>13} {'orjson+fragmentos':>18} {'mejora':>7}")
+    for nombre, _ in casos:
+        antes, despues = resultados[nombre, False], resultados[nombre, True]
+        print(f"{nombre:<36} {antes:>13.0f} {despues:>18.0f} {despues / antes:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
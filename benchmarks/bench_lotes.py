@@ -0,0 +1,72 @@
+"""
+Benchmark: hogares por segundo al generar menús por lotes frente a una
+llamada al planificador por hogar
+
+Uso: python -m benchmarks.bench_lotes
+"""
+
+import asyncio
+import os
+import random
+import time
+
+from catalogo import CatalogoRecetas
+from lotes import GeneradorLotes
+from main import UserPreferences
+from planificador import PlanificadorMenus
+from resumenes import ResumenesRecetas
+from benchmarks.sinteticos import generar_recetas
+from benchmarks.bench_planificador import PREFERENCIAS
+
+RECETAS = 10_000
+HOGARES = 5_000
+
+
+def _hogares(semanas: int, semilla: int = 0):
+    rng = random.Random(semilla)
+    return [
+        (i, UserPreferences(**rng.choice(PREFERENCIAS),
+                            presupuesto=rng.randrange(40, 120, 5),
+                            num_personas=rng.randint(1, 4)), semanas)
+        for i in range(HOGARES)
+    ]
+
+
+async def _consumir(generador: GeneradorLotes, hogares) -> int:
+    total = 0
+    async for _ in generador.generar(hogares):
+        total += 1
+    return total
+
+
+def main():
+    catalogo = CatalogoRecetas(generar_recetas(RECETAS))
+    planificador = PlanificadorMenus(catalogo, ResumenesRecetas(catalogo))
+    planificador.datos()
+    procesos = os.cpu_count() or 1
+
+    print(f"{RECETAS} recetas, {HOGARES} hogares, {procesos} CPU")
+    print(f"{'semanas':>8} {'modo':<28} {'hogares/s':>10}")
+    for semanas in (1, 4):
+        hogares = _hogares(semanas)
+
+        inicio = time.perf_counter()
+        for _, preferencias, n in hogares:
+            planificador.planificar_semanas(preferencias, n)
+        print(f"{semanas:>8} {'una llamada por hogar':<28} "
+              f"{HOGARES / (time.perf_counter() - inicio):>10.0f}")
+
+        for n_procesos in sorted({1, procesos}):
+            generador = GeneradorLotes(planificador, n_procesos)
+            if n_procesos > 1:
+                generador._pool_actual()  # arranque del pool fuera de la medida
+            inicio = time.perf_counter()
+            total = asyncio.run(_consumir(generador, hogares))
+            assert total == HOGARES
+            print(f"{semanas:>8} {f'lote, {n_procesos} proceso(s)':<28} "
+                  f"{HOGARES / (time.perf_counter() - inicio):>10.0f}")
+            generador.cerrar()
+
+
+if __name__ == "__main__":
+    main()
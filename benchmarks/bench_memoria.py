@@ -0,0 +1,44 @@
+"""
+Benchmark: memoria por receta de la lista de diccionarios frente al almacén compacto
+
+Las recetas se cargan desde JSON, como llegarían de un fichero o de la
+API: cada cadena es un objeto distinto aunque el texto se repita.
+
+Uso: python -m benchmarks.bench_memoria
+"""
+
+import gc
+import json
+import tracemalloc
+
+from almacen import AlmacenRecetas
+from catalogo import CatalogoRecetas
+from benchmarks.sinteticos import generar_recetas
+
+TAMANOS = [10_000, 100_000]
+
+
+def _bytes(construir) -> tuple:
+    """(objeto construido, bytes que siguen reservados tras construirlo)"""
+    gc.collect()
+    tracemalloc.start()
+    objeto = construir()
+    gc.collect()
+    usados, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return objeto, usados
+
+
+def main():
+    print(f"{'recetas':>10} {'dicts (B)':>10} {'almacén (B)':>12} {'catálogo (B)':>13} {'reducción':>10}")
+    for n in TAMANOS:
+        texto = json.dumps(generar_recetas(n))
+        recetas, dicts = _bytes(lambda: json.loads(texto))
+        _, almacen = _bytes(lambda: AlmacenRecetas(recetas))
+        _, catalogo = _bytes(lambda: CatalogoRecetas(recetas))
+        print(f"{n:>10} {dicts / n:>10.0f} {almacen / n:>12.0f} {catalogo / n:>13.0f} "
+              f"{dicts / almacen:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark: tiempo de resolución del planificador de menús
+
+Mide p50/p99 según el tamaño del catálogo y lo ajustado del presupuesto
+(fracción del coste del menú sin restricción de presupuesto).
+
+Uso: python -m benchmarks.bench_planificador
+"""
+
+import itertools
+import time
+
+from catalogo import CatalogoRecetas
+from main import UserPreferences
+from planificador import PlanificadorMenus
+from resumenes import ResumenesRecetas
+from benchmarks.sinteticos import generar_recetas
+
+TAMANOS = [1_000, 10_000, 50_000]
+AJUSTES = [1.5, 1.0, 0.8, 0.6, 0.3]
+REPETICIONES = 60
+
+PREFERENCIAS = [
+    {"objetivo": o, "tiempo_cocina": t, "estilo_cocina": e, "alergias": a}
+    for o, t, e, a in itertools.product(
+        ["ganar_masa", "definir", "adelgazar", "comer_sano"],
+        ["poco", "medio", "mucho"],
+        ["mediterranea", "vegetariana"],
+        [[], ["gluten"], ["lactosa", "huevo"]],
+    )
+]
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def main():
+    print(f"{'recetas':>8} {'ajuste':>7} {'p50 (ms)':>9} {'p99 (ms)':>9} {'en presupuesto':>15}")
+    for n in TAMANOS:
+        catalogo = CatalogoRecetas(generar_recetas(n))
+        planificador = PlanificadorMenus(catalogo, ResumenesRecetas(catalogo))
+        planificador.datos()  # la preparación ocurre una vez por versión del catálogo
+
+        for ajuste in AJUSTES:
+            tiempos, cumplidos = [], 0
+            for i in range(REPETICIONES):
+                datos = PREFERENCIAS[i % len(PREFERENCIAS)]
+                libre = planificador.planificar(UserPreferences(**datos, presupuesto=1e9))
+                if libre is None:
+                    continue
+                preferencias = UserPreferences(**datos, presupuesto=libre["costo_total"] * ajuste)
+
+                inicio = time.perf_counter()
+                menu = planificador.planificar(preferencias)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                cumplidos += menu["dentro_presupuesto"]
+
+            print(f"{n:>8} {ajuste:>7.1f} {_percentil(tiempos, 0.5):>9.2f} "
+                  f"{_percentil(tiempos, 0.99):>9.2f} {cumplidos:>8}/{len(tiempos)}")
+
+
+if __name__ == "__main__":
+    main()
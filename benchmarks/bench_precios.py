@@ -0,0 +1,155 @@
+"""
+Benchmark: feed de precios aplicado de forma incremental frente a receta a receta
+
+Envía a la aplicación (por ASGI, en proceso) un feed CSV de 10 000 filas:
+los productos que usan las recetas, con un precio nuevo, y el resto de la
+tabla de productos del supermercado, que no usa ninguna receta. La
+ingesta lee el cuerpo a trozos, cambia la tabla de precios y reescribe de
+una vez los ingredientes afectados (índice por producto del catálogo); los
+resúmenes, el carrito y el planificador se parchean con operaciones por
+columnas y el JSON de cada receta se recodifica cuando se vuelve a pedir.
+La alternativa ingenua recalcula cada receta afectada en Python y la
+sustituye en el catálogo, con el parche completo de todas las estructuras.
+Se comprueba que las dos dejan los mismos costes.
+
+Uso: python -m benchmarks.bench_precios
+"""
+
+import asyncio
+import random
+import time
+
+import httpx
+import numpy as np
+
+from busqueda import IndiceBusqueda
+from carrito import AgregadorCarrito
+from catalogo import CatalogoRecetas
+from fragmentos import FragmentosRecetas
+from planificador import PlanificadorMenus
+from precios import LectorFeed, PreciosProductos
+from productos import PRODUCTOS_EJEMPLO, CatalogoProductos
+from recomendaciones import Recomendador
+from resumenes import ResumenesRecetas
+from benchmarks.sinteticos import configurar_aplicacion, generar_recetas
+
+TAMANOS = [10_000, 100_000]
+# La vía ingenua tarda minutos con 100k recetas (175 s): solo se mide hasta aquí
+INGENUO_HASTA = 10_000
+FILAS = 10_000
+# Productos del feed que usan las recetas: todos o unos pocos
+ESCENARIOS = {"todos": 45, "5 productos": 5}
+UNIDAD_FEED = {"g": "kg", "ml": "l", "unidad": "unidad"}
+
+
+def _feed(tabla, usados: int, semilla: int = 0) -> bytes:
+    """CSV con `usados` productos de las recetas y el resto hasta FILAS sin recetas"""
+    rng = random.Random(semilla)
+    lineas = ["producto_id,precio,unidad"]
+    for producto_id in sorted(tabla.precio)[:usados]:
+        unidad = tabla.unidad[producto_id]
+        escala = 1000 if unidad in ("g", "ml") else 1
+        precio = tabla.precio[producto_id] * escala * rng.uniform(0.8, 1.2)
+        lineas.append(f"{producto_id},{precio:.4f},{UNIDAD_FEED[unidad]}")
+    while len(lineas) <= FILAS:
+        lineas.append(f"{rng.randint(1000, 50_000)},{rng.uniform(0.5, 20):.2f},kg")
+    return ("\n".join(lineas) + "\n").encode()
+
+
+async def _enviar(aplicacion, cuerpo: bytes) -> dict:
+    async def trozos():
+        for inicio in range(0, len(cuerpo), 64 * 1024):
+            yield cuerpo[inicio:inicio + 64 * 1024]
+
+    transporte = httpx.ASGITransport(app=aplicacion.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        respuesta = await cliente.post("/api/precios", content=trozos(),
+                                       headers={"content-type": "text/csv"})
+    return respuesta.json()
+
+
+def _montar(n: int):
+    """Catálogo con todas sus estructuras derivadas construidas"""
+    catalogo = CatalogoRecetas(generar_recetas(n))
+    resumenes = ResumenesRecetas(catalogo)
+    recomendador = Recomendador(catalogo, resumenes)
+    derivados = [resumenes, FragmentosRecetas(catalogo), recomendador,
+                 PlanificadorMenus(catalogo, resumenes, recomendador),
+                 IndiceBusqueda(catalogo, resumenes), AgregadorCarrito(catalogo)]
+    precios = PreciosProductos(catalogo, CatalogoProductos(PRODUCTOS_EJEMPLO))
+    for derivado in derivados + [precios]:
+        derivado.datos()
+    return catalogo, resumenes, precios
+
+
+def _ingenuo(n: int, cuerpo: bytes):
+    """Aplica el feed recalculando y sustituyendo cada receta afectada; devuelve (s, resúmenes)"""
+    catalogo, resumenes, precios = _montar(n)
+    inicio = time.perf_counter()
+    lector = LectorFeed("csv")
+    lector.alimentar(cuerpo)
+    lector.terminar()
+    tabla = precios.tabla()
+    cambiados = {}
+    for producto_id, (precio, unidad) in lector.precios.items():
+        anterior = tabla.precio.get(producto_id)
+        unitario, destino = tabla.convertir(producto_id, precio, unidad)
+        tabla.precio[producto_id], tabla.unidad[producto_id] = round(unitario, 6), destino
+        cambiados[producto_id] = round(unitario, 6) / anterior if anterior else 1.0
+
+    afectadas = {}
+    for producto_id in cambiados:
+        for receta in catalogo.por_producto(producto_id):
+            afectadas[receta["id"]] = receta
+    recetas = []
+    for receta in afectadas.values():
+        ingredientes = []
+        for ing in receta["ingredientes"]:
+            producto_id = ing["producto_id"]
+            if producto_id in cambiados:
+                factor = tabla.factor(producto_id, ing["unidad"], tabla.unidad[producto_id])
+                if np.isfinite(factor):
+                    precio = ing["cantidad"] * factor * tabla.precio[producto_id]
+                else:
+                    precio = ing["precio"] * cambiados[producto_id]
+                ing = {**ing, "precio": float(np.round(precio, 4))}
+            ingredientes.append(ing)
+        recetas.append({**receta, "ingredientes": ingredientes})
+    catalogo.actualizar_recetas(recetas)  # cada estructura se parchea receta a receta
+    return time.perf_counter() - inicio, resumenes.tabla()
+
+
+def main():
+    print(f"Feed CSV de {FILAS} filas enviado por HTTP a trozos de 64 KiB")
+    print(f"{'recetas':>8} {'productos':<12} {'afectadas':>9} {'incremental (s)':>16} "
+          f"{'ingenuo (s)':>12}   1.er menú / carrito tras el feed (ms)")
+    for n in TAMANOS:
+        for escenario, usados in ESCENARIOS.items():
+            aplicacion = configurar_aplicacion(n)
+            cuerpo = _feed(aplicacion.precios.tabla(), usados)
+            inicio = time.perf_counter()
+            resultado = asyncio.run(_enviar(aplicacion, cuerpo))
+            incremental = time.perf_counter() - inicio
+            assert resultado["success"] and not resultado["num_errores"], resultado
+
+            preferencias = aplicacion.UserPreferences(objetivo="definir", tiempo_cocina="medio",
+                                                      presupuesto=60)
+            inicio = time.perf_counter()
+            aplicacion.planificador.planificar(preferencias)
+            menu = (time.perf_counter() - inicio) * 1000
+            inicio = time.perf_counter()
+            aplicacion.agregador_carrito.agregar(range(1, 22))
+            carrito = (time.perf_counter() - inicio) * 1000
+
+            ingenuo = "-"
+            if n <= INGENUO_HASTA:
+                segundos, tabla = _ingenuo(n, cuerpo)
+                # Las dos vías dejan los mismos costes
+                assert np.allclose(tabla.coste, aplicacion.resumenes.tabla().coste, atol=1e-6)
+                ingenuo = f"{segundos:.2f}"
+            print(f"{n:>8} {escenario:<12} {resultado['recetas']:>9} {incremental:>16.3f} "
+                  f"{ingenuo:>12}   {menu:.1f} / {carrito:.1f}")
+
+
+if __name__ == "__main__":
+    main()
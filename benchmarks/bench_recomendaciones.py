@@ -0,0 +1,104 @@
+"""
+Benchmark: recomendaciones por similitud con la matriz de vectores
+
+Compara el producto de la matriz de todo el catálogo por el perfil del
+usuario con el cálculo receta a receta en Python (el coseno de cada par),
+y mide también la construcción de la matriz, el parche de recetas sueltas
+y el primer menú con favoritas.
+
+Uso: python -m benchmarks.bench_recomendaciones
+"""
+
+import random
+import time
+
+import numpy as np
+
+from catalogo import CatalogoRecetas
+from main import UserPreferences
+from planificador import PlanificadorMenus
+from recomendaciones import Recomendador
+from resumenes import ResumenesRecetas
+from benchmarks.bench_planificador import _percentil
+from benchmarks.sinteticos import generar_recetas
+
+TAMANOS = [10_000, 100_000]
+CONSULTAS = 300
+PARCHES = 200
+LIMITE = 10
+
+
+def _favoritas(n: int, semilla: int = 0):
+    rng = random.Random(semilla)
+    return [rng.sample(range(1, n + 1), rng.randint(1, 8)) for _ in range(CONSULTAS)]
+
+
+def _por_pares(recomendador: Recomendador, favoritas) -> list:
+    """El mismo resultado que `recomendar`, con el coseno de cada par en Python"""
+    tabla = recomendador.datos()
+    filas = tabla.matriz().tolist()
+    posiciones = [recomendador.catalogo.posicion(r) for r in favoritas]
+    perfil = tabla.perfil(posiciones).tolist()
+    excluidas = set(posiciones)
+    similitudes = [
+        (-sum(a * b for a, b in zip(fila, perfil)), posicion)
+        for posicion, fila in enumerate(filas) if posicion not in excluidas
+    ]
+    similitudes.sort()
+    return similitudes[:LIMITE]
+
+
+def _medir(funcion, consultas):
+    tiempos = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        funcion(consulta)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return _percentil(tiempos, 0.5), _percentil(tiempos, 0.99)
+
+
+def main():
+    print(f"{CONSULTAS} usuarios con 1 a 8 recetas favoritas, {LIMITE} recomendaciones")
+    print(f"{'recetas':>8} {'modo':<10} {'p50 (ms)':>9} {'p99 (ms)':>9}   construir / parche / 1.er menú")
+    for n in TAMANOS:
+        recetas = generar_recetas(n)
+        catalogo = CatalogoRecetas(recetas)
+        resumenes = ResumenesRecetas(catalogo)
+        resumenes.datos()
+        recomendador = Recomendador(catalogo, resumenes)
+        inicio = time.perf_counter()
+        recomendador.datos()
+        construir = time.perf_counter() - inicio
+
+        rng = random.Random(1)
+        inicio = time.perf_counter()
+        for _ in range(PARCHES):
+            receta = recetas[rng.randrange(n)]
+            catalogo.actualizar_receta({**receta, "calorias": receta["calorias"] + 100})
+            recomendador.datos()
+        parche = (time.perf_counter() - inicio) / PARCHES * 1000
+
+        favoritas = _favoritas(n)
+        # Comprobación: el cálculo por pares elige las mismas similitudes
+        for consulta in favoritas[:3]:
+            _, similitudes, _ = recomendador.recomendar(consulta, limite=LIMITE)
+            esperadas = [-s for s, _ in _por_pares(recomendador, consulta)]
+            assert np.allclose(similitudes, esperadas, atol=1e-5)
+
+        p50, p99 = _medir(lambda f: _por_pares(recomendador, f), favoritas[:10])
+        print(f"{n:>8} {'por pares':<10} {p50:>9.2f} {p99:>9.2f}")
+        p50, p99 = _medir(lambda f: recomendador.recomendar(f, limite=LIMITE), favoritas)
+
+        planificador = PlanificadorMenus(catalogo, resumenes, recomendador)
+        preferencias = UserPreferences(objetivo="definir", tiempo_cocina="medio",
+                                       presupuesto=60, favoritas=favoritas[0])
+        inicio = time.perf_counter()
+        planificador.planificar(preferencias)
+        menu = time.perf_counter() - inicio
+        print(f"{n:>8} {'matriz':<10} {p50:>9.2f} {p99:>9.2f}   "
+              f"{construir:.2f} s / {parche:.2f} ms / {menu:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
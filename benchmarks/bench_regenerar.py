@@ -0,0 +1,59 @@
+"""
+Benchmark: sustitución de una receta del menú (/api/regenerar-receta)
+
+Mide p50/p99 de la búsqueda de sustitutas según el tamaño del catálogo y
+el número de alternativas pedidas en una sola llamada.
+
+Uso: python -m benchmarks.bench_regenerar
+"""
+
+import random
+import time
+
+from catalogo import CatalogoRecetas
+from main import UserPreferences
+from planificador import PlanificadorMenus
+from resumenes import ResumenesRecetas
+from benchmarks.sinteticos import generar_recetas
+from benchmarks.bench_planificador import PREFERENCIAS, _percentil
+
+TAMANOS = [1_000, 10_000, 100_000]
+CANTIDADES = [1, 10]
+REPETICIONES = 200
+
+
+def main():
+    print(f"{'recetas':>8} {'alternativas':>13} {'p50 (ms)':>9} {'p99 (ms)':>9} {'en presupuesto':>15}")
+    rng = random.Random(0)
+    for n in TAMANOS:
+        catalogo = CatalogoRecetas(generar_recetas(n))
+        planificador = PlanificadorMenus(catalogo, ResumenesRecetas(catalogo))
+        planificador.datos()
+
+        menus = []
+        for datos in PREFERENCIAS[:24]:
+            preferencias = UserPreferences(**datos, presupuesto=60)
+            menu = planificador.planificar(preferencias)
+            if menu is not None:
+                menus.append((preferencias, menu["recetas"]))
+
+        for cantidad in CANTIDADES:
+            tiempos, cumplidos = [], 0
+            for _ in range(REPETICIONES):
+                preferencias, recetas = rng.choice(menus)
+                receta = rng.choice(recetas)
+                ids = [r["id"] for r in recetas]
+
+                inicio = time.perf_counter()
+                sustitutos = planificador.sustitutos(
+                    preferencias, receta["tipo_comida"], ids, receta["id"], cantidad
+                )
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                cumplidos += bool(sustitutos) and sustitutos[0]["dentro_presupuesto"]
+
+            print(f"{n:>8} {cantidad:>13} {_percentil(tiempos, 0.5):>9.2f} "
+                  f"{_percentil(tiempos, 0.99):>9.2f} {cumplidos:>8}/{len(tiempos)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark: importación masiva a SQLite, carga del catálogo desde ella y
+consultas del repositorio en memoria frente a la lista sin índices
+
+Uso: python -m benchmarks.bench_repositorio
+"""
+
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from catalogo import CatalogoRecetas
+from repositorio import RepositorioMemoria, cargar_recetas, importar
+from resumenes import ResumenesRecetas
+from benchmarks.sinteticos import generar_recetas
+
+RECETAS = 100_000
+CONSULTAS = 500
+
+
+async def _medir(funcion, argumentos) -> float:
+    """Microsegundos medios por consulta"""
+    inicio = time.perf_counter()
+    for argumento in argumentos:
+        await funcion(argumento)
+    return (time.perf_counter() - inicio) / len(argumentos) * 1e6
+
+
+async def comparar(recetas):
+    lista = recetas
+    catalogo = CatalogoRecetas(recetas)
+    memoria = RepositorioMemoria(catalogo, ResumenesRecetas(catalogo))
+
+    async def lineal(receta_id):
+        return next((r for r in lista if r["id"] == receta_id), None)
+
+    async def lineal_producto(producto_id):
+        return [r for r in lista if any(i["producto_id"] == producto_id for i in r["ingredientes"])]
+
+    ids = [random.randint(1, len(recetas)) for _ in range(CONSULTAS)]
+    productos = [random.randint(1, 45) for _ in range(20)]
+
+    print(f"{'consulta':<22} {'lista (µs)':>12} {'memoria (µs)':>13}")
+    print(f"{'por id':<22} {await _medir(lineal, ids[:20]):>12.0f} "
+          f"{await _medir(memoria.obtener, ids):>13.1f}")
+    print(f"{'por producto':<22} {await _medir(lineal_producto, productos[:3]):>12.0f} "
+          f"{await _medir(memoria.por_producto, productos):>13.0f}")
+    print(f"{'página de 50':<22} {'-':>12} "
+          f"{await _medir(lambda rid: memoria.pagina(rid, 50), ids):>13.1f}")
+
+
+def main():
+    recetas = generar_recetas(RECETAS)
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "recetas.db")
+        inicio = time.perf_counter()
+        importar(recetas, ruta)
+        print(f"Importación de {RECETAS} recetas: {time.perf_counter() - inicio:.2f} s")
+        inicio = time.perf_counter()
+        cargadas = cargar_recetas(ruta)
+        print(f"Carga desde SQLite: {time.perf_counter() - inicio:.2f} s")
+        assert len(cargadas) == RECETAS
+    asyncio.run(comparar(recetas))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Benchmark: actualización incremental de los resúmenes frente a reconstruirlos
+
+Uso: python -m benchmarks.bench_resumenes
+"""
+
+import time
+
+from carrito import AgregadorCarrito
+from catalogo import CatalogoRecetas
+from planificador import PlanificadorMenus
+from resumenes import ResumenesRecetas
+from benchmarks.sinteticos import generar_recetas
+
+RECETAS = 100_000
+
+
+def _ms(inicio: float) -> float:
+    return (time.perf_counter() - inicio) * 1000
+
+
+def main():
+    catalogo = CatalogoRecetas(generar_recetas(RECETAS))
+    resumenes = ResumenesRecetas(catalogo)
+    planificador = PlanificadorMenus(catalogo, resumenes)
+    carrito = AgregadorCarrito(catalogo)
+
+    inicio = time.perf_counter()
+    resumenes.datos(), planificador.datos(), carrito.datos()
+    print(f"Construcción completa ({RECETAS} recetas): {_ms(inicio):.0f} ms")
+
+    receta = catalogo.obtener(RECETAS // 2)
+    inicio = time.perf_counter()
+    catalogo.actualizar_receta({**receta, "calorias": receta["calorias"] + 50})
+    print(f"Cambio de una receta:                    {_ms(inicio):.2f} ms")
+
+    afectadas = len(catalogo.por_producto(33))
+    inicio = time.perf_counter()
+    catalogo.ajustar_precio_producto(33, 1.10)
+    print(f"Subida de precio de un producto ({afectadas} recetas): {_ms(inicio):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Benchmark: escrituras de usuarios con escritura diferida frente a escritura directa
+
+Lanza contra la aplicación (por ASGI, en proceso) una carga de escritura
+intensa a ritmo fijo: marcar y quitar favoritas, guardar carritos y menús,
+con algunas lecturas. La escritura directa hace cada escritura en SQLite
+dentro de la petición, en el bucle de eventos; la diferida solo toca la
+memoria y un hilo vuelca por lotes. Mientras tanto un temporizador de 1 ms
+mide cuánto se retrasa el bucle de eventos, y se suma el tiempo que pasa
+en el disco dentro de él: con la diferida, ninguna petición espera al
+disco. Las dos usan `synchronous = NORMAL`.
+
+Uso: python -m benchmarks.bench_usuarios
+"""
+
+import asyncio
+import gc
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import httpx
+
+from usuarios import AlmacenUsuarios
+from benchmarks.bench_planificador import PREFERENCIAS, _percentil
+from benchmarks.sinteticos import configurar_aplicacion
+
+RECETAS = 10_000
+USUARIOS = 2_000
+PETICIONES = 6_000
+RITMO = 400  # peticiones por segundo, por debajo de lo que atiende un proceso
+TICK = 0.001  # segundos entre tics del temporizador
+
+
+class AlmacenDirecto(AlmacenUsuarios):
+    """Escribe cada operación en el disco en cuanto se hace, sin salir del bucle de eventos"""
+
+    def __init__(self, ruta: str, **opciones):
+        super().__init__(ruta, **opciones)
+        self._conexion = sqlite3.connect(ruta)
+        self._conexion.execute("PRAGMA synchronous = NORMAL")
+
+    def _pendiente(self, usuario, anotar) -> None:
+        with self._lock:
+            anotar()
+            self._sucios.add(usuario)
+        self._volcar(self._conexion)
+
+    def cerrar(self) -> None:
+        self._conexion.close()
+        super().cerrar()
+
+
+def _peticiones(rng: random.Random, recetas: int) -> list:
+    """(método, url, argumentos de httpx, es_escritura) de la carga"""
+    peticiones = []
+    for _ in range(PETICIONES):
+        usuario = rng.randrange(USUARIOS)
+        tirada = rng.random()
+        receta = rng.randint(1, recetas)
+        if tirada < 0.4:
+            peticiones.append(("POST", f"/api/usuarios/{usuario}/favoritas",
+                               {"json": {"receta_id": receta}}, True))
+        elif tirada < 0.5:
+            peticiones.append(("DELETE", f"/api/usuarios/{usuario}/favoritas/{receta}", {}, True))
+        elif tirada < 0.7:
+            peticiones.append(("POST", "/api/agregar-a-carrito", {"json": {
+                "recetas_ids": rng.sample(range(1, recetas + 1), 6), "user_id": usuario,
+            }}, True))
+        elif tirada < 0.8:
+            # Favoritas fijas: el menú sale de la caché de respuestas y solo se mide guardarlo
+            preferencias = {**rng.choice(PREFERENCIAS), "presupuesto": rng.choice([40, 60, 80]),
+                            "favoritas": [1, 2, 3]}
+            peticiones.append(("POST", "/api/generar-menu",
+                               {"json": preferencias, "params": {"user_id": usuario}}, True))
+        elif tirada < 0.9:
+            peticiones.append(("GET", f"/api/usuarios/{usuario}/favoritas", {}, False))
+        else:
+            peticiones.append(("GET", f"/api/usuarios/{usuario}/menus", {}, False))
+    return peticiones
+
+
+async def _medir(aplicacion, peticiones: list) -> dict:
+    """
+    Lanza las peticiones a ritmo fijo (sin esperar a las anteriores) y mide
+    su latencia desde el instante en que tocaba lanzarlas
+    """
+    transporte = httpx.ASGITransport(app=aplicacion.app)
+    escrituras, lecturas, retrasos = [], [], []
+    errores = 0
+    terminado = False
+
+    async def temporizador():
+        while not terminado:
+            inicio = time.perf_counter()
+            await asyncio.sleep(TICK)
+            retrasos.append((time.perf_counter() - inicio - TICK) * 1000)
+
+    async def lanzar(cliente, previsto, metodo, url, argumentos, escritura):
+        nonlocal errores
+        respuesta = await cliente.request(metodo, url, **argumentos)
+        (escrituras if escritura else lecturas).append((time.perf_counter() - previsto) * 1000)
+        # Quitar una favorita que no lo era da 404: no es un error de la carga
+        errores += respuesta.status_code >= 400 and metodo != "DELETE"
+
+    limites = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench",
+                                 limits=limites) as cliente:
+        # Cada menú distinto se calcula una vez antes de medir
+        menus = {repr(argumentos["json"]): argumentos["json"]
+                 for _, url, argumentos, _ in peticiones if url == "/api/generar-menu"}
+        for preferencias in menus.values():
+            await cliente.post("/api/generar-menu", json=preferencias)
+        tarea = asyncio.create_task(temporizador())
+        inicio = time.perf_counter()
+        lanzadas = []
+        for i, peticion in enumerate(peticiones):
+            previsto = inicio + i / RITMO
+            espera = previsto - time.perf_counter()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            lanzadas.append(asyncio.create_task(lanzar(cliente, previsto, *peticion)))
+        await asyncio.gather(*lanzadas)
+        duracion = time.perf_counter() - inicio
+        terminado = True
+        await tarea
+    for tiempos in (escrituras, lecturas, retrasos):
+        tiempos.sort()
+    return {
+        "rps": len(peticiones) / duracion,
+        "escritura": (_percentil(escrituras, 0.5), _percentil(escrituras, 0.99)),
+        "lectura": (_percentil(lecturas, 0.5), _percentil(lecturas, 0.99)),
+        "retraso": (_percentil(retrasos, 0.99), retrasos[-1]),
+        "errores": errores,
+    }
+
+
+def _favoritas_en_disco(ruta: str) -> int:
+    conexion = sqlite3.connect(ruta)
+    try:
+        return conexion.execute("SELECT COUNT(*) FROM favoritas").fetchone()[0]
+    finally:
+        conexion.close()
+
+
+def main():
+    aplicacion = configurar_aplicacion(RECETAS, cache=True)
+    gc.freeze()  # como servidor.py tras precargar: el catálogo no entra en las recolecciones
+    peticiones = _peticiones(random.Random(0), RECETAS)
+    modos = [
+        ("directa", lambda ruta: AlmacenDirecto(ruta)),
+        ("diferida", lambda ruta: AlmacenUsuarios(ruta)),
+        ("diferida, LRU 500", lambda ruta: AlmacenUsuarios(ruta, max_usuarios=500)),
+    ]
+    print(f"{PETICIONES} peticiones de {USUARIOS} usuarios (80 % escrituras) a {RITMO} por "
+          f"segundo, catálogo de {RECETAS} recetas")
+    print(f"{'modo':<18} {'escr. p50/p99 (ms)':>19} {'lect. p50/p99 (ms)':>19} "
+          f"{'retraso bucle p99/máx (ms)':>27}   disco en el bucle / volcados / filas por volcado")
+    for nombre, crear in modos:
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, "usuarios.db")
+            aplicacion.usuarios = almacen = crear(ruta)
+            resultado = asyncio.run(_medir(aplicacion, peticiones))
+            en_memoria = sum(len(datos.favoritas) for datos in almacen._usuarios.values())
+            almacen.cerrar()
+            estadisticas = almacen.estadisticas()
+            # Todo lo escrito llega al disco (sin expulsiones, coincide con la memoria)
+            if nombre != "diferida, LRU 500":
+                assert _favoritas_en_disco(ruta) == en_memoria
+            assert resultado["errores"] == 0, resultado
+        filas = estadisticas["filas_escritas"] / max(estadisticas["volcados"], 1)
+        # La directa vuelca en el hilo del bucle; la diferida, en el suyo
+        en_bucle = estadisticas["segundos_volcando"] if nombre == "directa" else 0.0
+        print(f"{nombre:<18} "
+              f"{resultado['escritura'][0]:>9.2f}/{resultado['escritura'][1]:<9.2f} "
+              f"{resultado['lectura'][0]:>9.2f}/{resultado['lectura'][1]:<9.2f} "
+              f"{resultado['retraso'][0]:>13.2f}/{resultado['retraso'][1]:<13.2f}   "
+              f"{en_bucle:.2f} s / {estadisticas['volcados']} / {filas:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+Benchmark de carga de las rutas de la API, reproducible y comparable
+
+Crea catálogos sintéticos (1k, 10k y 100k recetas por defecto) y lanza
+peticiones con concurrencia fija a /api/generar-menu, /api/regenerar-receta,
+/api/agregar-a-carrito, /api/receta/{id}, /api/recetas-guardadas y
+/api/buscar, contra la
+aplicación en el mismo proceso (httpx sobre ASGI) y contra un uvicorn local.
+Cada combinación de tamaño y modo corre en un proceso nuevo, así que la
+memoria máxima es la suya. Las peticiones salen de una semilla fija y la
+caché de respuestas está desactivada (salvo con --cache).
+
+Uso:
+    python -m benchmarks.carga ejecutar --salida base.json
+    python -m benchmarks.carga ejecutar --recetas 10000 --modos proceso --salida nuevo.json
+    python -m benchmarks.carga comparar base.json nuevo.json --umbral 0.15
+
+`comparar` termina con código 1 si alguna ruta pierde más de `umbral` de
+peticiones por segundo o su p99 crece más de `umbral`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import httpx
+
+from benchmarks.bench_planificador import PREFERENCIAS, _percentil
+
+TAMANOS = [1_000, 10_000, 100_000]
+MODOS = ["proceso", "uvicorn"]
+RUTAS = [
+    "/api/generar-menu",
+    "/api/regenerar-receta",
+    "/api/agregar-a-carrito",
+    "/api/receta/{receta_id}",
+    "/api/recetas-guardadas",
+    "/api/buscar",
+    "/api/recomendaciones",
+]
+BUSQUEDAS = ["pollo", "calabacin", "ensalada cesar", "huevos champiñones", "pasta tomate",
+             "salmon", "lentejas verduras", "tortilla patatas"]
+PETICIONES = 400  # por ruta
+CALENTAMIENTO = 20  # por ruta, sin medir
+CONCURRENCIA = 16
+UMBRAL = 0.15
+
+
+# ==================== PETICIONES ====================
+
+def _preferencias(rng: random.Random) -> dict:
+    return {**rng.choice(PREFERENCIAS), "presupuesto": rng.randint(30, 120),
+            "num_personas": rng.choice([1, 2, 4])}
+
+
+async def _menus(cliente: httpx.AsyncClient, rng: random.Random) -> List[tuple]:
+    """Unos cuantos menús reales (preferencias, recetas) para regenerar y el carrito"""
+    menus = []
+    for _ in range(16):
+        preferencias = _preferencias(rng)
+        respuesta = await cliente.post("/api/generar-menu", json=preferencias)
+        if respuesta.status_code == 200:
+            menus.append((preferencias, respuesta.json()["menu"]["recetas"]))
+    if not menus:
+        raise RuntimeError("Ninguna preferencia produjo un menú")
+    return menus
+
+
+def _peticiones(ruta: str, n: int, recetas: int, menus: List[tuple], rng: random.Random) -> List[tuple]:
+    """(método, url, argumentos de httpx) de n peticiones deterministas a `ruta`"""
+    peticiones = []
+    for _ in range(n):
+        if ruta == "/api/generar-menu":
+            peticiones.append(("POST", ruta, {"json": _preferencias(rng)}))
+        elif ruta == "/api/regenerar-receta":
+            preferencias, menu = rng.choice(menus)
+            receta = rng.choice(menu)
+            peticiones.append(("POST", ruta, {"json": {
+                "dia": receta.get("dia", 1), "receta_id": receta["id"],
+                "menu": [r["id"] for r in menu], "preferencias": preferencias,
+                "alternativas": rng.choice([1, 5]),
+            }}))
+        elif ruta == "/api/agregar-a-carrito":
+            _, menu = rng.choice(menus)
+            peticiones.append(("POST", ruta, {"json": {
+                "recetas_ids": [r["id"] for r in menu],
+                "preferencia_marca": rng.choice(["marca_blanca", "otras"]),
+            }}))
+        elif ruta == "/api/receta/{receta_id}":
+            peticiones.append(("GET", f"/api/receta/{rng.randint(1, recetas)}", {}))
+        elif ruta == "/api/recetas-guardadas":
+            parametros = {"limite": rng.choice([20, 50, 100])}
+            if rng.random() < 0.5:
+                # Cursor de `_codificar_cursor` tras una receta cualquiera
+                parametros["cursor"] = _cursor(rng.randint(1, recetas))
+            if rng.random() < 0.3:
+                parametros["alergias"] = rng.choice(["gluten", "lactosa,huevo"])
+            peticiones.append(("GET", ruta, {"params": parametros}))
+        elif ruta == "/api/buscar":
+            parametros = {"q": rng.choice(BUSQUEDAS), "limite": rng.choice([10, 20])}
+            if rng.random() < 0.3:
+                parametros["productos"] = ",".join(str(p) for p in rng.sample(range(1, 46), 6))
+            if rng.random() < 0.3:
+                parametros["tipo_comida"] = rng.choice(["desayuno", "comida", "cena"])
+            peticiones.append(("GET", ruta, {"params": parametros}))
+        elif ruta == "/api/recomendaciones":
+            favoritas = rng.sample(range(1, recetas + 1), min(recetas, rng.randint(1, 8)))
+            parametros = {"recetas": ",".join(map(str, favoritas)), "limite": 10}
+            if rng.random() < 0.3:
+                parametros["tipo_comida"] = rng.choice(["desayuno", "comida", "cena"])
+            peticiones.append(("GET", ruta, {"params": parametros}))
+        else:
+            raise ValueError(f"Ruta desconocida: {ruta}")
+    return peticiones
+
+
+def _cursor(receta_id: int) -> str:
+    from main import _codificar_cursor
+    return _codificar_cursor(receta_id)
+
+
+async def _lanzar(cliente: httpx.AsyncClient, peticiones: List[tuple], concurrencia: int) -> dict:
+    """Lanza las peticiones con `concurrencia` clientes a la vez y resume latencias"""
+    tiempos, errores = [], 0
+    pendientes = iter(peticiones)
+
+    async def trabajador():
+        nonlocal errores
+        for metodo, url, argumentos in pendientes:
+            inicio = time.perf_counter()
+            respuesta = await cliente.request(metodo, url, **argumentos)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            errores += respuesta.status_code >= 400
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+    return {
+        "peticiones": len(tiempos),
+        "errores": errores,
+        "rps": round(len(tiempos) / duracion, 1),
+        "p50_ms": round(_percentil(tiempos, 0.5), 3),
+        "p99_ms": round(_percentil(tiempos, 0.99), 3),
+    }
+
+
+async def _medir_rutas(cliente: httpx.AsyncClient, recetas: int, args) -> List[dict]:
+    rng = random.Random(args.semilla)
+    menus = await _menus(cliente, rng)
+    resultados = []
+    for ruta in args.rutas:
+        calentamiento = _peticiones(ruta, CALENTAMIENTO, recetas, menus, rng)
+        await _lanzar(cliente, calentamiento, args.concurrencia)
+        peticiones = _peticiones(ruta, args.peticiones, recetas, menus, rng)
+        resultados.append({"ruta": ruta, **await _lanzar(cliente, peticiones, args.concurrencia)})
+    return resultados
+
+
+# ==================== MODOS ====================
+
+def _memoria_propia_mb() -> float:
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _memoria_proceso_mb(pid: int) -> Optional[float]:
+    """Memoria residente máxima (VmHWM) de otro proceso, o None fuera de Linux"""
+    try:
+        with open(f"/proc/{pid}/status") as estado:
+            for linea in estado:
+                if linea.startswith("VmHWM:"):
+                    return round(int(linea.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _en_proceso(args) -> None:
+    """Subproceso del modo `proceso`: escribe sus resultados en JSON por stdout"""
+    from benchmarks.sinteticos import configurar_aplicacion
+
+    inicio = time.perf_counter()
+    aplicacion = configurar_aplicacion(args.recetas, args.cache)
+    preparacion = time.perf_counter() - inicio
+
+    async def medir():
+        transporte = httpx.ASGITransport(app=aplicacion.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://carga") as cliente:
+            return await _medir_rutas(cliente, args.recetas, args)
+
+    rutas = asyncio.run(medir())
+    json.dump({"preparacion_s": round(preparacion, 2), "memoria_pico_mb": _memoria_propia_mb(),
+               "rutas": rutas}, sys.stdout)
+
+
+def _servidor(args) -> None:
+    """Subproceso del modo `uvicorn`: sirve la aplicación con el catálogo sintético"""
+    import uvicorn
+    from benchmarks.sinteticos import configurar_aplicacion
+
+    aplicacion = configurar_aplicacion(args.recetas, args.cache)
+    uvicorn.run(aplicacion.app, host="127.0.0.1", port=args.puerto,
+                log_level="warning", access_log=False)
+
+
+def _subproceso(orden: str, recetas: int, args, *extra: str) -> List[str]:
+    comando = [sys.executable, "-m", "benchmarks.carga", orden, "--recetas", str(recetas),
+               "--peticiones", str(args.peticiones), "--concurrencia", str(args.concurrencia),
+               "--semilla", str(args.semilla), "--rutas", ",".join(args.rutas), *extra]
+    return comando + (["--cache"] if args.cache else [])
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _medir_proceso(recetas: int, args) -> dict:
+    salida = subprocess.run(_subproceso("_proceso", recetas, args),
+                            check=True, capture_output=True, text=True)
+    return json.loads(salida.stdout)
+
+
+def _medir_uvicorn(recetas: int, args) -> dict:
+    puerto = _puerto_libre()
+    inicio = time.perf_counter()
+    servidor = subprocess.Popen(_subproceso("_servidor", recetas, args, "--puerto", str(puerto)))
+    try:
+        base = f"http://127.0.0.1:{puerto}"
+        while True:
+            if servidor.poll() is not None:
+                raise RuntimeError(f"uvicorn terminó con código {servidor.returncode}")
+            try:
+                httpx.get(f"{base}/api/hello", timeout=1.0)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        preparacion = time.perf_counter() - inicio
+
+        async def medir():
+            limites = httpx.Limits(max_connections=args.concurrencia)
+            async with httpx.AsyncClient(base_url=base, limits=limites, timeout=60.0) as cliente:
+                return await _medir_rutas(cliente, recetas, args)
+
+        rutas = asyncio.run(medir())
+        return {"preparacion_s": round(preparacion, 2),
+                "memoria_pico_mb": _memoria_proceso_mb(servidor.pid), "rutas": rutas}
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+
+def _ejecutar(args) -> None:
+    resultados = []
+    print(f"{'modo':<8} {'recetas':>8} {'ruta':<26} {'req/s':>8} {'p50 (ms)':>9} "
+          f"{'p99 (ms)':>9} {'errores':>8} {'memoria (MB)':>13}")
+    for recetas in args.recetas:
+        for modo in args.modos:
+            medicion = (_medir_proceso if modo == "proceso" else _medir_uvicorn)(recetas, args)
+            for ruta in medicion["rutas"]:
+                resultados.append({"modo": modo, "recetas": recetas,
+                                   "memoria_pico_mb": medicion["memoria_pico_mb"],
+                                   "preparacion_s": medicion["preparacion_s"], **ruta})
+                print(f"{modo:<8} {recetas:>8} {ruta['ruta']:<26} {ruta['rps']:>8.0f} "
+                      f"{ruta['p50_ms']:>9.2f} {ruta['p99_ms']:>9.2f} {ruta['errores']:>8} "
+                      f"{medicion['memoria_pico_mb'] or 0:>13.0f}")
+
+    informe = {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "peticiones": args.peticiones,
+        "concurrencia": args.concurrencia,
+        "semilla": args.semilla,
+        "cache": args.cache,
+        "resultados": resultados,
+    }
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+        print(f"Resultados en {args.salida}")
+
+
+# ==================== COMPARACIÓN ====================
+
+def comparar(base: dict, nuevo: dict, umbral: float) -> List[str]:
+    """
+    Regresiones de `nuevo` frente a `base`: rutas con menos de (1 - umbral)
+    veces sus peticiones por segundo o más de (1 + umbral) veces su p99
+    """
+    anteriores = {(r["modo"], r["recetas"], r["ruta"]): r for r in base["resultados"]}
+    regresiones = []
+    print(f"{'modo':<8} {'recetas':>8} {'ruta':<26} {'req/s':>16} {'p99 (ms)':>20}")
+    for r in nuevo["resultados"]:
+        anterior = anteriores.get((r["modo"], r["recetas"], r["ruta"]))
+        if anterior is None:
+            continue
+        rps = r["rps"] / anterior["rps"] - 1
+        p99 = r["p99_ms"] / anterior["p99_ms"] - 1
+        marca = ""
+        if rps < -umbral or p99 > umbral:
+            marca = "  REGRESIÓN"
+            regresiones.append(f"{r['modo']} {r['recetas']} {r['ruta']}: "
+                               f"req/s {rps:+.0%}, p99 {p99:+.0%}")
+        print(f"{r['modo']:<8} {r['recetas']:>8} {r['ruta']:<26} "
+              f"{r['rps']:>8.0f} ({rps:+5.0%}) {r['p99_ms']:>11.2f} ({p99:+5.0%}){marca}")
+    return regresiones
+
+
+def _comparar(args) -> None:
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.nuevo, encoding="utf-8") as f:
+        nuevo = json.load(f)
+    regresiones = comparar(base, nuevo, args.umbral)
+    if regresiones:
+        print(f"{len(regresiones)} regresiones por encima del {args.umbral:.0%}")
+        sys.exit(1)
+    print(f"Sin regresiones por encima del {args.umbral:.0%}")
+
+
+# ==================== LÍNEA DE ÓRDENES ====================
+
+def _lista(tipo):
+    return lambda texto: [tipo(x) for x in texto.split(",") if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga de las rutas de la API")
+    ordenes = parser.add_subparsers(dest="orden", required=True)
+
+    def opciones_carga(orden):
+        orden.add_argument("--peticiones", type=int, default=PETICIONES, help="peticiones por ruta")
+        orden.add_argument("--concurrencia", type=int, default=CONCURRENCIA)
+        orden.add_argument("--semilla", type=int, default=0)
+        orden.add_argument("--rutas", type=_lista(str), default=RUTAS)
+        orden.add_argument("--cache", action="store_true", help="activa la caché de respuestas")
+
+    ejecutar = ordenes.add_parser("ejecutar", help="mide y guarda los resultados")
+    ejecutar.add_argument("--recetas", type=_lista(int), default=TAMANOS)
+    ejecutar.add_argument("--modos", type=_lista(str), default=MODOS)
+    ejecutar.add_argument("--salida", help="archivo JSON de resultados")
+    opciones_carga(ejecutar)
+
+    comparar_orden = ordenes.add_parser("comparar", help="compara dos resultados")
+    comparar_orden.add_argument("base")
+    comparar_orden.add_argument("nuevo")
+    comparar_orden.add_argument("--umbral", type=float, default=UMBRAL)
+
+    # Órdenes internas: cada medición corre en su propio proceso
+    for interna in ("_proceso", "_servidor"):
+        orden = ordenes.add_parser(interna)
+        orden.add_argument("--recetas", type=int, required=True)
+        orden.add_argument("--puerto", type=int)
+        opciones_carga(orden)
+
+    args = parser.parse_args()
+    if args.orden == "ejecutar":
+        desconocidos = set(args.modos) - set(MODOS)
+        if desconocidos:
+            parser.error(f"Modos desconocidos: {', '.join(sorted(desconocidos))}")
+        _ejecutar(args)
+    elif args.orden == "comparar":
+        _comparar(args)
+    elif args.orden == "_proceso":
+        _en_proceso(args)
+    else:
+        _servidor(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Generador de catálogos sintéticos a partir de las recetas de ejemplo
+"""
+
+import random
+from typing import Iterator, List
+
+import main as aplicacion
+from busqueda import IndiceBusqueda
+from cache import CacheRespuestas
+from carrito import AgregadorCarrito
+from catalogo import CatalogoRecetas
+from fragmentos import FragmentosRecetas
+from lotes import GeneradorLotes
+from main import RECETAS_EJEMPLO
+from planificador import PlanificadorMenus
+from precios import PreciosProductos
+from recomendaciones import Recomendador
+from repositorio import RepositorioMemoria
+from resumenes import ResumenesRecetas
+from usuarios import AlmacenUsuarios
+
+
+def generar_recetas(n: int, semilla: int = 0) -> List[dict]:
+    """Genera n recetas variando las de ejemplo (ids 1..n, deterministas)"""
+    return list(iterar_recetas(n, semilla))
+
+
+def iterar_recetas(n: int, semilla: int = 0) -> Iterator[dict]:
+    """Las mismas recetas que generar_recetas, de una en una, sin tenerlas todas en memoria"""
+    rng = random.Random(semilla)
+    for i in range(n):
+        base = RECETAS_EJEMPLO[i % len(RECETAS_EJEMPLO)]
+        factor = rng.uniform(0.6, 1.6)
+        yield {
+            **base,
+            "id": i + 1,
+            "nombre": f"{base['nombre']} #{i + 1}",
+            "tiempo_preparacion": max(5, int(base["tiempo_preparacion"] * rng.uniform(0.5, 1.5))),
+            "calorias": int(base["calorias"] * factor),
+            "ingredientes": [
+                {**ing, "precio": round(ing["precio"] * factor, 2)}
+                for ing in base["ingredientes"]
+            ],
+        }
+
+
+def configurar_aplicacion(n: int, cache: bool = False):
+    """
+    Sustituye el estado global de main por un catálogo sintético de n recetas
+    con sus estructuras ya construidas; sin `cache` la caché de respuestas
+    no guarda nada, para que cada petición haga su trabajo completo
+    """
+    catalogo = CatalogoRecetas(generar_recetas(n))
+    resumenes = ResumenesRecetas(catalogo)
+    fragmentos = FragmentosRecetas(catalogo) if aplicacion.fragmentos is not None else None
+    recomendador = Recomendador(catalogo, resumenes)
+    planificador = PlanificadorMenus(catalogo, resumenes, recomendador)
+    busqueda = IndiceBusqueda(catalogo, resumenes)
+    aplicacion.catalogo = catalogo
+    aplicacion.resumenes = resumenes
+    aplicacion.fragmentos = fragmentos
+    aplicacion.repositorio = RepositorioMemoria(catalogo, resumenes, fragmentos)
+    aplicacion.planificador = planificador
+    aplicacion.busqueda = busqueda
+    aplicacion.recomendador = recomendador
+    aplicacion.agregador_carrito = AgregadorCarrito(catalogo, aplicacion.productos)
+    aplicacion.precios = PreciosProductos(catalogo, aplicacion.productos)
+    aplicacion.generador_lotes = GeneradorLotes(planificador)
+    aplicacion.servicio_generacion = None
+    aplicacion.usuarios = AlmacenUsuarios()  # solo en memoria
+    aplicacion.usuarios.seguir_catalogo(catalogo, aplicacion._recalcular_carrito,
+                                        aplicacion._recalcular_menu)
+    aplicacion.cache_respuestas = CacheRespuestas(max_entradas=2048 if cache else 0,
+                                                  max_bytes=128 * 1024 * 1024, ttl=600)
+    catalogo.suscribir(aplicacion.cache_respuestas.invalidar)
+    for derivado in (planificador, aplicacion.agregador_carrito, fragmentos, busqueda, recomendador,
+                     aplicacion.precios):
+        if derivado is not None:
+            derivado.datos()
+    return aplicacion
@@ -0,0 +1,302 @@
+"""
+SUPERMERCAI - Búsqueda de recetas
+Índice invertido sobre nombre, descripción e ingredientes, sin tildes ni plurales
+"""
+
+import math
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from almacen import AUSENTE, AlmacenRecetas
+from catalogo import CatalogoRecetas, DerivadoCatalogo
+from metricas import tramo
+from resumenes import ResumenesRecetas
+from texto import normalizar
+
+# Peso de una aparición según el campo; el nombre pesa más que la descripción
+PESO_NOMBRE = 3.0
+PESO_INGREDIENTE = 2.0
+PESO_DESCRIPCION = 1.0
+K1 = 1.2  # saturación de BM25: repetir un término suma cada vez menos
+
+PALABRAS_VACIAS = frozenset((
+    "a", "al", "con", "de", "del", "e", "el", "en", "la", "las", "lo", "los", "o",
+    "para", "por", "su", "sus", "u", "un", "una", "unas", "unos", "y",
+))
+
+_PALABRA = re.compile(r"[a-z0-9]+")
+
+
+# ==================== TOKENIZACIÓN ====================
+
+def raiz(palabra: str) -> str:
+    """
+    Quita la -s y después la -e finales, para que singular y plural coincidan
+    ("tomates" y "tomate" -> "tomat", "limones" y "limón" -> "limon")
+    """
+    if len(palabra) > 3 and palabra.endswith("s"):
+        palabra = palabra[:-1]
+    if len(palabra) > 3 and palabra.endswith("e"):
+        palabra = palabra[:-1]
+    return palabra
+
+
+def tokenizar(texto: Optional[str]) -> List[str]:
+    """Términos de un texto: minúsculas, sin tildes, sin palabras vacías ni números"""
+    if not texto:
+        return []
+    return [
+        raiz(palabra) for palabra in _PALABRA.findall(normalizar(texto))
+        if palabra not in PALABRAS_VACIAS and not palabra.isdigit()
+    ]
+
+
+def _saturar(peso: float) -> float:
+    return peso * (K1 + 1) / (peso + K1)
+
+
+class _Terminos:
+    """Términos de cada receta del almacén, con los de los textos repetidos ya calculados"""
+
+    def __init__(self, almacen: AlmacenRecetas):
+        self.almacen = almacen
+        self._cadenas: Dict[int, List[str]] = {}
+        self._textos: Dict[int, List[str]] = {}
+
+    def de(self, posicion: int) -> Dict[str, float]:
+        """Término -> peso saturado en la receta de una posición"""
+        almacen = self.almacen
+        pesos: Dict[str, float] = {}
+        for termino in tokenizar(almacen.nombre[posicion]):
+            pesos[termino] = pesos.get(termino, 0.0) + PESO_NOMBRE
+        descripcion = int(almacen.descripcion.datos[posicion])
+        if descripcion != AUSENTE:
+            terminos = self._textos.get(descripcion)
+            if terminos is None:
+                terminos = self._textos[descripcion] = tokenizar(almacen.textos[descripcion])
+            for termino in terminos:
+                pesos[termino] = pesos.get(termino, 0.0) + PESO_DESCRIPCION
+        for nombre in almacen.ing_nombre.datos[almacen.filas(posicion)].tolist():
+            terminos = self._cadenas.get(nombre)
+            if terminos is None:
+                terminos = self._cadenas[nombre] = tokenizar(almacen.cadenas[nombre])
+            for termino in terminos:
+                pesos[termino] = pesos.get(termino, 0.0) + PESO_INGREDIENTE
+        return {termino: _saturar(peso) for termino, peso in pesos.items()}
+
+
+# ==================== ÍNDICE INVERTIDO ====================
+
+class TablaBusqueda:
+    """
+    Índice invertido: término -> posiciones ordenadas y pesos
+
+    Las listas de cada término están concatenadas (las del término t son
+    posiciones[desfases[t]:desfases[t + 1]]); las que cambian después de
+    construir la tabla se guardan aparte en `cambiadas`. Los términos de
+    cada receta se guardan también por posición (filas fila_inicio[i]:
+    fila_inicio[i] + fila_longitud[i] de fila_termino), para quitarla de
+    sus listas al parchearla; las filas nuevas se añaden al final y las
+    antiguas quedan sin uso, como en la tabla del carrito.
+    """
+
+    # Arrays de la tabla, en el orden en que se guardan
+    COLUMNAS = ("desfases", "posiciones", "pesos", "fila_inicio", "fila_longitud",
+                "fila_termino", "num_productos")
+
+    def __init__(self, almacen: AlmacenRecetas):
+        self.vocabulario: Dict[str, int] = {}
+        self.cambiadas: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        terminos = _Terminos(almacen)
+        n = len(almacen)
+        ids_termino, pesos, longitudes = [], [], []
+        for posicion in range(n):
+            de_receta = terminos.de(posicion)
+            ids_termino.extend(self._id(termino) for termino in de_receta)
+            pesos.extend(de_receta.values())
+            longitudes.append(len(de_receta))
+
+        self.fila_termino = np.asarray(ids_termino, dtype=np.int32)
+        self.fila_longitud = np.asarray(longitudes, dtype=np.int32)
+        self.fila_inicio = np.zeros(n, dtype=np.int64)
+        np.cumsum(self.fila_longitud[:-1], out=self.fila_inicio[1:])
+        fila_posicion = np.repeat(np.arange(n, dtype=np.int32), self.fila_longitud)
+        # Estable: dentro de cada término las posiciones quedan en orden
+        orden = np.argsort(self.fila_termino, kind="stable")
+        self.posiciones = fila_posicion[orden]
+        self.pesos = np.asarray(pesos, dtype=np.float32)[orden]
+        self.desfases = np.zeros(len(self.vocabulario) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.fila_termino, minlength=len(self.vocabulario)),
+                  out=self.desfases[1:])
+        self.num_productos = _productos_distintos(almacen)
+
+    @classmethod
+    def desde_columnas(cls, columnas: Dict[str, np.ndarray],
+                       vocabulario: Iterable[str]) -> "TablaBusqueda":
+        """Tabla sobre arrays ya calculados (p. ej. mapeados de una instantánea)"""
+        tabla = cls.__new__(cls)
+        for nombre in cls.COLUMNAS:
+            setattr(tabla, nombre, columnas[nombre])
+        tabla.vocabulario = {termino: i for i, termino in enumerate(vocabulario)}
+        tabla.cambiadas = {}
+        return tabla
+
+    def __len__(self) -> int:
+        return len(self.fila_inicio)
+
+    def _id(self, termino: str) -> int:
+        i = self.vocabulario.get(termino)
+        if i is None:
+            i = self.vocabulario[termino] = len(self.vocabulario)
+        return i
+
+    def lista(self, termino: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Posiciones y pesos de un término"""
+        cambiada = self.cambiadas.get(termino)
+        if cambiada is not None:
+            return cambiada
+        if termino + 1 >= len(self.desfases):
+            return np.empty(0, np.int32), np.empty(0, np.float32)
+        inicio, fin = int(self.desfases[termino]), int(self.desfases[termino + 1])
+        return self.posiciones[inicio:fin], self.pesos[inicio:fin]
+
+    def actualizar(self, posicion: int, terminos: Dict[str, float], num_productos: int) -> None:
+        """Sustituye los términos de una posición; una posición nueva amplía la tabla"""
+        if posicion >= len(self):
+            extra = posicion + 1 - len(self)
+            self.fila_inicio = np.concatenate([self.fila_inicio, np.zeros(extra, np.int64)])
+            self.fila_longitud = np.concatenate([self.fila_longitud, np.zeros(extra, np.int32)])
+            self.num_productos = np.concatenate([self.num_productos, np.zeros(extra, np.int32)])
+
+        inicio = int(self.fila_inicio[posicion])
+        for termino in self.fila_termino[inicio:inicio + int(self.fila_longitud[posicion])].tolist():
+            posiciones, pesos = self.lista(termino)
+            i = int(np.searchsorted(posiciones, posicion))
+            self.cambiadas[termino] = (np.delete(posiciones, i), np.delete(pesos, i))
+
+        ids = np.asarray([self._id(termino) for termino in terminos], dtype=np.int32)
+        for termino, peso in zip(ids.tolist(), terminos.values()):
+            posiciones, pesos = self.lista(termino)
+            i = int(np.searchsorted(posiciones, posicion))
+            self.cambiadas[termino] = (np.insert(posiciones, i, posicion),
+                                       np.insert(pesos, i, peso))
+        self.fila_inicio[posicion] = len(self.fila_termino)
+        self.fila_longitud[posicion] = len(ids)
+        self.fila_termino = np.concatenate([self.fila_termino, ids])
+        self.num_productos[posicion] = num_productos
+
+    def puntuar(self, terminos: List[str]) -> Optional[np.ndarray]:
+        """
+        Relevancia BM25 de cada posición para los términos de la consulta,
+        multiplicada por la fracción de términos que contiene (0 = ninguno);
+        None si ningún término está en el índice
+        """
+        ids = [self.vocabulario[t] for t in dict.fromkeys(terminos) if t in self.vocabulario]
+        if not ids:
+            return None
+        n = len(self)
+        listas = [self.lista(termino) for termino in ids]
+        posiciones = np.concatenate([p for p, _ in listas])
+        pesos = np.concatenate([
+            w * math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for p, w in listas
+        ])
+        relevancia = np.bincount(posiciones, weights=pesos, minlength=n)
+        coincidencias = np.bincount(posiciones, minlength=n)
+        return relevancia * coincidencias / len(set(terminos))
+
+
+def _productos_distintos(almacen: AlmacenRecetas) -> np.ndarray:
+    """Número de producto_id distintos de cada receta"""
+    longitudes = almacen.ing_longitud.vista()
+    posiciones = np.repeat(np.arange(len(almacen), dtype=np.int64), longitudes)
+    filas = np.repeat(almacen.ing_inicio.vista(), longitudes) + (
+        np.arange(len(posiciones)) - np.repeat(np.cumsum(longitudes) - longitudes, longitudes)
+    )
+    pares = np.unique(np.stack([posiciones, almacen.ing_producto.datos[filas]]), axis=1)
+    return np.bincount(pares[0], minlength=len(almacen)).astype(np.int32)
+
+
+# ==================== BUSCADOR ====================
+
+class IndiceBusqueda(DerivadoCatalogo):
+    """
+    Búsqueda por texto y por productos sobre el catálogo
+
+    El índice se construye en el primer acceso y cada cambio suelto del
+    catálogo vuelve a indexar solo las recetas afectadas. Las búsquedas por
+    producto usan el índice de productos del propio catálogo.
+    """
+
+    def __init__(self, catalogo: CatalogoRecetas, resumenes: ResumenesRecetas):
+        self.resumenes = resumenes
+        super().__init__(catalogo)
+
+    def _construir(self) -> TablaBusqueda:
+        return TablaBusqueda(self.catalogo.todas())
+
+    def _parchear(self, tabla: TablaBusqueda, posiciones: List[int]) -> None:
+        almacen = self.catalogo.todas()
+        terminos = _Terminos(almacen)
+        for posicion in posiciones:
+            tabla.actualizar(posicion, terminos.de(posicion), len(almacen.productos(posicion)))
+
+    def _parchear_precios(self, tabla: TablaBusqueda, posiciones: List[int]) -> None:
+        pass  # los precios no intervienen en el índice
+
+    def buscar(self, consulta: str = "", productos_ids: Iterable[int] = (),
+               tipo_comida: Optional[str] = None, excluidos: int = 0,
+               limite: int = 20) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Posiciones de las `limite` recetas más relevantes, sus puntuaciones
+        y el número total de recetas que encajan
+
+        Con `consulta`, cuenta la relevancia del texto; con `productos_ids`,
+        la fracción de los productos de la receta que están entre ellos
+        ("lo que hay en la nevera"). Con las dos, se multiplican. Las
+        recetas que no encajan con alguna de las dos no aparecen.
+        """
+        with tramo("busqueda.puntuar"):
+            tabla = self.datos()
+            puntuacion = None
+            if consulta:
+                puntuacion = tabla.puntuar(tokenizar(consulta))
+                if puntuacion is None:
+                    return np.empty(0, np.int64), np.empty(0), 0
+            productos_ids = list(dict.fromkeys(productos_ids))
+            if productos_ids:
+                listas = [self.catalogo.posiciones_producto(p) for p in productos_ids]
+                usados = np.bincount(np.concatenate(listas), minlength=len(tabla))
+                cobertura = usados / np.maximum(tabla.num_productos, 1)
+                puntuacion = cobertura if puntuacion is None else puntuacion * cobertura
+            if puntuacion is None:
+                return np.empty(0, np.int64), np.empty(0), 0
+
+            candidatas = np.flatnonzero(puntuacion)
+            if excluidos:
+                candidatas = candidatas[self.resumenes.tabla().compatibles(excluidos)[candidatas]]
+            if tipo_comida is not None:
+                del_tipo = self.catalogo.posiciones_tipo(tipo_comida)
+                candidatas = candidatas[np.isin(candidatas, del_tipo, assume_unique=True)]
+
+        with tramo("busqueda.ordenar"):
+            elegidas = mejores(candidatas, puntuacion, limite)
+        return elegidas, puntuacion[elegidas], len(candidatas)
+
+
+def mejores(candidatas: np.ndarray, puntuacion: np.ndarray, limite: int) -> np.ndarray:
+    """
+    Las `limite` candidatas de mayor puntuación, de mayor a menor; a
+    igualdad, en orden de carga (`candidatas` va en orden de posición)
+    """
+    elegidas = candidatas
+    if len(candidatas) > limite:
+        # Las que superan la puntuación de corte y, de las empatadas en el
+        # corte, las primeras
+        valores = puntuacion[candidatas]
+        corte = np.partition(valores, len(valores) - limite)[len(valores) - limite]
+        superan = candidatas[valores > corte]
+        empatadas = candidatas[valores == corte][:limite - len(superan)]
+        elegidas = np.concatenate([superan, empatadas])
+    return elegidas[np.lexsort((elegidas, -puntuacion[elegidas]))]
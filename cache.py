@@ -0,0 +1,282 @@
+"""
+SUPERMERCAI - Caché de respuestas JSON ya codificadas
+LRU con caducidad, límites de tamaño y ETags fuertes
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Iterable, Optional
+
+import numpy as np
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # sin orjson se codifica con el módulo json
+    orjson = None
+
+
+# ==================== CODIFICACIÓN ====================
+
+class Fragmento(bytes):
+    """JSON ya codificado que se inserta tal cual en la respuesta"""
+
+    __slots__ = ()
+
+
+class Ensamblado(dict):
+    """
+    Diccionario de respuesta cuyos valores pueden ser fragmentos, listas de
+    fragmentos u otros ensamblados; el resto se codifica normalmente
+    """
+
+
+def _json_stdlib(contenido) -> bytes:
+    return json.dumps(
+        jsonable_encoder(contenido),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+if orjson is not None:
+    _OPCIONES_ORJSON = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def _json_orjson(contenido) -> bytes:
+        # Modelos de pydantic y demás tipos que orjson no conoce
+        return orjson.dumps(contenido, default=jsonable_encoder, option=_OPCIONES_ORJSON)
+
+    _json = _json_orjson
+else:
+    _json = _json_stdlib
+
+
+def codificar_json(contenido) -> bytes:
+    """
+    Codifica en JSON compacto y UTF-8 (con orjson si está instalado)
+
+    Los Fragmento se copian sin volver a codificarlos y los Ensamblado se
+    unen por piezas.
+    """
+    if isinstance(contenido, Fragmento):
+        return bytes(contenido)
+    if isinstance(contenido, Ensamblado):
+        return _ensamblar(contenido)
+    return _json(contenido)
+
+
+def _ensamblar(contenido: Ensamblado) -> bytes:
+    piezas = []
+    for clave, valor in contenido.items():
+        if isinstance(valor, list) and valor and all(isinstance(v, Fragmento) for v in valor):
+            codificado = b"[" + b",".join(valor) + b"]"
+        else:
+            codificado = codificar_json(valor)
+        piezas.append(_json(clave) + b":" + codificado)
+    return b"{" + b",".join(piezas) + b"}"
+
+
+class RespuestaJSON(JSONResponse):
+    """
+    JSONResponse que codifica con codificar_json
+
+    Devolverla directamente desde una ruta evita además el paso por
+    jsonable_encoder que FastAPI aplica a los diccionarios.
+    """
+
+    def render(self, content) -> bytes:
+        return codificar_json(content)
+
+
+def clave_preferencias(preferencias: dict) -> str:
+    """Hash canónico de unas preferencias (el orden de las alergias no importa)"""
+    canonicas = dict(preferencias)
+    canonicas["alergias"] = sorted(a.strip().lower() for a in canonicas.get("alergias") or [])
+    texto = json.dumps(canonicas, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class Anotado:
+    """
+    Contenido que devuelve una construcción junto con las posiciones del
+    catálogo de las recetas que incluye y, opcionalmente, datos que la ruta
+    quiere conservar con la entrada sin volver a leer el cuerpo
+
+    Con las posiciones la entrada sobrevive a los cambios solo de precios
+    que no tocan esas recetas; sin ellas (None) se descarta con cualquier
+    cambio.
+    """
+
+    __slots__ = ("contenido", "posiciones", "datos")
+
+    def __init__(self, contenido, posiciones: Optional[Iterable[int]] = None, datos=None):
+        self.contenido = contenido
+        self.posiciones = posiciones
+        self.datos = datos
+
+
+class EntradaCache:
+    """Cuerpo JSON codificado, su ETag, las posiciones de las recetas que incluye y sus datos"""
+
+    __slots__ = ("cuerpo", "etag", "caduca", "posiciones", "datos")
+
+    def __init__(self, cuerpo: bytes, caduca: float, posiciones: Optional[np.ndarray] = None,
+                 datos=None):
+        self.cuerpo = cuerpo
+        self.etag = '"' + hashlib.sha256(cuerpo).hexdigest()[:32] + '"'
+        self.caduca = caduca
+        self.posiciones = posiciones
+        self.datos = datos
+
+
+class CacheRespuestas:
+    """
+    Caché LRU de respuestas codificadas
+
+    Se limita por número de entradas y por bytes totales; las entradas
+    caducan a los `ttl` segundos. Los contadores de aciertos, fallos y
+    expulsiones permiten dimensionarla con tráfico real.
+
+    Se suscribe a los cambios del catálogo: un cambio solo de precios quita
+    las entradas con alguna de las recetas afectadas y cualquier otro la
+    vacía. Lo construido mientras llegaba un cambio no se guarda.
+    """
+
+    def __init__(self, max_entradas: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: float = 600.0):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entradas: "OrderedDict[Hashable, EntradaCache]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._generacion = 0  # aumenta con cada cambio del catálogo
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    def obtener(self, clave: Hashable) -> Optional[EntradaCache]:
+        """Entrada vigente para la clave, o None"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada.caduca <= time.monotonic():
+                if entrada is not None:
+                    self._quitar(clave)
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada
+
+    def guardar(self, clave: Hashable, cuerpo: bytes, posiciones: Optional[Iterable[int]] = None,
+                generacion: Optional[int] = None, datos=None) -> EntradaCache:
+        """
+        Guarda un cuerpo codificado y expulsa las entradas menos usadas
+
+        Con `generacion` no se guarda si el catálogo ha cambiado desde entonces.
+        """
+        if posiciones is not None:
+            posiciones = np.asarray(posiciones, dtype=np.int64)
+        entrada = EntradaCache(cuerpo, time.monotonic() + self.ttl, posiciones, datos)
+        if len(cuerpo) > self.max_bytes:
+            return entrada  # demasiado grande para guardarla
+        with self._lock:
+            if generacion is not None and generacion != self._generacion:
+                return entrada
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = entrada
+            self._bytes += len(cuerpo)
+            while len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes:
+                antigua = next(iter(self._entradas))
+                self._quitar(antigua)
+                self.expulsiones += 1
+        return entrada
+
+    def obtener_o_crear(self, clave: Hashable, construir: Callable[[], object]) -> EntradaCache:
+        """
+        Entrada cacheada o, si no existe, la construye, codifica y guarda
+
+        `construir` puede devolver un Anotado con las recetas que incluye.
+        """
+        entrada = self.obtener(clave)
+        if entrada is None:
+            generacion = self._generacion
+            entrada = self._guardar_contenido(clave, construir(), generacion)
+        return entrada
+
+    async def obtener_o_crear_async(self, clave: Hashable,
+                                    construir: Callable[[], Awaitable[object]]) -> EntradaCache:
+        """Como obtener_o_crear, para construcciones que consultan el repositorio"""
+        entrada = self.obtener(clave)
+        if entrada is None:
+            generacion = self._generacion
+            entrada = self._guardar_contenido(clave, await construir(), generacion)
+        return entrada
+
+    def _guardar_contenido(self, clave: Hashable, contenido, generacion: int) -> EntradaCache:
+        if not isinstance(contenido, Anotado):
+            return self.guardar(clave, codificar_json(contenido), generacion=generacion)
+        return self.guardar(clave, codificar_json(contenido.contenido), contenido.posiciones,
+                            generacion, contenido.datos)
+
+    def invalidar(self, version: Optional[int] = None, posiciones: Optional[Iterable[int]] = None,
+                  solo_precios: bool = False) -> None:
+        """
+        Quita lo que deja de valer tras un cambio del catálogo (se suscribe a él)
+
+        Con un cambio solo de precios se quitan las entradas que incluyen
+        alguna de las `posiciones` o no indican sus recetas; si no, todas.
+        """
+        with self._lock:
+            self._generacion += 1
+            if not solo_precios or posiciones is None:
+                self._entradas.clear()
+                self._bytes = 0
+                return
+            cambiadas = np.asarray(posiciones, dtype=np.int64)
+            if not len(cambiadas):
+                return
+            marcadas = np.zeros(int(cambiadas.max()) + 1, dtype=bool)
+            marcadas[cambiadas] = True
+            for clave, entrada in list(self._entradas.items()):
+                incluidas = entrada.posiciones
+                if incluidas is None or marcadas[incluidas[incluidas < len(marcadas)]].any():
+                    self._quitar(clave)
+
+    def _quitar(self, clave: Hashable) -> None:
+        entrada = self._entradas.pop(clave)
+        self._bytes -= len(entrada.cuerpo)
+
+    def estadisticas(self) -> dict:
+        """Contadores de uso y ocupación actual"""
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._entradas),
+            "bytes": self._bytes,
+            "max_entradas": self.max_entradas,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "expulsiones": self.expulsiones,
+            "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+        }
+
+
+def respuesta_cacheada(request: Request, entrada: EntradaCache) -> Response:
+    """Respuesta con ETag, o 304 si el cliente ya tiene esa versión"""
+    cabeceras = {"ETag": entrada.etag}
+    etags_cliente = request.headers.get("if-none-match")
+    if etags_cliente:
+        etags = {etag.strip().removeprefix("W/") for etag in etags_cliente.split(",")}
+        if entrada.etag in etags or "*" in etags:
+            return Response(status_code=304, headers=cabeceras)
+    return Response(content=entrada.cuerpo, media_type="application/json", headers=cabeceras)
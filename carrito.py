@@ -0,0 +1,244 @@
+"""
+SUPERMERCAI - Agregación del carrito de la compra
+Tabla columnar de ingredientes y reducción agrupada con NumPy
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from catalogo import CatalogoRecetas, DerivadoCatalogo
+from metricas import tramo
+from productos import CatalogoProductos
+from unidades import normalizar_cantidad
+
+
+# ==================== TABLA DE INGREDIENTES ====================
+
+class TablaIngredientes:
+    """
+    Ingredientes de todas las recetas aplanados en columnas
+
+    Las filas de cada receta son contiguas: la receta en la posición i ocupa
+    las filas inicio[i]:inicio[i] + longitud[i]. Cada fila pertenece a una
+    línea de carrito, identificada por (producto_id, unidad canónica), de
+    modo que nunca se suman gramos con unidades del mismo producto.
+    """
+
+    def __init__(self, recetas: Iterable[dict]):
+        self.posiciones: Dict[int, int] = {}
+        self._lineas: Dict[Tuple[int, str], int] = {}
+        self.lineas_producto: List[int] = []
+        self.lineas_nombre: List[str] = []
+        self.lineas_unidad: List[str] = []
+
+        receta_ids, inicios, longitudes = [], [], []
+        linea_col, cantidad_col, precio_col = [], [], []
+
+        for receta in recetas:
+            self.posiciones[receta["id"]] = len(receta_ids)
+            receta_ids.append(receta["id"])
+            inicios.append(len(linea_col))
+            longitudes.append(len(receta["ingredientes"]))
+            for linea, cantidad, precio in self._filas_receta(receta):
+                linea_col.append(linea)
+                cantidad_col.append(cantidad)
+                precio_col.append(precio)
+
+        self.receta_id = np.asarray(receta_ids, dtype=np.int64)
+        self.inicio = np.asarray(inicios, dtype=np.int64)
+        self.longitud = np.asarray(longitudes, dtype=np.int64)
+        self.linea = np.asarray(linea_col, dtype=np.int32)
+        self.cantidad = np.asarray(cantidad_col, dtype=np.float64)
+        self.precio = np.asarray(precio_col, dtype=np.float64)
+
+    # Arrays de la tabla, en el orden en que se guardan
+    COLUMNAS = ("receta_id", "inicio", "longitud", "linea", "cantidad", "precio")
+
+    @classmethod
+    def desde_columnas(cls, columnas: Dict[str, np.ndarray], posiciones,
+                       lineas: List[Tuple[int, str, str]]) -> "TablaIngredientes":
+        """
+        Tabla sobre arrays ya calculados (p. ej. mapeados de una instantánea);
+        `lineas` son los (producto_id, nombre, unidad) de cada línea
+        """
+        tabla = cls.__new__(cls)
+        for nombre in cls.COLUMNAS:
+            setattr(tabla, nombre, columnas[nombre])
+        tabla.posiciones = posiciones
+        tabla.lineas_producto = [producto for producto, _, _ in lineas]
+        tabla.lineas_nombre = [nombre for _, nombre, _ in lineas]
+        tabla.lineas_unidad = [unidad for _, _, unidad in lineas]
+        tabla._lineas = {(producto, unidad): linea
+                         for linea, (producto, _, unidad) in enumerate(lineas)}
+        return tabla
+
+    def _filas_receta(self, receta: dict) -> List[Tuple[int, float, float]]:
+        """(línea, cantidad normalizada, precio) de cada ingrediente"""
+        filas = []
+        for ing in receta["ingredientes"]:
+            cantidad, unidad = normalizar_cantidad(ing["cantidad"], ing["unidad"])
+            clave = (ing["producto_id"], unidad)
+            if clave not in self._lineas:
+                self._lineas[clave] = len(self.lineas_producto)
+                self.lineas_producto.append(ing["producto_id"])
+                self.lineas_nombre.append(ing["nombre"])
+                self.lineas_unidad.append(unidad)
+            filas.append((self._lineas[clave], cantidad, ing["precio"]))
+        return filas
+
+    def actualizar(self, posicion: int, receta: dict) -> None:
+        """
+        Recalcula las filas de la receta en una posición
+
+        Si el número de ingredientes no cambia se sobrescriben en su sitio;
+        si cambia, las filas nuevas se añaden al final y las antiguas quedan
+        sin referencia hasta la próxima reconstrucción.
+        """
+        filas = self._filas_receta(receta)
+        lineas = np.asarray([f[0] for f in filas], dtype=np.int32)
+        cantidades = np.asarray([f[1] for f in filas], dtype=np.float64)
+        precios = np.asarray([f[2] for f in filas], dtype=np.float64)
+
+        if posicion >= len(self.receta_id):
+            self.receta_id = np.append(self.receta_id, receta["id"])
+            self.inicio = np.append(self.inicio, 0)
+            self.longitud = np.append(self.longitud, -1)
+        self.posiciones[receta["id"]] = posicion
+        self.receta_id[posicion] = receta["id"]
+
+        if self.longitud[posicion] == len(filas):
+            inicio = int(self.inicio[posicion])
+            self.linea[inicio:inicio + len(filas)] = lineas
+            self.cantidad[inicio:inicio + len(filas)] = cantidades
+            self.precio[inicio:inicio + len(filas)] = precios
+        else:
+            self.inicio[posicion] = len(self.linea)
+            self.longitud[posicion] = len(filas)
+            self.linea = np.concatenate([self.linea, lineas])
+            self.cantidad = np.concatenate([self.cantidad, cantidades])
+            self.precio = np.concatenate([self.precio, precios])
+
+    def actualizar_precios(self, posiciones: List[int], almacen) -> None:
+        """
+        Copia los precios de las recetas en esas posiciones desde el almacén
+        del catálogo, cuyas filas van en el mismo orden que las de la tabla
+        """
+        posiciones = np.asarray(posiciones, dtype=np.int64)
+        self.precio[self.filas(posiciones)] = almacen.ing_precio.datos[almacen.filas_de(posiciones)]
+
+    def filas(self, posiciones: np.ndarray) -> np.ndarray:
+        """Índices de las filas de las recetas en las posiciones dadas"""
+        longitudes = self.longitud[posiciones]
+        # Inicio de cada receta repetido por fila, más el desfase dentro de ella
+        desfases = np.arange(int(longitudes.sum()), dtype=np.int64) - np.repeat(
+            np.cumsum(longitudes) - longitudes, longitudes
+        )
+        return np.repeat(self.inicio[posiciones], longitudes) + desfases
+
+    def agregar(self, recetas_ids: Iterable[int]) -> List[dict]:
+        """
+        Líneas del carrito en orden de primera aparición
+
+        Las recetas repetidas (carritos de varias semanas) se leen una sola
+        vez y se ponderan por el número de veces que aparecen.
+        """
+        posiciones = np.fromiter(
+            (self.posiciones[rid] for rid in recetas_ids if rid in self.posiciones),
+            dtype=np.int64,
+        )
+        if not len(posiciones):
+            return []
+
+        unicas, primera, repeticiones = np.unique(
+            posiciones, return_index=True, return_counts=True
+        )
+        orden = np.argsort(primera, kind="stable")
+        unicas, repeticiones = unicas[orden], repeticiones[orden]
+
+        filas = self.filas(unicas)
+        pesos = np.repeat(repeticiones, self.longitud[unicas])
+        lineas, primera_fila, inversa = np.unique(
+            self.linea[filas], return_index=True, return_inverse=True
+        )
+        cantidades = np.bincount(inversa, weights=self.cantidad[filas] * pesos).tolist()
+        precios = np.bincount(inversa, weights=self.precio[filas] * pesos).tolist()
+
+        # Recetas de cada línea, en el orden del carrito
+        recetas_fila = np.repeat(self.receta_id[unicas], self.longitud[unicas])
+        agrupadas = np.argsort(inversa, kind="stable")
+        cortes = np.cumsum(np.bincount(inversa)).tolist()
+        recetas_ordenadas = recetas_fila[agrupadas].tolist()
+
+        lineas = lineas.tolist()
+        items = []
+        for i in np.argsort(primera_fila, kind="stable").tolist():
+            linea = lineas[i]
+            items.append({
+                "producto_id": self.lineas_producto[linea],
+                "nombre": self.lineas_nombre[linea],
+                "cantidad": round(cantidades[i], 2),
+                "unidad": self.lineas_unidad[linea],
+                "precio": round(precios[i], 2),
+                "recetas": recetas_ordenadas[cortes[i - 1] if i else 0:cortes[i]],
+            })
+        return items
+
+
+# ==================== AGREGADOR ====================
+
+class AgregadorCarrito(DerivadoCatalogo):
+    """
+    Agrega carritos sobre la tabla del catálogo, parcheada en cada cambio
+
+    Con un catálogo de productos, cada carrito incluye además la compra:
+    los envases más baratos que cubren lo que piden las recetas.
+    """
+
+    def __init__(self, catalogo: CatalogoRecetas, productos: Optional[CatalogoProductos] = None):
+        self.productos = productos
+        super().__init__(catalogo)
+
+    def _construir(self) -> TablaIngredientes:
+        return TablaIngredientes(self.catalogo.todas())
+
+    def _parchear(self, tabla: TablaIngredientes, posiciones: List[int]) -> None:
+        recetas = self.catalogo.todas()
+        for posicion in posiciones:
+            tabla.actualizar(posicion, recetas[posicion])
+
+    def _parchear_precios(self, tabla: TablaIngredientes, posiciones: List[int]) -> None:
+        tabla.actualizar_precios(posiciones, self.catalogo.todas())
+
+    def tabla(self) -> TablaIngredientes:
+        """Tabla de ingredientes de la versión actual del catálogo"""
+        return self.datos()
+
+    def agregar(self, recetas_ids: Iterable[int], preferencia_marca: str = "marca_blanca",
+                externas: Optional[Dict[int, dict]] = None) -> dict:
+        """
+        Carrito con las líneas agregadas, el total y el número de productos
+
+        `total_recetas` suma los precios de las recetas; con catálogo de
+        productos, `total` es el precio de la compra por envases. `externas`
+        son recetas de fuera del catálogo (p. ej. generadas) por id.
+        """
+        with tramo("carrito.agregar"):
+            if externas:
+                # Tabla solo con las recetas del carrito, pocas, para incluir las externas
+                recetas_ids = list(recetas_ids)
+                recetas = (externas.get(rid) or self.catalogo.obtener(rid)
+                           for rid in dict.fromkeys(recetas_ids))
+                tabla = TablaIngredientes(receta for receta in recetas if receta is not None)
+            else:
+                tabla = self.tabla()
+            items = tabla.agregar(recetas_ids)
+        total_recetas = round(sum(item["precio"] for item in items), 2)
+        carrito = {"items": items, "total": total_recetas, "num_items": len(items),
+                   "total_recetas": total_recetas}
+        if self.productos is not None:
+            with tramo("carrito.envases"):
+                compra = self.productos.resolver(items, preferencia_marca)
+            carrito.update(compra=compra["compra"], sin_envase=compra["sin_envase"],
+                           total=compra["total"])
+        return carrito
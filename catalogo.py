@@ -0,0 +1,462 @@
+"""
+SUPERMERCAI - Catálogo de recetas en memoria
+Índices precalculados para consultas en tiempo constante
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from almacen import AlmacenRecetas
+
+
+# ==================== ÍNDICES ====================
+
+class _Indices:
+    """
+    Instantánea del catálogo con todos sus índices
+
+    Las recetas viven en un AlmacenRecetas por columnas y los índices guardan
+    posiciones en arrays de NumPy ordenados, no referencias a diccionarios.
+    Las recargas crean una instantánea nueva; las actualizaciones sueltas la
+    modifican en su sitio. Los índices ordenados se desempatan por id.
+    """
+
+    __slots__ = (
+        "almacen",
+        "posiciones",
+        "por_tipo",
+        "por_producto",
+        "calorias",
+        "tiempo",
+    )
+
+    def __init__(self, recetas: Iterable[dict]):
+        self.almacen = AlmacenRecetas(recetas)
+        ids = self.almacen.ids.vista().tolist()
+        self.posiciones: Dict[int, int] = {}
+        for posicion, receta_id in enumerate(ids):
+            if receta_id in self.posiciones:
+                raise ValueError(f"Receta duplicada: {receta_id}")
+            self.posiciones[receta_id] = posicion
+
+        # Posiciones de cada tipo y de cada producto, en orden de carga
+        tipos = self.almacen.tipo.vista()
+        self.por_tipo: Dict[str, np.ndarray] = {
+            self.almacen.cadenas[indice]: np.flatnonzero(tipos == indice).astype(np.int32)
+            for indice in np.unique(tipos).tolist()
+        }
+        self.por_producto: Dict[int, np.ndarray] = _agrupar_productos(self.almacen)
+
+        self.calorias = _IndiceOrdenado(self.almacen.calorias, self.almacen.ids)
+        self.tiempo = _IndiceOrdenado(self.almacen.tiempo, self.almacen.ids)
+
+    @classmethod
+    def ensamblar(cls, almacen: AlmacenRecetas, posiciones, por_tipo: Dict[str, np.ndarray],
+                  por_producto: Dict[int, np.ndarray], calorias: Tuple[np.ndarray, np.ndarray],
+                  tiempo: Tuple[np.ndarray, np.ndarray]) -> "_Indices":
+        """
+        Índices ya calculados (p. ej. leídos de una instantánea), sin
+        recalcularlos; `calorias` y `tiempo` son los (orden, claves) de cada uno
+        """
+        indices = cls.__new__(cls)
+        indices.almacen = almacen
+        indices.posiciones = posiciones
+        indices.por_tipo = por_tipo
+        indices.por_producto = por_producto
+        indices.calorias = _IndiceOrdenado(almacen.calorias, almacen.ids, *calorias)
+        indices.tiempo = _IndiceOrdenado(almacen.tiempo, almacen.ids, *tiempo)
+        return indices
+
+    def anadir(self, receta: dict) -> int:
+        """Añade una receta nueva al final y devuelve su posición"""
+        posicion = self.almacen.anadir(receta)
+        self.posiciones[receta["id"]] = posicion
+        _incluir(self.por_tipo, receta["tipo_comida"], posicion)
+        for producto_id in self.almacen.productos(posicion):
+            _incluir(self.por_producto, producto_id, posicion)
+        self.calorias.insertar(posicion)
+        self.tiempo.insertar(posicion)
+        return posicion
+
+    def sustituir(self, receta: dict) -> int:
+        """Sustituye en su sitio la receta con el mismo id y devuelve su posición"""
+        posicion = self.posiciones[receta["id"]]
+        tipo_anterior = self.almacen.tipo_en(posicion)
+        productos_anteriores = self.almacen.productos(posicion)
+        self.calorias.quitar(posicion)
+        self.tiempo.quitar(posicion)
+
+        self.almacen.sustituir(posicion, receta)
+
+        if tipo_anterior != receta["tipo_comida"]:
+            _excluir(self.por_tipo, tipo_anterior, posicion)
+            _incluir(self.por_tipo, receta["tipo_comida"], posicion)
+        productos = self.almacen.productos(posicion)
+        for producto_id in set(productos_anteriores) - set(productos):
+            _excluir(self.por_producto, producto_id, posicion)
+        for producto_id in set(productos) - set(productos_anteriores):
+            _incluir(self.por_producto, producto_id, posicion)
+        self.calorias.insertar(posicion)
+        self.tiempo.insertar(posicion)
+        return posicion
+
+
+def _agrupar_productos(almacen: AlmacenRecetas) -> Dict[int, np.ndarray]:
+    """Posiciones de las recetas que usan cada producto, sin repetir"""
+    posiciones = np.repeat(np.arange(len(almacen), dtype=np.int64), almacen.ing_longitud.vista())
+    filas = almacen.filas_de(np.arange(len(almacen)))
+    productos = almacen.ing_producto.datos[filas]
+    orden = np.lexsort((posiciones, productos))
+    productos, posiciones = productos[orden], posiciones[orden]
+    # Un producto repetido en la misma receta cuenta una vez
+    nuevos = np.ones(len(productos), dtype=bool)
+    nuevos[1:] = (productos[1:] != productos[:-1]) | (posiciones[1:] != posiciones[:-1])
+    productos, posiciones = productos[nuevos], posiciones[nuevos].astype(np.int32)
+    claves, cortes = np.unique(productos, return_index=True)
+    return dict(zip(claves.tolist(), np.split(posiciones, cortes[1:])))
+
+
+def _incluir(indice: Dict, clave, posicion: int) -> None:
+    """Inserta una posición en el array ordenado de una clave"""
+    actuales = indice.get(clave)
+    if actuales is None:
+        indice[clave] = np.array([posicion], dtype=np.int32)
+        return
+    i = int(np.searchsorted(actuales, posicion))
+    if i < len(actuales) and actuales[i] == posicion:
+        return
+    indice[clave] = np.insert(actuales, i, posicion)
+
+
+def _excluir(indice: Dict, clave, posicion: int) -> None:
+    actuales = indice[clave]
+    i = int(np.searchsorted(actuales, posicion))
+    indice[clave] = np.delete(actuales, i)
+
+
+class _IndiceOrdenado:
+    """
+    Posiciones ordenadas por (valor, id) con sus valores en un array
+    paralelo, para buscar rangos con searchsorted
+    """
+
+    __slots__ = ("columna", "ids", "claves", "orden")
+
+    def __init__(self, columna, ids, orden: Optional[np.ndarray] = None,
+                 claves: Optional[np.ndarray] = None):
+        self.columna = columna
+        self.ids = ids
+        if orden is None:
+            valores = columna.vista()
+            orden = np.lexsort((ids.vista(), valores)).astype(np.int32)
+            claves = valores[orden]
+        self.orden = orden
+        self.claves = claves
+
+    def _hueco(self, valor: int, receta_id: int) -> int:
+        """Índice de (valor, receta_id) en el orden"""
+        inicio = int(np.searchsorted(self.claves, valor, side="left"))
+        fin = int(np.searchsorted(self.claves, valor, side="right"))
+        empatados = self.ids.datos[self.orden[inicio:fin]]
+        return inicio + int(np.searchsorted(empatados, receta_id))
+
+    def insertar(self, posicion: int) -> None:
+        valor = self.columna.datos[posicion]
+        i = self._hueco(valor, self.ids.datos[posicion])
+        self.orden = np.insert(self.orden, i, posicion)
+        self.claves = np.insert(self.claves, i, valor)
+
+    def quitar(self, posicion: int) -> None:
+        i = self._hueco(self.columna.datos[posicion], self.ids.datos[posicion])
+        self.orden = np.delete(self.orden, i)
+        self.claves = np.delete(self.claves, i)
+
+    def rango(self, minimo: Optional[int], maximo: Optional[int]) -> np.ndarray:
+        """Posiciones con valor en [minimo, maximo], en orden ascendente"""
+        inicio = 0 if minimo is None else int(np.searchsorted(self.claves, minimo, side="left"))
+        fin = len(self.claves) if maximo is None else int(
+            np.searchsorted(self.claves, maximo, side="right")
+        )
+        return self.orden[inicio:fin]
+
+
+_VACIO = np.empty(0, dtype=np.int32)
+_VACIO.flags.writeable = False
+
+
+def _recetas(indices: _Indices, posiciones: Optional[np.ndarray]) -> List[dict]:
+    if posiciones is None:
+        return []
+    return [indices.almacen.receta(posicion) for posicion in posiciones.tolist()]
+
+
+# ==================== CATÁLOGO ====================
+
+class CatalogoRecetas:
+    """
+    Catálogo de recetas construido una vez al arrancar
+
+    Todas las consultas leen de una instantánea de índices. Recargar construye
+    una instantánea nueva fuera del cerrojo y la publica con una sola
+    asignación, así que las peticiones en curso nunca ven un estado a medias.
+    Las actualizaciones sueltas (una receta, un precio) modifican los índices
+    en su sitio y avisan a los suscriptores de las posiciones afectadas para
+    que parcheen sus estructuras en lugar de reconstruirlas.
+    """
+
+    def __init__(self, recetas: Iterable[dict] = (), indices: Optional[_Indices] = None):
+        self._lock = threading.Lock()
+        self._indices = indices if indices is not None else _Indices(recetas)
+        self._version = 1
+        self._suscriptores: List[Callable[[int, Optional[List[int]], bool], None]] = []
+
+    # ---------- Recarga ----------
+
+    def recargar(self, recetas: Iterable[dict]) -> int:
+        """Sustituye el catálogo de forma atómica y devuelve la nueva versión"""
+        nuevos = _Indices(recetas)
+        with self._lock:
+            self._indices = nuevos
+            self._version += 1
+            version = self._version
+        self._avisar(version, None)
+        return version
+
+    def actualizar_recetas(self, recetas: Iterable[dict]) -> int:
+        """
+        Inserta o sustituye recetas sueltas sin reconstruir el catálogo
+
+        Las recetas con un id existente se sustituyen en su posición; las
+        nuevas se añaden al final. Devuelve la nueva versión.
+        """
+        with self._lock:
+            indices = self._indices
+            posiciones = []
+            for receta in recetas:
+                if receta["id"] in indices.posiciones:
+                    posiciones.append(indices.sustituir(receta))
+                else:
+                    posiciones.append(indices.anadir(receta))
+            self._version += 1
+            version = self._version
+        self._avisar(version, posiciones)
+        return version
+
+    def actualizar_receta(self, receta: dict) -> int:
+        """Inserta o sustituye una receta; ver actualizar_recetas"""
+        return self.actualizar_recetas([receta])
+
+    def repreciar(self, productos: Iterable[int],
+                  calcular: Callable[[AlmacenRecetas, np.ndarray], np.ndarray]) -> Tuple[int, int]:
+        """
+        Recalcula el precio de los ingredientes de unos productos en todas las
+        recetas que los usan
+
+        Las recetas se encuentran con el índice por producto y solo se tocan
+        sus filas de esos productos: `calcular(almacen, filas)` devuelve los
+        precios nuevos de esas filas. Los suscriptores reciben el aviso como
+        un cambio solo de precios. Devuelve la versión y el número de recetas
+        afectadas (sin ninguna, la versión no cambia).
+        """
+        productos = np.unique(np.fromiter(productos, dtype=np.int64))
+        with self._lock:
+            indices = self._indices
+            grupos = [indices.por_producto[p] for p in productos.tolist() if p in indices.por_producto]
+            if not grupos:
+                return self._version, 0
+            posiciones = np.unique(np.concatenate(grupos))
+            almacen = indices.almacen
+            filas = almacen.filas_de(posiciones)
+            filas = filas[np.isin(almacen.ing_producto.datos[filas], productos)]
+            almacen.ing_precio.datos[filas] = calcular(almacen, filas)
+            self._version += 1
+            version = self._version
+        self._avisar(version, posiciones.tolist(), solo_precios=True)
+        return version, len(posiciones)
+
+    def ajustar_precio_producto(self, producto_id: int, factor: float) -> int:
+        """
+        Multiplica por `factor` el precio de un producto en todas las recetas
+        que lo usan (p. ej. 1.10 para una subida del 10 %)
+        """
+        version, _ = self.repreciar(
+            [producto_id], lambda almacen, filas: np.round(almacen.ing_precio.datos[filas] * factor, 4)
+        )
+        return version
+
+    def suscribir(self, suscriptor: Callable[[int, Optional[List[int]], bool], None]) -> None:
+        """
+        Registra una función a la que se llama tras cada cambio con la nueva
+        versión, las posiciones modificadas (None si se recargó entero) y si
+        solo cambiaron precios de ingredientes
+        """
+        self._suscriptores.append(suscriptor)
+
+    def _avisar(self, version: int, posiciones: Optional[List[int]],
+                solo_precios: bool = False) -> None:
+        for suscriptor in list(self._suscriptores):
+            suscriptor(version, posiciones, solo_precios)
+
+    @property
+    def version(self) -> int:
+        """Versión actual del catálogo (aumenta con cada cambio)"""
+        return self._version
+
+    # ---------- Consultas ----------
+
+    def obtener(self, receta_id: int) -> Optional[dict]:
+        """Receta por id, o None si no existe"""
+        indices = self._indices
+        posicion = indices.posiciones.get(receta_id)
+        return indices.almacen.receta(posicion) if posicion is not None else None
+
+    def posicion(self, receta_id: int) -> Optional[int]:
+        """Posición de una receta en el orden de carga, o None si no existe"""
+        return self._indices.posiciones.get(receta_id)
+
+    def obtener_varias(self, recetas_ids: Iterable[int]) -> List[dict]:
+        """Recetas por id en el orden pedido, ignorando ids desconocidos"""
+        indices = self._indices
+        posiciones = indices.posiciones
+        return [indices.almacen.receta(posiciones[rid]) for rid in recetas_ids if rid in posiciones]
+
+    def por_tipo(self, tipo_comida: str) -> List[dict]:
+        """Recetas de un tipo de comida ("desayuno", "comida", "cena")"""
+        indices = self._indices
+        return _recetas(indices, indices.por_tipo.get(tipo_comida))
+
+    def por_producto(self, producto_id: int) -> List[dict]:
+        """Recetas que usan un producto del supermercado"""
+        indices = self._indices
+        return _recetas(indices, indices.por_producto.get(producto_id))
+
+    def posiciones_tipo(self, tipo_comida: str) -> np.ndarray:
+        """Posiciones (ordenadas) de las recetas de un tipo de comida"""
+        return self._indices.por_tipo.get(tipo_comida, _VACIO)
+
+    def posiciones_producto(self, producto_id: int) -> np.ndarray:
+        """Posiciones (ordenadas) de las recetas que usan un producto"""
+        return self._indices.por_producto.get(producto_id, _VACIO)
+
+    def por_calorias(self, minimo: Optional[int] = None,
+                     maximo: Optional[int] = None) -> List[dict]:
+        """Recetas con calorías en [minimo, maximo], ordenadas ascendentemente"""
+        indices = self._indices
+        return _recetas(indices, indices.calorias.rango(minimo, maximo))
+
+    def por_tiempo(self, minimo: Optional[int] = None,
+                   maximo: Optional[int] = None) -> List[dict]:
+        """Recetas con tiempo de preparación en [minimo, maximo] minutos"""
+        indices = self._indices
+        return _recetas(indices, indices.tiempo.rango(minimo, maximo))
+
+    def pagina(self, despues_de: Optional[int] = None,
+               limite: int = 50) -> Tuple[List[dict], Optional[int]]:
+        """
+        Página de recetas en orden de carga a partir de la receta `despues_de`
+
+        Devuelve las recetas y el id desde el que pedir la página siguiente
+        (None si es la última). Lanza ValueError si `despues_de` no existe.
+        """
+        indices = self._indices
+        inicio = self._inicio(indices, despues_de)
+        recetas = indices.almacen[inicio:inicio + limite]
+        siguiente = recetas[-1]["id"] if inicio + limite < len(indices.almacen) and recetas else None
+        return recetas, siguiente
+
+    def desde(self, despues_de: Optional[int] = None) -> Iterator[dict]:
+        """Recorre la instantánea actual a partir de la receta `despues_de` sin copiarla"""
+        indices = self._indices
+        almacen = indices.almacen
+        inicio = self._inicio(indices, despues_de)
+        return (almacen.receta(posicion) for posicion in range(inicio, len(almacen)))
+
+    def inicio(self, despues_de: Optional[int] = None) -> int:
+        """Posición por la que empieza la página siguiente a `despues_de`"""
+        return self._inicio(self._indices, despues_de)
+
+    @staticmethod
+    def _inicio(indices: _Indices, despues_de: Optional[int]) -> int:
+        if despues_de is None:
+            return 0
+        if despues_de not in indices.posiciones:
+            raise ValueError(f"Receta desconocida: {despues_de}")
+        return indices.posiciones[despues_de] + 1
+
+    def todas(self) -> AlmacenRecetas:
+        """
+        Todas las recetas en orden de carga, indexables por posición
+
+        Cada acceso construye el diccionario de la receta; las estructuras
+        derivadas pueden leer directamente las columnas del almacén.
+        """
+        return self._indices.almacen
+
+    def __len__(self) -> int:
+        return len(self._indices.almacen)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self._indices.almacen)
+
+    def __contains__(self, receta_id: int) -> bool:
+        return receta_id in self._indices.posiciones
+
+
+# ==================== ESTRUCTURAS DERIVADAS ====================
+
+class DerivadoCatalogo:
+    """
+    Estructura calculada a partir del catálogo
+
+    Se construye en el primer acceso y tras cada recarga completa. Los
+    cambios sueltos se aplican con `_parchear` sobre las posiciones
+    afectadas, y los que solo cambian precios con `_parchear_precios`. Los
+    parches deben ser idempotentes: recalculan esas posiciones a partir del
+    estado actual del catálogo.
+    """
+
+    def __init__(self, catalogo: CatalogoRecetas):
+        self.catalogo = catalogo
+        self._lock = threading.RLock()
+        self._version = None
+        self._datos = None
+        catalogo.suscribir(self._al_cambiar)
+
+    def _construir(self):
+        raise NotImplementedError
+
+    def _parchear(self, datos, posiciones: List[int]) -> None:
+        raise NotImplementedError
+
+    def _parchear_precios(self, datos, posiciones: List[int]) -> None:
+        """Solo han cambiado precios de ingredientes; por defecto, un parche completo"""
+        self._parchear(datos, posiciones)
+
+    def sembrar(self, datos) -> None:
+        """Adopta `datos` ya construidos (p. ej. de una instantánea) para la versión actual"""
+        with self._lock:
+            self._datos = datos
+            self._version = self.catalogo.version
+
+    def datos(self):
+        """Datos correspondientes a la versión actual del catálogo"""
+        version = self.catalogo.version
+        if self._version == version:
+            return self._datos
+        with self._lock:
+            if self._version != version:
+                self._datos = self._construir()
+                self._version = version
+        return self._datos
+
+    def _al_cambiar(self, version: int, posiciones: Optional[List[int]],
+                    solo_precios: bool = False) -> None:
+        if posiciones is None:
+            return  # recarga completa: se reconstruye en el próximo acceso
+        with self._lock:
+            if self._datos is not None and self._version == version - 1:
+                parchear = self._parchear_precios if solo_precios else self._parchear
+                parchear(self._datos, posiciones)
+                self._version = version
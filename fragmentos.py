@@ -0,0 +1,72 @@
+"""
+SUPERMERCAI - Recetas ya codificadas en JSON
+El JSON de cada receta se codifica una vez y las respuestas se montan uniendo bytes
+"""
+
+from typing import Iterable, List
+
+from cache import Ensamblado, Fragmento, codificar_json
+from catalogo import DerivadoCatalogo
+from planificador import TIPOS_COMIDA
+
+
+def con_dia(fragmento: Fragmento, dia: int) -> Fragmento:
+    """Fragmento de la receta con la clave "dia" añadida al final, como en componer_menu"""
+    return Fragmento(b"%s,\"dia\":%d}" % (fragmento[:-1], dia))
+
+
+class FragmentosRecetas(DerivadoCatalogo):
+    """
+    JSON de cada receta, en la misma posición que en el catálogo
+
+    Ocupa tanto como el JSON de todas las recetas, así que es opcional; los
+    cambios sueltos del catálogo recodifican solo las posiciones afectadas.
+    Los cambios de precios, que pueden tocar gran parte del catálogo, solo
+    las marcan: cada una se recodifica cuando se vuelve a pedir.
+    """
+
+    def _construir(self) -> List[Fragmento]:
+        return [Fragmento(codificar_json(receta)) for receta in self.catalogo.todas()]
+
+    def _parchear(self, fragmentos: List[Fragmento], posiciones: List[int]) -> None:
+        recetas = self.catalogo.todas()
+        for posicion in posiciones:
+            if posicion >= len(fragmentos):
+                fragmentos.extend([None] * (posicion + 1 - len(fragmentos)))
+            fragmentos[posicion] = Fragmento(codificar_json(recetas[posicion]))
+
+    def _parchear_precios(self, fragmentos: List[Fragmento], posiciones: List[int]) -> None:
+        for posicion in posiciones:
+            fragmentos[posicion] = None
+
+    def _fragmento(self, fragmentos: List[Fragmento], posicion: int) -> Fragmento:
+        """Fragmento de una posición, recodificado si un cambio de precios lo marcó"""
+        fragmento = fragmentos[posicion]
+        if fragmento is None:
+            fragmento = Fragmento(codificar_json(self.catalogo.todas()[posicion]))
+            fragmentos[posicion] = fragmento
+        return fragmento
+
+    def en(self, posiciones: Iterable[int]) -> List[Fragmento]:
+        """Fragmentos de las posiciones dadas, en ese orden"""
+        fragmentos = self.datos()
+        return [self._fragmento(fragmentos, posicion) for posicion in posiciones]
+
+    def de_ids(self, recetas_ids: Iterable[int]) -> List[Fragmento]:
+        """Fragmentos por id en el orden pedido, ignorando ids desconocidos"""
+        fragmentos = self.datos()
+        posiciones = (self.catalogo.posicion(rid) for rid in recetas_ids)
+        return [self._fragmento(fragmentos, p) for p in posiciones if p is not None]
+
+    def menu(self, posiciones: List[int], coste_total: float,
+             presupuesto: float) -> Ensamblado:
+        """Equivalente de componer_menu con las recetas ya codificadas"""
+        recetas = [
+            con_dia(fragmento, indice // len(TIPOS_COMIDA) + 1)
+            for indice, fragmento in enumerate(self.en(posiciones))
+        ]
+        return Ensamblado(
+            recetas=recetas,
+            costo_total=round(coste_total, 2),
+            dentro_presupuesto=coste_total <= presupuesto,
+        )
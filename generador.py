@@ -0,0 +1,413 @@
+"""
+SUPERMERCAI - Generación de menús con un modelo de lenguaje
+Backends asíncronos intercambiables, peticiones idénticas agrupadas en una
+sola llamada, límites de concurrencia y tiempo, y caché persistente
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+from lotes import clave_candidatos
+from metricas import tramo
+from planificador import DIAS_SEMANA, TIPOS_COMIDA, PlanificadorMenus, componer_menu
+from resumenes import coste_receta
+
+RECETAS_MENU = DIAS_SEMANA * len(TIPOS_COMIDA)
+
+# Las recetas generadas que no vienen del catálogo reciben ids a partir de aquí
+ID_GENERADAS = 1_000_000_000
+
+CAMPOS_OBLIGATORIOS = ("nombre", "tiempo_preparacion", "calorias", "tipo_comida", "ingredientes")
+
+
+def clave_generacion(preferencias) -> str:
+    """
+    Hash de las preferencias normalizadas
+
+    Las alergias cuentan como la máscara que producen (ver
+    lotes.clave_candidatos); el presupuesto y los comensales también, porque
+    cambian lo que se le pide al modelo.
+    """
+    clave = (clave_candidatos(preferencias), preferencias.presupuesto,
+             preferencias.num_personas, preferencias.preferencia_marca)
+    return hashlib.sha256(json.dumps(clave).encode("utf-8")).hexdigest()
+
+
+# ==================== BACKENDS ====================
+
+class GeneradorRecetas:
+    """Backend que genera las recetas de un menú semanal"""
+
+    async def generar(self, preferencias) -> List[dict]:
+        """RECETAS_MENU recetas con el formato del catálogo, en orden de día y tipo de comida"""
+        raise NotImplementedError
+
+    async def cerrar(self) -> None:
+        pass
+
+
+class GeneradorSimulado(GeneradorRecetas):
+    """
+    Backend local para pruebas y benchmarks
+
+    Responde tras una latencia aleatoria parecida a la de un modelo remoto
+    (con una fracción `lentas` de llamadas `lentitud` veces más lentas) con
+    el menú que saldría del catálogo.
+    """
+
+    def __init__(self, planificador: PlanificadorMenus, latencia: float = 1.0,
+                 variacion: float = 0.5, lentas: float = 0.05, lentitud: float = 8.0,
+                 semilla: Optional[int] = None):
+        self.planificador = planificador
+        self.latencia = latencia
+        self.variacion = variacion
+        self.lentas = lentas
+        self.lentitud = lentitud
+        self._rng = random.Random(semilla)
+        self.llamadas = 0
+
+    async def generar(self, preferencias) -> List[dict]:
+        self.llamadas += 1
+        espera = self.latencia * self._rng.uniform(1 - self.variacion, 1 + self.variacion)
+        if self._rng.random() < self.lentas:
+            espera *= self.lentitud
+        await asyncio.sleep(espera)
+        menu = self.planificador.planificar(preferencias)
+        if menu is None:
+            raise ValueError("No hay recetas compatibles con las preferencias indicadas")
+        return [{k: v for k, v in receta.items() if k != "dia"} for receta in menu["recetas"]]
+
+
+class GeneradorOpenAI(GeneradorRecetas):
+    """
+    Backend sobre la API de OpenAI (requiere el paquete `openai` y OPENAI_API_KEY)
+
+    Se le pasa la lista de productos para que cada ingrediente lleve un
+    producto_id del supermercado; las recetas nuevas reciben un id estable
+    a partir de su contenido.
+    """
+
+    def __init__(self, productos: List[dict], modelo: str = "gpt-4o-mini", cliente=None):
+        if cliente is None:
+            try:
+                from openai import AsyncOpenAI
+            except ImportError:
+                raise RuntimeError("GeneradorOpenAI necesita el paquete openai (ver requirements.txt)")
+            cliente = AsyncOpenAI()
+        self.cliente = cliente
+        self.modelo = modelo
+        self._productos = "\n".join(
+            f"{p['id']}: {p['nombre']} ({p['unidad']})" for p in productos
+        )
+
+    def _mensajes(self, preferencias) -> List[dict]:
+        sistema = (
+            "Eres un nutricionista que diseña menús semanales con productos de un supermercado. "
+            "Responde solo con JSON: {\"recetas\": [...]} con exactamente "
+            f"{RECETAS_MENU} recetas, una por día (1-7) y tipo de comida en el orden "
+            f"{', '.join(TIPOS_COMIDA)}. Cada receta tiene nombre, descripcion, "
+            "tiempo_preparacion (minutos), calorias (por ración), tipo_comida, estilo_cocina, "
+            "pasos (lista) e ingredientes (lista de {nombre, cantidad, unidad, producto_id, "
+            "precio}). Usa solo estos productos (producto_id: nombre (unidad)):\n"
+            + self._productos
+        )
+        return [
+            {"role": "system", "content": sistema},
+            {"role": "user", "content": json.dumps(preferencias.dict(), ensure_ascii=False)},
+        ]
+
+    async def generar(self, preferencias) -> List[dict]:
+        respuesta = await self.cliente.chat.completions.create(
+            model=self.modelo,
+            messages=self._mensajes(preferencias),
+            response_format={"type": "json_object"},
+        )
+        recetas = json.loads(respuesta.choices[0].message.content)["recetas"]
+        return [_con_id(validar_receta(receta)) for receta in recetas[:RECETAS_MENU]]
+
+    async def cerrar(self) -> None:
+        await self.cliente.close()
+
+
+def validar_receta(receta: dict) -> dict:
+    """Comprueba los campos que necesitan el planificador y el carrito; lanza ValueError"""
+    faltan = [campo for campo in CAMPOS_OBLIGATORIOS if campo not in receta]
+    if faltan:
+        raise ValueError(f"Receta generada sin {', '.join(faltan)}")
+    if receta["tipo_comida"] not in TIPOS_COMIDA:
+        raise ValueError(f"Tipo de comida desconocido: {receta['tipo_comida']}")
+    for ingrediente in receta["ingredientes"]:
+        for campo in ("nombre", "cantidad", "unidad", "producto_id", "precio"):
+            if campo not in ingrediente:
+                raise ValueError(f"Ingrediente generado sin {campo}")
+    return receta
+
+
+def _con_id(receta: dict) -> dict:
+    """
+    Receta con un id derivado de todo su contenido: dos recetas con el mismo
+    nombre e ingredientes distintos reciben ids distintos
+    """
+    if "id" not in receta:
+        texto = json.dumps(receta, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        resumen = hashlib.sha256(texto.encode("utf-8")).hexdigest()
+        # 48 bits: sin colisiones en la práctica y por debajo de 2**53 para JavaScript
+        receta = {"id": ID_GENERADAS + int(resumen[:12], 16), **receta}
+    return receta
+
+
+# ==================== CACHÉ PERSISTENTE ====================
+
+class CacheGenerados:
+    """
+    Recetas generadas por clave de preferencias
+
+    Se guardan en memoria, en una LRU acotada a `max_entradas`, y, con
+    `ruta`, en SQLite para sobrevivir a los reinicios; las consultas a disco
+    van a un hilo para no bloquear el bucle de eventos. Las entradas que han
+    superado `ttl` se borran al leerlas.
+    """
+
+    def __init__(self, ruta: Optional[str] = None, ttl: float = 7 * 24 * 3600,
+                 max_entradas: int = 1000):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._memoria: "OrderedDict[str, tuple]" = OrderedDict()
+        self.ruta = ruta
+        self._conectar()
+        if ruta and hasattr(os, "register_at_fork"):
+            # Cada proceso hijo de servidor.py abre su propia conexión
+            referencia = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: _reconectar(referencia))
+
+    def _conectar(self) -> None:
+        self._lock = threading.Lock()
+        self._conexion = None
+        if self.ruta:
+            self._conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+            self._conexion.execute(
+                "CREATE TABLE IF NOT EXISTS generadas "
+                "(clave TEXT PRIMARY KEY, recetas TEXT NOT NULL, creado REAL NOT NULL)"
+            )
+            self._conexion.commit()
+
+    async def obtener(self, clave: str) -> Optional[List[dict]]:
+        entrada = self._memoria.get(clave)
+        if entrada is not None and self._caducada(entrada):
+            del self._memoria[clave]
+            entrada = None
+        if entrada is None and self._conexion is not None:
+            entrada = await asyncio.to_thread(self._leer, clave)
+        if entrada is None:
+            return None
+        self._recordar(clave, entrada)
+        return entrada[0]
+
+    async def guardar(self, clave: str, recetas: List[dict]) -> None:
+        entrada = (recetas, time.time())
+        self._recordar(clave, entrada)
+        if self._conexion is not None:
+            await asyncio.to_thread(self._escribir, clave, entrada)
+
+    def _caducada(self, entrada: tuple) -> bool:
+        return entrada[1] + self.ttl <= time.time()
+
+    def _recordar(self, clave: str, entrada: tuple) -> None:
+        self._memoria[clave] = entrada
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_entradas:
+            self._memoria.popitem(last=False)
+
+    def _leer(self, clave: str) -> Optional[tuple]:
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT recetas, creado FROM generadas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None:
+                return None
+            if fila[1] + self.ttl <= time.time():
+                self._conexion.execute("DELETE FROM generadas WHERE clave = ?", (clave,))
+                self._conexion.commit()
+                return None
+        return json.loads(fila[0]), fila[1]
+
+    def _escribir(self, clave: str, entrada: tuple) -> None:
+        texto = json.dumps(entrada[0], ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO generadas (clave, recetas, creado) VALUES (?, ?, ?)",
+                (clave, texto, entrada[1]),
+            )
+            self._conexion.commit()
+
+    def cerrar(self) -> None:
+        if self._conexion is not None:
+            with self._lock:
+                self._conexion.close()
+            self._conexion = None
+
+
+def _reconectar(referencia: weakref.ref) -> None:
+    cache = referencia()
+    if cache is not None:
+        cache._conectar()
+
+
+# ==================== RECETAS GENERADAS ====================
+
+class RecetasGeneradas:
+    """
+    Recetas de los menús generados, por id, para el carrito y las sustituciones
+
+    No entran en el catálogo, así que no aparecen en búsquedas,
+    recomendaciones ni candidatos del planificador ni cambian su versión.
+    Es una LRU acotada a `max_recetas`: se quedan las de los menús servidos
+    más recientemente.
+    """
+
+    def __init__(self, max_recetas: int = 10_000):
+        self.max_recetas = max_recetas
+        self._recetas: "OrderedDict[int, dict]" = OrderedDict()
+
+    def registrar(self, recetas: Iterable[dict]) -> None:
+        for receta in recetas:
+            self._recetas[receta["id"]] = receta
+            self._recetas.move_to_end(receta["id"])
+        while len(self._recetas) > self.max_recetas:
+            self._recetas.popitem(last=False)
+
+    def en(self, recetas_ids: Iterable[int]) -> Dict[int, dict]:
+        """Las recetas guardadas de entre esos ids"""
+        recetas = self._recetas
+        return {rid: recetas[rid] for rid in recetas_ids if rid in recetas}
+
+    def __len__(self) -> int:
+        return len(self._recetas)
+
+
+# ==================== SERVICIO ====================
+
+class ServicioGeneracion:
+    """
+    Menús generados con límites de concurrencia y tiempo
+
+    Las peticiones con la misma clave de preferencias esperan a la misma
+    llamada en curso. Como mucho `max_concurrentes` llamadas van al backend
+    a la vez; si hay `max_pendientes` claves distintas esperando, las nuevas
+    se responden con el catálogo sin encolarse. Si la respuesta no llega en
+    `timeout` segundos (cola incluida), se responde con el catálogo y la
+    llamada sigue en segundo plano (hasta `timeout_generacion`) para llenar
+    la caché. Las recetas de cada menú servido quedan en `recetas`.
+    """
+
+    def __init__(self, generador: GeneradorRecetas, respaldo: Callable[[object], Optional[dict]],
+                 cache: Optional[CacheGenerados] = None, recetas: Optional[RecetasGeneradas] = None,
+                 max_concurrentes: int = 4, max_pendientes: int = 64,
+                 timeout: float = 3.0, timeout_generacion: float = 60.0):
+        self.generador = generador
+        self.respaldo = respaldo
+        self.cache = cache or CacheGenerados()
+        self.recetas = recetas if recetas is not None else RecetasGeneradas()
+        self.max_concurrentes = max_concurrentes
+        self.max_pendientes = max_pendientes
+        self.timeout = timeout
+        self.timeout_generacion = timeout_generacion
+        self._semaforo = asyncio.Semaphore(max_concurrentes)
+        self._en_curso: Dict[str, asyncio.Task] = {}
+        self.contadores = {"generadas": 0, "agrupadas": 0, "cache": 0, "respaldo": 0,
+                           "timeouts": 0, "errores": 0, "descartadas": 0}
+
+    async def menu(self, preferencias) -> Optional[dict]:
+        """
+        Menú con `origen` "generado", "cache" o "catalogo", o None si no hay
+        recetas compatibles ni siquiera en el catálogo
+        """
+        clave = clave_generacion(preferencias)
+        recetas = await self.cache.obtener(clave)
+        if recetas is not None:
+            self.contadores["cache"] += 1
+            return self._componer(recetas, preferencias, "cache")
+
+        tarea = self._en_curso.get(clave)
+        if tarea is not None:
+            self.contadores["agrupadas"] += 1
+        elif len(self._en_curso) >= self.max_pendientes:
+            self.contadores["descartadas"] += 1
+            return self._respaldo(preferencias)
+        else:
+            tarea = self._en_curso[clave] = asyncio.ensure_future(self._generar(clave, preferencias))
+            tarea.add_done_callback(lambda t: self._terminada(clave, t))
+
+        try:
+            # shield: si vence el plazo, la llamada sigue para llenar la caché
+            recetas = await asyncio.wait_for(asyncio.shield(tarea), self.timeout)
+        except asyncio.TimeoutError:
+            self.contadores["timeouts"] += 1
+            return self._respaldo(preferencias)
+        except Exception:
+            self.contadores["errores"] += 1
+            return self._respaldo(preferencias)
+        return self._componer(recetas, preferencias, "generado")
+
+    async def _generar(self, clave: str, preferencias) -> List[dict]:
+        async with self._semaforo:
+            with tramo("generacion.modelo"):
+                recetas = await asyncio.wait_for(self.generador.generar(preferencias),
+                                                 self.timeout_generacion)
+        if len(recetas) < RECETAS_MENU:
+            raise ValueError(f"El generador devolvió {len(recetas)} recetas")
+        self.contadores["generadas"] += 1
+        await self.cache.guardar(clave, recetas)
+        return recetas
+
+    def _terminada(self, clave: str, tarea: asyncio.Task) -> None:
+        if self._en_curso.get(clave) is tarea:
+            del self._en_curso[clave]
+        if not tarea.cancelled():
+            tarea.exception()  # marcada como leída aunque nadie la esperase
+
+    def _componer(self, recetas: List[dict], preferencias, origen: str) -> dict:
+        self.recetas.registrar(recetas)
+        coste = sum(coste_receta(receta, preferencias.num_personas) for receta in recetas)
+        return {**componer_menu(recetas, coste, preferencias.presupuesto), "origen": origen}
+
+    def _respaldo(self, preferencias) -> Optional[dict]:
+        self.contadores["respaldo"] += 1
+        menu = self.respaldo(preferencias)
+        return {**menu, "origen": "catalogo"} if menu is not None else None
+
+    def estadisticas(self) -> dict:
+        """Contadores de uso y llamadas en curso"""
+        return {**self.contadores, "en_curso": len(self._en_curso),
+                "max_concurrentes": self.max_concurrentes, "timeout": self.timeout,
+                "recetas_generadas": len(self.recetas)}
+
+    async def cerrar(self) -> None:
+        for tarea in list(self._en_curso.values()):
+            tarea.cancel()
+        await self.generador.cerrar()
+        self.cache.cerrar()
+
+
+def crear_servicio(backend: str, planificador: PlanificadorMenus, productos: List[dict],
+                   ruta_cache: Optional[str] = None) -> ServicioGeneracion:
+    """Servicio con el backend "simulado" u "openai" (lanza ValueError si es otro)"""
+    if backend == "simulado":
+        generador = GeneradorSimulado(planificador)
+    elif backend == "openai":
+        generador = GeneradorOpenAI(productos, os.environ.get("SUPERMERCAI_MODELO", "gpt-4o-mini"))
+    else:
+        raise ValueError(f"Generador desconocido: {backend}")
+    return ServicioGeneracion(
+        generador, planificador.planificar, CacheGenerados(ruta_cache),
+        timeout=float(os.environ.get("SUPERMERCAI_TIMEOUT_GENERACION", "3")),
+    )
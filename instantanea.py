@@ -0,0 +1,552 @@
+"""
+SUPERMERCAI - Instantánea binaria del catálogo
+Recetas, productos e índices compilados a un fichero que se mapea en memoria al arrancar
+
+La instantánea guarda tal cual los arrays del almacén por columnas, los
+índices del catálogo (ids ordenados, tipos, productos, calorías y tiempo),
+la tabla de resúmenes, la tabla de ingredientes del carrito, el índice de
+búsqueda, la matriz de vectores de las recomendaciones y, si se pide, el
+JSON ya codificado de cada receta. Los textos van en tablas de
+cadenas (desfases + bytes) que se decodifican al leer cada entrada.
+
+Formato (enteros little-endian):
+
+    b"SMAIINST"  u32 versión del formato  u32 reservado  u64 longitud de la cabecera
+    cabecera JSON: {"meta": {...}, "secciones": {nombre: {"desfase", "dtype", "n"}}}
+    secciones alineadas a ALINEACION bytes
+
+Al cargar no se deserializa nada: cada sección es un array de NumPy sobre
+el mapa del fichero. El mapa es copia-en-escritura (ACCESS_COPY), así que
+las actualizaciones del catálogo escriben en páginas privadas del proceso y
+nunca en el fichero, y las páginas sin tocar se comparten entre todos los
+procesos que abren la misma instantánea, bifurcados o no.
+
+Uso:
+    python instantanea.py construir --db supermercai.db --salida catalogo.inst
+    python instantanea.py construir recetas.ndjson --productos productos.json
+    python instantanea.py info catalogo.inst
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from almacen import AUSENTE, COLUMNAS, AlmacenRecetas, Internador
+from cache import Fragmento
+from carrito import AgregadorCarrito, TablaIngredientes
+from busqueda import IndiceBusqueda, TablaBusqueda
+from catalogo import CatalogoRecetas, DerivadoCatalogo, _Indices
+from fragmentos import FragmentosRecetas
+from recomendaciones import Recomendador, TablaVectores
+from resumenes import ResumenesRecetas, TablaResumenes
+
+MAGIA = b"SMAIINST"
+# Sube con cualquier cambio del formato o de cómo se calculan los resúmenes,
+# las líneas del carrito o el JSON de las recetas: hay que reconstruir
+VERSION_FORMATO = 3
+ALINEACION = 64
+_PREAMBULO = struct.Struct("<8sIIQ")
+
+# Tipo de cada entrada de una tabla de cadenas
+_NINGUNO, _TEXTO, _TUPLA, _FRAGMENTO = range(4)
+
+
+class InstantaneaInvalida(ValueError):
+    """El fichero no es una instantánea o es de otra versión del formato"""
+
+
+# ==================== TABLAS MAPEADAS ====================
+
+def _codificar(valor) -> tuple:
+    """(tipo, bytes) de una entrada de tabla"""
+    if valor is None:
+        return _NINGUNO, b""
+    if isinstance(valor, Fragmento):
+        return _FRAGMENTO, bytes(valor)
+    if isinstance(valor, str):
+        return _TEXTO, valor.encode("utf-8")
+    if isinstance(valor, tuple):
+        return _TUPLA, json.dumps(valor, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    raise TypeError(f"Valor no admitido en una tabla de la instantánea: {type(valor).__name__}")
+
+
+def _decodificar(tipo: int, datos) -> object:
+    if tipo == _TEXTO:
+        return str(datos, "utf-8")
+    if tipo == _FRAGMENTO:
+        return Fragmento(datos)
+    if tipo == _TUPLA:
+        return tuple(json.loads(bytes(datos)))
+    return None
+
+
+class TablaMapeada:
+    """
+    Lista de cadenas leída del mapa de la instantánea entrada a entrada
+
+    Se comporta como la lista que sustituye: admite asignar posiciones
+    (que se guardan aparte) y añadir al final. Con `memorizar`, cada
+    entrada se decodifica una sola vez; conviene en las tablas de valores
+    muy repetidos, como las cadenas internadas.
+    """
+
+    __slots__ = ("_desfases", "_datos", "_tipos", "_n", "_cambios", "_nuevas", "_memoria")
+
+    def __init__(self, desfases: np.ndarray, datos: memoryview, tipos: np.ndarray,
+                 memorizar: bool = False):
+        self._desfases = desfases
+        self._datos = datos
+        self._tipos = tipos
+        self._n = len(tipos)
+        self._cambios: Dict[int, object] = {}
+        self._nuevas: List = []
+        self._memoria: Optional[Dict[int, object]] = {} if memorizar else None
+
+    def __len__(self) -> int:
+        return self._n + len(self._nuevas)
+
+    def __getitem__(self, indice: int):
+        if indice < 0:
+            indice += len(self)
+        if indice >= self._n:
+            return self._nuevas[indice - self._n]
+        if indice < 0:
+            raise IndexError(indice)
+        if self._cambios and indice in self._cambios:
+            return self._cambios[indice]
+        memoria = self._memoria
+        if memoria is not None and indice in memoria:
+            return memoria[indice]
+        inicio, fin = self._desfases[indice:indice + 2].tolist()
+        valor = _decodificar(int(self._tipos[indice]), self._datos[inicio:fin])
+        if memoria is not None:
+            memoria[indice] = valor
+        return valor
+
+    def __setitem__(self, indice: int, valor) -> None:
+        if indice < 0:
+            indice += len(self)
+        if indice >= self._n:
+            self._nuevas[indice - self._n] = valor
+        elif indice < 0:
+            raise IndexError(indice)
+        else:
+            self._cambios[indice] = valor
+
+    def __iter__(self) -> Iterator:
+        return (self[indice] for indice in range(len(self)))
+
+    def append(self, valor) -> None:
+        self._nuevas.append(valor)
+
+    def extend(self, valores: Iterable) -> None:
+        self._nuevas.extend(valores)
+
+    def __reduce__(self):
+        # Con spawn (lotes.py) la tabla viaja a otro proceso como lista normal
+        return list, (list(self),)
+
+
+class InternadorMapeado(TablaMapeada):
+    """Internador cuyos valores están en la instantánea; el índice inverso se crea al internar"""
+
+    __slots__ = ("_indices",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._indices: Optional[Dict] = None
+
+    @property
+    def valores(self) -> "InternadorMapeado":
+        return self
+
+    def indice(self, valor) -> int:
+        if valor is None:
+            return AUSENTE
+        if self._indices is None:
+            self._indices = {v: i for i, v in enumerate(self)}
+        indice = self._indices.get(valor)
+        if indice is None:
+            indice = self._indices[valor] = len(self)
+            self.append(valor)
+        return indice
+
+    def __reduce__(self):
+        return Internador.de_valores, (list(self),)
+
+
+class PosicionesMapeadas(Mapping):
+    """
+    id de receta -> posición sobre los ids ordenados de la instantánea
+
+    Si los ids son consecutivos la posición se lee directamente; si no, se
+    busca por bisección. Las recetas añadidas después de cargar quedan en
+    un diccionario aparte.
+    """
+
+    __slots__ = ("_ids", "_posiciones", "_base", "_denso", "_nuevas")
+
+    def __init__(self, ids: np.ndarray, posiciones: np.ndarray):
+        self._ids = ids
+        self._posiciones = posiciones
+        self._base = int(ids[0]) if len(ids) else 0
+        self._denso = not len(ids) or int(ids[-1]) - self._base == len(ids) - 1
+        self._nuevas: Dict[int, int] = {}  # ids que no están en la instantánea
+
+    def _mapeada(self, receta_id) -> Optional[int]:
+        """Posición de un id de la instantánea, o None"""
+        if not isinstance(receta_id, (int, np.integer)):
+            return None
+        if self._denso:
+            i = receta_id - self._base
+            return int(self._posiciones[i]) if 0 <= i < len(self._ids) else None
+        i = int(np.searchsorted(self._ids, receta_id))
+        if i < len(self._ids) and self._ids[i] == receta_id:
+            return int(self._posiciones[i])
+        return None
+
+    def get(self, receta_id, defecto=None):
+        posicion = self._mapeada(receta_id)
+        if posicion is None:
+            return self._nuevas.get(receta_id, defecto) if self._nuevas else defecto
+        return posicion
+
+    def __getitem__(self, receta_id) -> int:
+        posicion = self.get(receta_id)
+        if posicion is None:
+            raise KeyError(receta_id)
+        return posicion
+
+    def __contains__(self, receta_id) -> bool:
+        return self.get(receta_id) is not None
+
+    def __setitem__(self, receta_id: int, posicion: int) -> None:
+        # Las recetas de la instantánea no cambian de posición
+        if self._mapeada(receta_id) is None:
+            self._nuevas[receta_id] = posicion
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._nuevas)
+
+    def __iter__(self) -> Iterator[int]:
+        yield from self._ids.tolist()
+        yield from list(self._nuevas)
+
+
+# ==================== ESCRITURA ====================
+
+class _Escritor:
+    """Acumula secciones y las vuelca con la cabecera en un solo fichero"""
+
+    def __init__(self):
+        self.secciones: Dict[str, np.ndarray] = {}
+
+    def array(self, nombre: str, valores) -> None:
+        self.secciones[nombre] = np.ascontiguousarray(valores)
+
+    def tabla(self, nombre: str, valores: Iterable) -> None:
+        tipos, trozos = [], []
+        for valor in valores:
+            tipo, datos = _codificar(valor)
+            tipos.append(tipo)
+            trozos.append(datos)
+        desfases = np.zeros(len(trozos) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in trozos], out=desfases[1:])
+        self.array(f"{nombre}.desfases", desfases)
+        self.array(f"{nombre}.datos", np.frombuffer(b"".join(trozos), dtype=np.uint8))
+        self.array(f"{nombre}.tipos", np.asarray(tipos, dtype=np.uint8))
+
+    def json(self, nombre: str, valor) -> None:
+        datos = json.dumps(valor, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.array(nombre, np.frombuffer(datos, dtype=np.uint8))
+
+    def volcar(self, ruta: str, meta: dict) -> int:
+        """Escribe el fichero de forma atómica y devuelve su tamaño"""
+        # Los desfases dependen de la longitud de la cabecera, que los
+        # contiene: se repite hasta que la cabecera deja de crecer
+        reservado = 0
+        while True:
+            desfase = _alinear(_PREAMBULO.size + reservado)
+            secciones = {}
+            for nombre, valores in self.secciones.items():
+                secciones[nombre] = {"desfase": desfase, "dtype": valores.dtype.str, "n": len(valores)}
+                desfase = _alinear(desfase + valores.nbytes)
+            cabecera = json.dumps({"meta": meta, "secciones": secciones},
+                                  ensure_ascii=False).encode("utf-8")
+            if len(cabecera) <= reservado:
+                break
+            reservado = len(cabecera)
+        cabecera = cabecera.ljust(reservado)
+
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        try:
+            with open(temporal, "wb") as fichero:
+                fichero.write(_PREAMBULO.pack(MAGIA, VERSION_FORMATO, 0, len(cabecera)))
+                fichero.write(cabecera)
+                for nombre, valores in self.secciones.items():
+                    fichero.seek(secciones[nombre]["desfase"])
+                    fichero.write(valores.tobytes())
+                fichero.truncate(desfase)
+                fichero.flush()
+                os.fsync(fichero.fileno())
+            os.replace(temporal, ruta)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        return desfase
+
+
+def _alinear(desfase: int) -> int:
+    return -(-desfase // ALINEACION) * ALINEACION
+
+
+def escribir(ruta: str, recetas: Iterable[dict], productos: List[dict],
+             fragmentos: bool = True) -> dict:
+    """
+    Compila las recetas y los productos en una instantánea en `ruta`
+
+    Construye el catálogo y sus estructuras derivadas igual que el servidor
+    y guarda sus arrays. Sin `fragmentos` no se guarda el JSON de cada
+    receta (el servidor lo codificará al arrancar, si lo usa). Devuelve
+    los metadatos escritos en la cabecera.
+    """
+    indices = _Indices(recetas)
+    catalogo = CatalogoRecetas(indices=indices)
+    almacen = indices.almacen
+    escritor = _Escritor()
+
+    for atributo, valores in almacen.columnas().items():
+        escritor.array(f"almacen.{atributo}", valores)
+    escritor.tabla("almacen.cadenas", almacen.cadenas.valores)
+    escritor.tabla("almacen.textos", almacen.textos.valores)
+    escritor.tabla("almacen.nombre", almacen.nombre)
+    escritor.json("almacen.extras", {str(p): extras for p, extras in almacen.extras.items()})
+
+    ids = almacen.ids.vista()
+    orden = np.argsort(ids, kind="stable")
+    escritor.array("indices.ids", ids[orden])
+    escritor.array("indices.posiciones", orden.astype(np.int32))
+    tipos = sorted(indices.por_tipo)
+    escritor.json("indices.tipos", tipos)
+    _grupos(escritor, "indices.por_tipo", [indices.por_tipo[tipo] for tipo in tipos])
+    productos_ids = sorted(indices.por_producto)
+    escritor.array("indices.productos", np.asarray(productos_ids, dtype=np.int64))
+    _grupos(escritor, "indices.por_producto", [indices.por_producto[p] for p in productos_ids])
+    for nombre in ("calorias", "tiempo"):
+        ordenado = getattr(indices, nombre)
+        escritor.array(f"indices.{nombre}.orden", ordenado.orden)
+        escritor.array(f"indices.{nombre}.claves", ordenado.claves)
+
+    derivado_resumenes = ResumenesRecetas(catalogo)
+    resumenes = derivado_resumenes.datos()
+    for nombre in TablaResumenes.COLUMNAS:
+        escritor.array(f"resumenes.{nombre}", getattr(resumenes, nombre))
+    escritor.tabla("resumenes.estilo", resumenes.estilo)
+    escritor.tabla("resumenes.texto", resumenes.texto)
+
+    tabla = AgregadorCarrito(catalogo).datos()
+    for nombre in TablaIngredientes.COLUMNAS:
+        escritor.array(f"carrito.{nombre}", getattr(tabla, nombre))
+    escritor.json("carrito.lineas", list(zip(tabla.lineas_producto, tabla.lineas_nombre,
+                                             tabla.lineas_unidad)))
+
+    busqueda = IndiceBusqueda(catalogo, derivado_resumenes).datos()
+    for nombre in TablaBusqueda.COLUMNAS:
+        escritor.array(f"busqueda.{nombre}", getattr(busqueda, nombre))
+    escritor.json("busqueda.vocabulario", list(busqueda.vocabulario))
+
+    vectores = Recomendador(catalogo, derivado_resumenes).datos()
+    escritor.array("recomendaciones.vectores", vectores.matriz().ravel())
+    escritor.array("recomendaciones.idf", vectores.idf)
+
+    if fragmentos:
+        escritor.tabla("fragmentos", FragmentosRecetas(catalogo).datos())
+    escritor.json("productos", productos)
+
+    meta = {"recetas": len(almacen), "productos": len(productos),
+            "fragmentos": fragmentos, "creada": time.time()}
+    return {**meta, "bytes": escritor.volcar(ruta, meta)}
+
+
+def _grupos(escritor: _Escritor, nombre: str, grupos: List[np.ndarray]) -> None:
+    """Arrays de posiciones concatenados, con los cortes de cada uno"""
+    cortes = np.zeros(len(grupos) + 1, dtype=np.int64)
+    np.cumsum([len(g) for g in grupos], out=cortes[1:])
+    escritor.array(f"{nombre}.cortes", cortes)
+    escritor.array(f"{nombre}.posiciones",
+                   np.concatenate(grupos).astype(np.int32) if grupos else np.empty(0, np.int32))
+
+
+# ==================== LECTURA ====================
+
+class Instantanea:
+    """Instantánea mapeada en memoria; cada sección se lee como array sin copiarla"""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        with open(ruta, "rb") as fichero:
+            self._mapa = mmap.mmap(fichero.fileno(), 0, access=mmap.ACCESS_COPY)
+        if len(self._mapa) < _PREAMBULO.size:
+            raise InstantaneaInvalida(f"{ruta}: fichero demasiado corto")
+        magia, version, _, longitud = _PREAMBULO.unpack_from(self._mapa)
+        if magia != MAGIA:
+            raise InstantaneaInvalida(f"{ruta}: no es una instantánea del catálogo")
+        if version != VERSION_FORMATO:
+            raise InstantaneaInvalida(
+                f"{ruta}: formato {version}, se esperaba {VERSION_FORMATO}; hay que reconstruirla"
+            )
+        cabecera = json.loads(bytes(self._mapa[_PREAMBULO.size:_PREAMBULO.size + longitud]))
+        self.meta: dict = cabecera["meta"]
+        self._secciones: Dict[str, dict] = cabecera["secciones"]
+        self._vista = memoryview(self._mapa)
+
+    def __contains__(self, nombre: str) -> bool:
+        return nombre in self._secciones or f"{nombre}.tipos" in self._secciones
+
+    def array(self, nombre: str) -> np.ndarray:
+        seccion = self._secciones[nombre]
+        return np.frombuffer(self._mapa, dtype=np.dtype(seccion["dtype"]),
+                             count=seccion["n"], offset=seccion["desfase"])
+
+    def tabla(self, nombre: str, clase=TablaMapeada, memorizar: bool = False) -> TablaMapeada:
+        datos = self._secciones[f"{nombre}.datos"]
+        vista = self._vista[datos["desfase"]:datos["desfase"] + datos["n"]]
+        return clase(self.array(f"{nombre}.desfases"), vista, self.array(f"{nombre}.tipos"),
+                     memorizar=memorizar)
+
+    def json(self, nombre: str):
+        return json.loads(self.array(nombre).tobytes())
+
+    def _grupos(self, nombre: str) -> List[np.ndarray]:
+        cortes = self.array(f"{nombre}.cortes").tolist()
+        posiciones = self.array(f"{nombre}.posiciones")
+        return [posiciones[inicio:fin] for inicio, fin in zip(cortes, cortes[1:])]
+
+    def posiciones(self) -> PosicionesMapeadas:
+        return PosicionesMapeadas(self.array("indices.ids"), self.array("indices.posiciones"))
+
+    # ---------- Estructuras ----------
+
+    def catalogo(self) -> CatalogoRecetas:
+        """Catálogo de recetas sobre los arrays de la instantánea"""
+        almacen = AlmacenRecetas.desde_columnas(
+            {atributo: self.array(f"almacen.{atributo}") for atributo in COLUMNAS},
+            cadenas=self.tabla("almacen.cadenas", InternadorMapeado, memorizar=True),
+            textos=self.tabla("almacen.textos", InternadorMapeado),
+            nombre=self.tabla("almacen.nombre"),
+            extras={int(p): extras for p, extras in self.json("almacen.extras").items()},
+        )
+        indices = _Indices.ensamblar(
+            almacen,
+            self.posiciones(),
+            por_tipo=dict(zip(self.json("indices.tipos"), self._grupos("indices.por_tipo"))),
+            por_producto=dict(zip(self.array("indices.productos").tolist(),
+                                  self._grupos("indices.por_producto"))),
+            calorias=(self.array("indices.calorias.orden"), self.array("indices.calorias.claves")),
+            tiempo=(self.array("indices.tiempo.orden"), self.array("indices.tiempo.claves")),
+        )
+        return CatalogoRecetas(indices=indices)
+
+    def productos(self) -> List[dict]:
+        return self.json("productos")
+
+    def resumenes(self) -> TablaResumenes:
+        return TablaResumenes.desde_columnas(
+            {nombre: self.array(f"resumenes.{nombre}") for nombre in TablaResumenes.COLUMNAS},
+            estilo=self.tabla("resumenes.estilo"),
+            texto=self.tabla("resumenes.texto"),
+        )
+
+    def tabla_ingredientes(self) -> TablaIngredientes:
+        return TablaIngredientes.desde_columnas(
+            {nombre: self.array(f"carrito.{nombre}") for nombre in TablaIngredientes.COLUMNAS},
+            self.posiciones(),
+            [tuple(linea) for linea in self.json("carrito.lineas")],
+        )
+
+    def busqueda(self) -> TablaBusqueda:
+        return TablaBusqueda.desde_columnas(
+            {nombre: self.array(f"busqueda.{nombre}") for nombre in TablaBusqueda.COLUMNAS},
+            self.json("busqueda.vocabulario"),
+        )
+
+    def vectores(self) -> TablaVectores:
+        return TablaVectores.desde_columnas(
+            {nombre: self.array(f"recomendaciones.{nombre}") for nombre in TablaVectores.COLUMNAS}
+        )
+
+    def fragmentos(self) -> Optional[TablaMapeada]:
+        """JSON de cada receta, o None si la instantánea se construyó sin él"""
+        return self.tabla("fragmentos") if "fragmentos" in self else None
+
+    def sembrar(self, resumenes: DerivadoCatalogo, agregador: DerivadoCatalogo,
+                fragmentos: Optional[DerivadoCatalogo] = None,
+                busqueda: Optional[DerivadoCatalogo] = None,
+                recomendador: Optional[DerivadoCatalogo] = None) -> None:
+        """
+        Entrega a las estructuras derivadas del catálogo cargado de esta
+        instantánea sus datos ya calculados
+        """
+        resumenes.sembrar(self.resumenes())
+        agregador.sembrar(self.tabla_ingredientes())
+        if busqueda is not None:
+            busqueda.sembrar(self.busqueda())
+        if recomendador is not None:
+            recomendador.sembrar(self.vectores())
+        if fragmentos is not None and "fragmentos" in self:
+            fragmentos.sembrar(self.fragmentos())
+
+
+# ==================== EJECUCIÓN ====================
+
+def main():
+    parser = argparse.ArgumentParser(description="Instantánea binaria del catálogo")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    construccion = subcomandos.add_parser("construir", help="Compila el catálogo en una instantánea")
+    construccion.add_argument("fichero", nargs="?", help="Recetas en JSON o NDJSON")
+    construccion.add_argument("--db", help="Base de datos SQLite de la que leer las recetas")
+    construccion.add_argument("--productos", help="Productos en JSON (por defecto, los de ejemplo)")
+    construccion.add_argument("--salida", default="catalogo.inst")
+    construccion.add_argument("--sin-fragmentos", action="store_true",
+                              help="No guarda el JSON de cada receta (fichero más pequeño)")
+    informacion = subcomandos.add_parser("info", help="Muestra la cabecera de una instantánea")
+    informacion.add_argument("instantanea")
+    argumentos = parser.parse_args()
+
+    if argumentos.comando == "info":
+        instantanea = Instantanea(argumentos.instantanea)
+        meta = {**instantanea.meta, "bytes": os.path.getsize(argumentos.instantanea)}
+        print(json.dumps(meta, ensure_ascii=False, indent=2))
+        return
+
+    from productos import PRODUCTOS_EJEMPLO
+    from repositorio import cargar_recetas, leer_recetas
+
+    inicio = time.perf_counter()
+    if argumentos.db:
+        recetas = cargar_recetas(argumentos.db)
+    elif argumentos.fichero:
+        recetas = leer_recetas(argumentos.fichero)
+    else:
+        from main import RECETAS_EJEMPLO
+        recetas = RECETAS_EJEMPLO
+    productos = PRODUCTOS_EJEMPLO
+    if argumentos.productos:
+        with open(argumentos.productos, encoding="utf-8") as fichero:
+            productos = json.load(fichero)
+
+    meta = escribir(argumentos.salida, recetas, productos, not argumentos.sin_fragmentos)
+    print(f"{meta['recetas']} recetas y {meta['productos']} productos en {argumentos.salida} "
+          f"({meta['bytes'] / 2 ** 20:.1f} MB, {time.perf_counter() - inicio:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
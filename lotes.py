@@ -0,0 +1,231 @@
+"""
+SUPERMERCAI - Generación de menús por lotes
+Muchos hogares (y varias semanas por hogar) en una sola petición
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from alergenos import mascara_exclusion
+from catalogo import CatalogoRecetas
+from planificador import PlanificadorMenus, componer_menu
+from recomendaciones import Recomendador
+from resumenes import ResumenesRecetas
+
+# Hogares por tarea enviada a un proceso
+TAMANO_TAREA = 256
+
+# Por debajo de este número de hogares no compensa repartir entre procesos
+MINIMO_PROCESOS = 512
+
+# Procesos del pool como mucho, por muchas CPU que haya
+MAX_PROCESOS = 8
+
+
+def procesos_por_defecto(trabajadores: int = 1) -> int:
+    """CPU repartidas entre los `trabajadores` del servidor, cada uno con su pool"""
+    return max(1, min(MAX_PROCESOS, (os.cpu_count() or 1) // max(1, trabajadores)))
+
+
+def clave_candidatos(preferencias) -> tuple:
+    """
+    Lo que determina los candidatos del planificador
+
+    El presupuesto, los comensales y la marca no cambian qué recetas son
+    candidatas, solo cuáles se eligen; las alergias cuentan como la máscara
+    y las libres que producen, así que "lácteos" y "lactosa" coinciden.
+    Las favoritas cuentan sin orden ni repeticiones.
+    """
+    excluidos, libres = mascara_exclusion(preferencias.alergias, preferencias.estilo_cocina)
+    return (preferencias.objetivo, preferencias.tiempo_cocina, preferencias.estilo_cocina,
+            excluidos, tuple(sorted(libres)), tuple(sorted(set(preferencias.favoritas))))
+
+
+def agrupar(hogares: List[Tuple[int, object, int]]) -> List[List[Tuple[int, object, int]]]:
+    """
+    Tareas de como mucho TAMANO_TAREA hogares (índice, preferencias, semanas)
+    que comparten candidatos; dentro de cada una, los idénticos quedan juntos
+    """
+    grupos: Dict[tuple, list] = {}
+    for hogar in hogares:
+        grupos.setdefault(clave_candidatos(hogar[1]), []).append(hogar)
+
+    tareas = []
+    for grupo in grupos.values():
+        grupo.sort(key=lambda h: (h[1].presupuesto, h[1].num_personas, h[2]))
+        for inicio in range(0, len(grupo), TAMANO_TAREA):
+            tareas.append(grupo[inicio:inicio + TAMANO_TAREA])
+    return tareas
+
+
+def resolver_tarea(planificador: PlanificadorMenus,
+                   tarea: List[Tuple[int, object, int]]) -> List[Tuple[int, Optional[list]]]:
+    """
+    (índice, [(ids de las recetas, coste) por semana] o None) de cada hogar
+
+    Los candidatos se calculan una vez por tarea y cada combinación distinta
+    de presupuesto, comensales y semanas se resuelve una sola vez.
+    """
+    candidatos = planificador.candidatos(tarea[0][1])
+    recetas = planificador.catalogo.todas()
+    resueltos: Dict[tuple, Optional[list]] = {}
+    resultados = []
+    for indice, preferencias, semanas in tarea:
+        clave = (preferencias.presupuesto, preferencias.num_personas, semanas)
+        if clave not in resueltos:
+            elegidas = None
+            if candidatos is not None:
+                elegidas = [
+                    ([recetas.id_en(p) for p in menu], coste)
+                    for menu, coste in planificador.elegir_semanas(preferencias, semanas, candidatos)
+                ]
+            resueltos[clave] = elegidas
+        resultados.append((indice, resueltos[clave]))
+    return resultados
+
+
+# ==================== PROCESOS ====================
+
+_planificador_proceso: Optional[PlanificadorMenus] = None
+_version_proceso: Optional[int] = None  # versión del catálogo cuyos costes tiene el proceso
+
+
+def _iniciar_proceso(planificador: Optional[PlanificadorMenus], recetas: Optional[List[dict]],
+                     version: int) -> None:
+    # Con fork el planificador se hereda ya construido; si no, se reconstruye
+    global _planificador_proceso, _version_proceso
+    if planificador is None:
+        catalogo = CatalogoRecetas(recetas)
+        resumenes = ResumenesRecetas(catalogo)
+        planificador = PlanificadorMenus(catalogo, resumenes, Recomendador(catalogo, resumenes))
+    _planificador_proceso = planificador
+    _version_proceso = version
+
+
+def _copiar_costes(planificador: PlanificadorMenus, costes: Tuple[np.ndarray, np.ndarray]) -> None:
+    """Pone el planificador del proceso al día con los costes de otra versión (mismas recetas)"""
+    coste, coste_racion = costes
+    tabla = planificador.resumenes.tabla()
+    cambiadas = np.flatnonzero(tabla.coste_racion != coste_racion).tolist()
+    tabla.coste[:] = coste
+    tabla.coste_racion[:] = coste_racion
+    planificador.datos().actualizar_costes(cambiadas, tabla)
+
+
+def _resolver_en_proceso(tarea, version: int, costes: Optional[Tuple[np.ndarray, np.ndarray]]):
+    global _version_proceso
+    if costes is not None and version != _version_proceso:
+        _copiar_costes(_planificador_proceso, costes)
+        _version_proceso = version
+    return resolver_tarea(_planificador_proceso, tarea)
+
+
+class GeneradorLotes:
+    """
+    Reparte los lotes de hogares entre un pool de procesos
+
+    El pool se crea con el primer lote de al menos MINIMO_PROCESOS hogares,
+    así que los trabajadores que no reciben lotes grandes no tienen procesos.
+    Con fork (si no hay otros hilos) los procesos comparten la memoria del
+    planificador ya construido; si no, spawn, que les copia el catálogo
+    (fork con hilos puede heredar bloqueos tomados). Los cambios solo de
+    precios no lo rehacen: mientras la versión del catálogo no sea la del
+    pool, cada tarea lleva las columnas de coste actuales y cada proceso se
+    pone al día con ellas una vez. Solo un cambio de recetas obliga a crear
+    otro pool.
+    """
+
+    def __init__(self, planificador: PlanificadorMenus, procesos: Optional[int] = None):
+        self.planificador = planificador
+        self.procesos = procesos or procesos_por_defecto()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._version = None  # versión del catálogo con la que se creó el pool
+        self._obsoleto = False
+        self._costes: Optional[tuple] = None
+        planificador.catalogo.suscribir(self._al_cambiar)
+
+    def _al_cambiar(self, version: int, posiciones: Optional[List[int]],
+                    solo_precios: bool = False) -> None:
+        if not solo_precios:
+            self._obsoleto = True
+
+    def _pool_actual(self) -> ProcessPoolExecutor:
+        if self._pool is None or self._obsoleto:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+            self.planificador.datos()  # construido antes de bifurcar
+            if self.planificador.recomendador is not None:
+                self.planificador.recomendador.datos()
+            version = self.planificador.catalogo.version
+            if "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1:
+                contexto = multiprocessing.get_context("fork")
+                argumentos = (self.planificador, None, version)
+            else:
+                contexto = multiprocessing.get_context("spawn")
+                argumentos = (None, self.planificador.catalogo.todas(), version)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.procesos, mp_context=contexto,
+                initializer=_iniciar_proceso, initargs=argumentos,
+            )
+            self._version, self._obsoleto, self._costes = version, False, None
+        return self._pool
+
+    def _costes_actuales(self) -> Tuple[int, Optional[tuple]]:
+        """Versión del catálogo y, si no es la del pool, sus columnas de coste"""
+        version = self.planificador.catalogo.version
+        if version == self._version:
+            return version, None
+        if self._costes is None or self._costes[0] != version:
+            tabla = self.planificador.resumenes.tabla()
+            # Copias: las tareas se serializan después, en otro hilo
+            self._costes = (version, (tabla.coste.copy(), tabla.coste_racion.copy()))
+        return self._costes
+
+    async def generar(self, hogares: List[Tuple[int, object, int]]
+                      ) -> AsyncIterator[Tuple[int, Optional[List[dict]]]]:
+        """
+        (índice, menús de cada semana o None) por hogar, según van terminando
+
+        Los lotes pequeños o con un solo proceso se resuelven en el propio
+        proceso, cediendo el bucle de eventos entre tareas.
+        """
+        tareas = agrupar(hogares)
+        presupuestos = {indice: preferencias.presupuesto for indice, preferencias, _ in hogares}
+
+        if self.procesos <= 1 or len(hogares) < MINIMO_PROCESOS:
+            for tarea in tareas:
+                for resultado in self._componer(resolver_tarea(self.planificador, tarea), presupuestos):
+                    yield resultado
+                await asyncio.sleep(0)
+            return
+
+        loop = asyncio.get_running_loop()
+        pool = self._pool_actual()
+        version, costes = self._costes_actuales()
+        pendientes = [loop.run_in_executor(pool, _resolver_en_proceso, tarea, version, costes)
+                      for tarea in tareas]
+        for terminada in asyncio.as_completed(pendientes):
+            for resultado in self._componer(await terminada, presupuestos):
+                yield resultado
+
+    def _componer(self, resueltos, presupuestos: Dict[int, float]):
+        catalogo = self.planificador.catalogo
+        for indice, elegidas in resueltos:
+            if elegidas is None:
+                yield indice, None
+                continue
+            yield indice, [
+                componer_menu(catalogo.obtener_varias(ids), coste, presupuestos[indice])
+                for ids, coste in elegidas
+            ]
+
+    def cerrar(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
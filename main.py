@@ -3,21 +3,47 @@ SUPERMERCAI - Generador de Menús Semanales
 FastAPI Backend Application
 """
 
-from fastapi import FastAPI, Request, HTTPException, Body
+from fastapi import FastAPI, Request, HTTPException, Body, Query
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import Optional, List
+import base64
+import os
 import uvicorn
 
+from alergenos import BITS_ALERGENOS, DIETAS, mascara_exclusion
+from busqueda import IndiceBusqueda, tokenizar
+from cache import (Anotado, CacheRespuestas, Ensamblado, RespuestaJSON, clave_preferencias,
+                   codificar_json, respuesta_cacheada)
+from carrito import AgregadorCarrito
+from catalogo import CatalogoRecetas
+from fragmentos import FragmentosRecetas
+from generador import crear_servicio
+from instantanea import Instantanea
+from lotes import GeneradorLotes
+from metricas import REGISTRO, MiddlewareMetricas, PerfiladorMuestreo, tramo
+from repositorio import RepositorioMemoria, cargar_recetas
+from planificador import PlanificadorMenus
+from precios import (DiarioFeeds, LectorFeed, MiddlewareDiario, PreciosProductos, aplicar_feed,
+                     formato_de, leer_feed)
+from productos import PRODUCTOS_EJEMPLO, CatalogoProductos
+from recomendaciones import Recomendador
+from resumenes import ResumenesRecetas
+from usuarios import MENUS_POR_USUARIO, AlmacenUsuarios
+
 # Inicializar FastAPI
 app = FastAPI(
     title="SupermercAI",
     description="API para generación de menús semanales personalizados",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=RespuestaJSON
 )
 
+# Latencia, peticiones y errores por ruta, expuestos en /metrics
+app.add_middleware(MiddlewareMetricas, registro=REGISTRO)
+
 # Configurar carpetas estáticas y templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -33,6 +59,28 @@ class UserPreferences(BaseModel):
     presupuesto: float = 50.0
     estilo_cocina: str = "mediterranea"  # "mediterranea", "asiatica", "vegetariana"
     preferencia_marca: str = "marca_blanca"  # "marca_blanca", "otras"
+    favoritas: List[int] = []  # ids de recetas que le gustan; el menú tira hacia ellas
+
+class RegenerarRecetaRequest(BaseModel):
+    """Petición para sustituir una receta del menú"""
+    dia: int
+    preferencias: UserPreferences
+    receta_id: Optional[int] = None  # receta que se sustituye
+    tipo_comida: Optional[str] = None  # por defecto, el de receta_id
+    menu: List[int] = []  # ids de todas las recetas del menú actual
+    alternativas: int = Field(1, ge=1, le=20)  # sustitutas a devolver, de mejor a peor
+
+class HogarLote(BaseModel):
+    """Un hogar dentro de un lote de menús"""
+    hogar: Optional[str] = None  # identificador del socio; por defecto, su posición
+    preferencias: UserPreferences
+    semanas: Optional[int] = Field(None, ge=1, le=12)  # por defecto, las del lote
+
+class LoteMenusRequest(BaseModel):
+    """Menús para muchos hogares en una sola petición"""
+    hogares: List[HogarLote] = Field(..., min_length=1, max_length=50_000)
+    semanas: int = Field(1, ge=1, le=12)
+    solo_ids: bool = False  # recetas como ids en lugar de completas
 
 class Recipe(BaseModel):
     """Modelo de receta individual"""
@@ -414,6 +462,202 @@ RECETAS_EJEMPLO = [
     }
 ]
 
+# Con SUPERMERCAI_INSTANTANEA el catálogo de recetas y productos se mapea de esa
+# instantánea binaria (creada con `python instantanea.py construir`) sin
+# deserializar nada. Con SUPERMERCAI_DB las recetas se leen al arrancar de esa
+# base de datos SQLite (creada con `python repositorio.py importar`); si no, se
+# usan las recetas de ejemplo. Las rutas consultan el repositorio en memoria,
+# que sirve el catálogo indexado y ve al momento sus cambios (p. ej. los feeds
+# de precios).
+RUTA_INSTANTANEA = os.environ.get("SUPERMERCAI_INSTANTANEA")
+RUTA_BD = os.environ.get("SUPERMERCAI_DB")
+instantanea = Instantanea(RUTA_INSTANTANEA) if RUTA_INSTANTANEA else None
+
+
+if instantanea is not None:
+    catalogo = instantanea.catalogo()
+    lista_productos = instantanea.productos()
+else:
+    catalogo = CatalogoRecetas(cargar_recetas(RUTA_BD) if RUTA_BD else RECETAS_EJEMPLO)
+    lista_productos = PRODUCTOS_EJEMPLO
+resumenes = ResumenesRecetas(catalogo)
+# JSON de cada receta codificado una vez (SUPERMERCAI_FRAGMENTOS=0 lo desactiva
+# para ahorrar la memoria que ocupa)
+fragmentos = None
+if os.environ.get("SUPERMERCAI_FRAGMENTOS", "1") != "0":
+    fragmentos = FragmentosRecetas(catalogo)
+repositorio = RepositorioMemoria(catalogo, resumenes, fragmentos)
+recomendador = Recomendador(catalogo, resumenes)
+planificador = PlanificadorMenus(catalogo, resumenes, recomendador)
+busqueda = IndiceBusqueda(catalogo, resumenes)
+productos = CatalogoProductos(lista_productos)
+agregador_carrito = AgregadorCarrito(catalogo, productos)
+# Precio por unidad de cada producto; los feeds de precios lo cambian y
+# recalculan las recetas que usan esos productos
+precios = PreciosProductos(catalogo, productos)
+if instantanea is not None:
+    instantanea.sembrar(resumenes, agregador_carrito, fragmentos, busqueda, recomendador)
+# Sus procesos se crean con el primer lote grande; servidor.py reparte las CPU
+# entre sus trabajadores
+generador_lotes = GeneradorLotes(planificador)
+
+# Con SUPERMERCAI_GENERADOR ("simulado" u "openai") los menús se piden a un modelo
+# de lenguaje, con el catálogo como respaldo; sin definir, solo se usa el catálogo
+servicio_generacion = None
+if os.environ.get("SUPERMERCAI_GENERADOR"):
+    servicio_generacion = crear_servicio(
+        os.environ["SUPERMERCAI_GENERADOR"], planificador, lista_productos,
+        os.environ.get("SUPERMERCAI_CACHE_GENERADOS") or None,
+    )
+
+
+def _recetas_generadas(recetas_ids: List[int]) -> dict:
+    """Recetas de menús generados (fuera del catálogo) de entre esos ids"""
+    if servicio_generacion is None:
+        return {}
+    generadas = servicio_generacion.recetas.en(recetas_ids)
+    return {rid: receta for rid, receta in generadas.items() if catalogo.posicion(rid) is None}
+
+
+# Favoritas, menús y carrito de cada usuario. Se leen de una LRU; con
+# SUPERMERCAI_USUARIOS se escriben además en esa base de datos SQLite, por
+# lotes y fuera de las peticiones (sin definir, solo en memoria)
+RUTA_USUARIOS = os.environ.get("SUPERMERCAI_USUARIOS")
+usuarios = AlmacenUsuarios(RUTA_USUARIOS or None)
+
+
+def _recalcular_carrito(guardado: dict) -> dict:
+    """Carrito guardado calculado de nuevo con los precios actuales"""
+    recetas_ids = guardado["recetas_ids"]
+    return {**guardado, "carrito": agregador_carrito.agregar(
+        recetas_ids, guardado["preferencia_marca"], _recetas_generadas(recetas_ids))}
+
+
+def _recalcular_menu(guardado: dict) -> dict:
+    """Menú guardado con su coste recalculado con los precios actuales"""
+    preferencias = guardado["preferencias"]
+    coste = planificador.coste_recetas(guardado["recetas"], preferencias["num_personas"],
+                                       _recetas_generadas(guardado["recetas"]))
+    return {**guardado, "costo_total": round(coste, 2),
+            "dentro_presupuesto": coste <= preferencias["presupuesto"]}
+
+
+usuarios.seguir_catalogo(catalogo, _recalcular_carrito, _recalcular_menu)
+
+# Con SUPERMERCAI_PRECIOS se aplica al arrancar ese feed de precios (.csv o NDJSON)
+RUTA_PRECIOS = os.environ.get("SUPERMERCAI_PRECIOS")
+if RUTA_PRECIOS:
+    aplicar_feed(precios, leer_feed(RUTA_PRECIOS))
+# Feeds de POST /api/precios; servidor.py lo comparte entre sus trabajadores para
+# que cada feed llegue a todos
+diario_precios = DiarioFeeds(precios)
+app.add_middleware(MiddlewareDiario, diario=diario_precios)
+
+# Respuestas ya codificadas. Un feed de precios quita solo las que incluyen
+# recetas afectadas (las claves no llevan la versión del catálogo para que el
+# resto siga valiendo); cualquier otro cambio del catálogo la vacía
+cache_respuestas = CacheRespuestas(max_entradas=2048, max_bytes=128 * 1024 * 1024, ttl=600)
+catalogo.suscribir(cache_respuestas.invalidar)
+
+# Con SUPERMERCAI_PERFILADOR=1 se puede activar en caliente el perfilador por
+# muestreo (/api/perfil/iniciar y /api/perfil/detener); si no, esas rutas dan 404
+perfilador = PerfiladorMuestreo() if os.environ.get("SUPERMERCAI_PERFILADOR") == "1" else None
+
+
+def _metricas_aplicacion():
+    """Ocupación del catálogo, la caché de respuestas y el generador para /metrics"""
+    yield ("supermercai_recetas", "gauge", "Recetas en el catálogo", {}, len(catalogo))
+    cache = cache_respuestas.estadisticas()
+    yield ("supermercai_cache_entradas", "gauge", "Respuestas en la caché", {}, cache["entradas"])
+    yield ("supermercai_cache_bytes", "gauge", "Bytes de las respuestas en la caché", {}, cache["bytes"])
+    for evento in ("aciertos", "fallos", "expulsiones"):
+        yield ("supermercai_cache_eventos_total", "counter", "Aciertos, fallos y expulsiones de la caché",
+               {"evento": evento}, cache[evento])
+    if servicio_generacion is not None:
+        generacion = servicio_generacion.estadisticas()
+        for resultado, valor in servicio_generacion.contadores.items():
+            yield ("supermercai_generacion_total", "counter", "Menús pedidos al generador por resultado",
+                   {"resultado": resultado}, valor)
+        yield ("supermercai_generacion_en_curso", "gauge", "Generaciones en curso", {},
+               generacion["en_curso"])
+    datos_usuarios = usuarios.estadisticas()
+    yield ("supermercai_usuarios", "gauge", "Usuarios en la LRU", {}, datos_usuarios["usuarios"])
+    yield ("supermercai_usuarios_pendientes", "gauge", "Escrituras de usuarios sin volcar", {},
+           datos_usuarios["pendientes"])
+    yield ("supermercai_usuarios_volcados_total", "counter", "Lotes de escrituras de usuarios volcados",
+           {}, datos_usuarios["volcados"])
+    yield ("supermercai_usuarios_filas_total", "counter", "Filas de usuarios escritas en disco", {},
+           datos_usuarios["filas_escritas"])
+
+
+REGISTRO.registrar(_metricas_aplicacion)
+
+
+async def _cerrar():
+    """Al apagar: cancela las generaciones en curso y cierra pools y conexiones"""
+    if servicio_generacion is not None:
+        await servicio_generacion.cerrar()
+    generador_lotes.cerrar()
+    usuarios.cerrar()
+    repositorio.cerrar()
+
+
+app.router.add_event_handler("shutdown", _cerrar)
+
+
+# ==================== PAGINACIÓN ====================
+
+LIMITE_PAGINA_MAXIMO = 500
+CAMPOS_RECETA = frozenset(Recipe.model_fields)
+
+
+def _codificar_cursor(receta_id: Optional[int]) -> Optional[str]:
+    """Cursor opaco que apunta a la receta tras la que empieza la página"""
+    if receta_id is None:
+        return None
+    return base64.urlsafe_b64encode(str(receta_id).encode()).decode().rstrip("=")
+
+
+def _decodificar_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(cursor + relleno).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor no válido")
+
+
+def _parsear_campos(fields: Optional[str]) -> Optional[tuple]:
+    """Campos pedidos en `fields`, siempre con el id; None devuelve la receta completa"""
+    if not fields:
+        return None
+    campos = [c.strip() for c in fields.split(",") if c.strip()]
+    desconocidos = sorted(set(campos) - CAMPOS_RECETA)
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(desconocidos)}")
+    return tuple(dict.fromkeys(["id"] + campos))
+
+
+def _parsear_exclusion(alergias: Optional[str], dieta: Optional[str]) -> int:
+    """Máscara de marcas excluidas por `alergias` (separadas por comas) y `dieta`"""
+    if dieta and dieta not in DIETAS:
+        raise HTTPException(status_code=400, detail=f"Dieta desconocida: {dieta}")
+    excluidos, desconocidas = mascara_exclusion((alergias or "").split(","), dieta)
+    if desconocidas:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Alergias desconocidas: {', '.join(desconocidas)} "
+                   f"(conocidas: {', '.join(BITS_ALERGENOS)})"
+        )
+    return excluidos
+
+
+def _proyectar(receta: dict, campos: Optional[tuple]) -> dict:
+    if campos is None:
+        return receta
+    return {campo: receta[campo] for campo in campos}
+
 
 # ==================== RUTAS ====================
 
@@ -431,119 +675,501 @@ async def hello_api():
         "status": "running"
     }
 
+def _menu_guardado(menu: dict, recetas_ids: Optional[List[int]] = None) -> dict:
+    """Lo que se guarda de un menú generado: las recetas como ids"""
+    return {
+        "recetas": recetas_ids or [receta["id"] for receta in menu["recetas"]],
+        "costo_total": menu["costo_total"],
+        "dentro_presupuesto": menu.get("dentro_presupuesto", True),
+        "preferencias": menu["preferencias"],
+    }
+
 @app.post("/api/generar-menu")
-async def generar_menu(preferencias: UserPreferences):
+async def generar_menu(preferencias: UserPreferences, request: Request,
+                       user_id: Optional[int] = None):
     """
     Genera un menú semanal personalizado basado en las preferencias del usuario
-    
-    En producción, aquí se integraría con:
-    - API de OpenAI para generar recetas con IA
-    - Base de datos de recetas del supermercado
-    - Sistema de recomendación basado en historial
+
+    Con un generador configurado, el menú lo propone el modelo de lenguaje
+    (o su caché) y `origen` indica de dónde viene; si tarda demasiado se
+    responde con el del catálogo. Sin generador, sale del catálogo indexado.
+
+    Con `user_id` el menú se guarda entre los del usuario y, si no se
+    indican `favoritas`, se usan las recetas que ha marcado como favoritas.
     """
-    try:
-        # Simular generación de menú (7 cenas)
-        menu_semanal = []
-        costo_total = 0.0
-        
-        # Seleccionar recetas según preferencias
-        for dia in range(7):
-            # En producción: aquí iría la lógica de IA/ML
-            receta = RECETAS_EJEMPLO[dia % len(RECETAS_EJEMPLO)].copy()
-            receta["dia"] = dia + 1
-            
-            # Calcular costo de ingredientes
-            costo_receta = sum(ing["precio"] for ing in receta["ingredientes"])
-            costo_total += costo_receta
-            
-            menu_semanal.append(receta)
-        
-        return {
-            "success": True,
-            "menu": {
-                "recetas": menu_semanal,
-                "costo_total": round(costo_total, 2),
-                "preferencias": preferencias.dict()
-            }
+    if user_id is not None and not preferencias.favoritas:
+        preferencias.favoritas = await usuarios.favoritas(user_id)
+    datos = preferencias.dict()
+    if servicio_generacion is not None:
+        menu = await servicio_generacion.menu(preferencias)
+        if menu is None:
+            raise HTTPException(
+                status_code=422,
+                detail="No hay recetas compatibles con las preferencias indicadas"
+            )
+        menu = {**menu, "preferencias": datos}
+        if user_id is not None:
+            await usuarios.guardar_menu(user_id, _menu_guardado(menu))
+        return RespuestaJSON({"success": True, "menu": menu})
+
+    clave = ("menu", clave_preferencias(datos))
+
+    def construir():
+        try:
+            # 7 días x (desayuno, comida, cena) dentro del presupuesto
+            if fragmentos is not None:
+                elegidas = planificador.elegir_semanas(preferencias)
+                with tramo("menu.fragmentos"):
+                    menu = elegidas and fragmentos.menu(*elegidas[0], preferencias.presupuesto)
+            else:
+                menu = planificador.planificar(preferencias)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        if menu is None:
+            raise HTTPException(
+                status_code=422,
+                detail="No hay recetas compatibles con las preferencias indicadas"
+            )
+
+        # Lo que se guarda del menú va con la entrada, para no releer el cuerpo
+        if fragmentos is not None:
+            menu["preferencias"] = datos
+            posiciones = elegidas[0][0]
+            recetas = catalogo.todas()
+            guardado = _menu_guardado(menu, [recetas.id_en(posicion) for posicion in posiciones])
+            return Anotado(Ensamblado(success=True, menu=menu), posiciones, guardado)
+        menu = {
+            "recetas": menu["recetas"],
+            "costo_total": menu["costo_total"],
+            "dentro_presupuesto": menu["dentro_presupuesto"],
+            "preferencias": datos
         }
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return Anotado({"success": True, "menu": menu},
+                       [catalogo.posicion(receta["id"]) for receta in menu["recetas"]],
+                       _menu_guardado(menu))
+
+    entrada = cache_respuestas.obtener_o_crear(clave, construir)
+    if user_id is not None:
+        await usuarios.guardar_menu(user_id, entrada.datos)
+    return respuesta_cacheada(request, entrada)
+
+@app.post("/api/generar-menus-lote")
+async def generar_menus_lote(lote: LoteMenusRequest):
+    """
+    Genera los menús de muchos hogares, de una o varias semanas cada uno
+
+    Los hogares con preferencias equivalentes comparten candidatos y los
+    idénticos se resuelven una sola vez. La respuesta es NDJSON: una línea
+    por hogar, en el orden en que terminan, con `hogar` y `semanas` (o
+    `error` si no hay recetas compatibles).
+    """
+    hogares = [
+        (indice, hogar.preferencias, hogar.semanas or lote.semanas)
+        for indice, hogar in enumerate(lote.hogares)
+    ]
+
+    def linea(indice: int, menus: Optional[list]) -> bytes:
+        hogar = lote.hogares[indice].hogar
+        resultado = {"hogar": hogar if hogar is not None else str(indice)}
+        if menus is None:
+            resultado["error"] = "No hay recetas compatibles con las preferencias indicadas"
+        else:
+            if lote.solo_ids:
+                menus = [{**menu, "recetas": [r["id"] for r in menu["recetas"]]} for menu in menus]
+            resultado["semanas"] = [{"semana": i + 1, **menu} for i, menu in enumerate(menus)]
+        return codificar_json(resultado) + b"\n"
+
+    async def lineas():
+        async for indice, menus in generador_lotes.generar(hogares):
+            yield linea(indice, menus)
+
+    return StreamingResponse(lineas(), media_type="application/x-ndjson")
 
 @app.post("/api/regenerar-receta")
-async def regenerar_receta(dia: int, preferencias: UserPreferences):
+async def regenerar_receta(peticion: RegenerarRecetaRequest):
     """
     Regenera una receta individual del menú
+
+    Devuelve la mejor receta del mismo tipo de comida que no esté ya en el
+    menú y quepa en el presupuesto que deja el resto. Con `alternativas` > 1
+    incluye también las siguientes mejores, para cambiar de nuevo sin otra
+    petición; cada una lleva el coste total del menú con ella.
     """
+    tipo_comida = peticion.tipo_comida
+    if tipo_comida is None:
+        actual = None
+        if peticion.receta_id is not None:
+            actual = (await repositorio.obtener(peticion.receta_id)
+                      or _recetas_generadas([peticion.receta_id]).get(peticion.receta_id))
+        if actual is None:
+            raise HTTPException(status_code=400, detail="Indica tipo_comida o una receta_id existente")
+        tipo_comida = actual["tipo_comida"]
+
     try:
-        # Seleccionar una receta diferente
-        receta_nueva = RECETAS_EJEMPLO[(dia + 1) % len(RECETAS_EJEMPLO)].copy()
-        receta_nueva["dia"] = dia
-        
-        return {
-            "success": True,
-            "receta": receta_nueva
-        }
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        sustitutos = planificador.sustitutos(
+            peticion.preferencias, tipo_comida, peticion.menu,
+            peticion.receta_id, peticion.alternativas, _recetas_generadas(peticion.menu),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    if not sustitutos:
+        raise HTTPException(
+            status_code=422,
+            detail="No hay otras recetas compatibles con las preferencias indicadas"
+        )
 
-@app.post("/api/agregar-a-carrito")
-async def agregar_a_carrito(recetas_ids: List[int] = Body(..., embed=True)):
-    carrito = {}
+    alternativas = [
+        {**sustituto, "receta": {**sustituto["receta"], "dia": peticion.dia}}
+        for sustituto in sustitutos
+    ]
+    return RespuestaJSON({
+        "success": True,
+        "receta": alternativas[0]["receta"],
+        "costo_total": alternativas[0]["costo_total"],
+        "dentro_presupuesto": alternativas[0]["dentro_presupuesto"],
+        "alternativas": alternativas
+    })
 
-    for receta_id in recetas_ids:
-        receta = next((r for r in RECETAS_EJEMPLO if r["id"] == receta_id), None)
-        if not receta:
-            continue
-
-        for ing in receta["ingredientes"]:
-            key = str(ing["producto_id"])
-            if key in carrito:
-                carrito[key]["cantidad"] += ing["cantidad"]
-                carrito[key]["precio"] += ing["precio"]
-                # (opcional) registrar en qué recetas aparece:
-                carrito[key]["recetas"].append(receta_id)
-            else:
-                carrito[key] = {
-                    "producto_id": ing["producto_id"],
-                    "nombre": ing["nombre"],
-                    "cantidad": ing["cantidad"],
-                    "unidad": ing["unidad"],
-                    "precio": ing["precio"],
-                    "recetas": [receta_id],
-                }
 
-    items_carrito = list(carrito.values())
-    total = round(sum(item["precio"] for item in items_carrito), 2)
-    return {"success": True, "carrito": {"items": items_carrito, "total": total, "num_items": len(items_carrito)}}
+@app.post("/api/agregar-a-carrito")
+async def agregar_a_carrito(
+    recetas_ids: List[int] = Body(..., embed=True),
+    preferencia_marca: str = Body("marca_blanca", embed=True),
+    user_id: Optional[int] = Body(None, embed=True),
+):
+    """
+    Convierte las recetas del menú en líneas del carrito
+
+    Cada línea agrupa un producto en una unidad canónica (g, ml o unidad)
+    e indica en qué recetas aparece. `compra` son los envases más baratos
+    que cubren esas cantidades según `preferencia_marca`, y `total` su precio.
+    Con `user_id` el carrito pasa a ser el del usuario.
+    """
+    carrito = agregador_carrito.agregar(recetas_ids, preferencia_marca, _recetas_generadas(recetas_ids))
+    if user_id is not None:
+        await usuarios.guardar_carrito(user_id, {
+            "recetas_ids": recetas_ids,
+            "preferencia_marca": preferencia_marca,
+            "carrito": carrito,
+        })
+    return RespuestaJSON({"success": True, "carrito": carrito})
 
 
 @app.get("/api/receta/{receta_id}")
-async def obtener_receta(receta_id: int):
+async def obtener_receta(receta_id: int, request: Request):
     """Obtiene los detalles completos de una receta"""
-    receta = next((r for r in RECETAS_EJEMPLO if r["id"] == receta_id), None)
-    
-    if not receta:
-        raise HTTPException(status_code=404, detail="Receta no encontrada")
-    
-    return {"success": True, "receta": receta}
+    async def construir():
+        receta = await repositorio.obtener(receta_id)
+        
+        if not receta:
+            raise HTTPException(status_code=404, detail="Receta no encontrada")
+        
+        return Anotado({"success": True, "receta": receta}, [catalogo.posicion(receta_id)])
+
+    clave = ("receta", receta_id)
+    return respuesta_cacheada(request, await cache_respuestas.obtener_o_crear_async(clave, construir))
+
+async def _favoritas_usuario(user_id: int, despues_de: Optional[int], limite: int,
+                            campos: Optional[tuple], formato: str, excluidos: int):
+    """Recetas favoritas de un usuario con los filtros y la paginación de recetas-guardadas"""
+    ids = await usuarios.favoritas(user_id)
+    compatibles = resumenes.tabla().compatibles(excluidos) if excluidos else None
+    ids = [
+        receta_id for receta_id in ids
+        if (posicion := catalogo.posicion(receta_id)) is not None
+        and (compatibles is None or compatibles[posicion])
+    ]
+    inicio = 0
+    if despues_de is not None:
+        if despues_de not in ids:
+            raise HTTPException(status_code=400, detail="Cursor no válido")
+        inicio = ids.index(despues_de) + 1
+
+    if formato == "ndjson":
+        async def lineas():
+            for desde in range(inicio, len(ids), LIMITE_PAGINA_MAXIMO):
+                for receta in await repositorio.obtener_varias(ids[desde:desde + LIMITE_PAGINA_MAXIMO]):
+                    yield codificar_json(_proyectar(receta, campos)) + b"\n"
+
+        return StreamingResponse(lineas(), media_type="application/x-ndjson")
+
+    pagina = ids[inicio:inicio + limite]
+    recetas = await repositorio.obtener_varias(pagina)
+    return RespuestaJSON({
+        "success": True,
+        "recetas": [_proyectar(receta, campos) for receta in recetas],
+        "total": len(ids),
+        "siguiente": _codificar_cursor(pagina[-1] if inicio + limite < len(ids) else None),
+    })
 
 @app.get("/api/recetas-guardadas")
-async def recetas_guardadas(user_id: Optional[int] = None):
+async def recetas_guardadas(
+    request: Request,
+    user_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limite: int = Query(50, ge=1, le=LIMITE_PAGINA_MAXIMO),
+    fields: Optional[str] = None,
+    formato: str = Query("json", pattern="^(json|ndjson)$"),
+    alergias: Optional[str] = None,
+    dieta: Optional[str] = None,
+):
     """
     Obtiene las recetas guardadas del usuario
-    En producción: consultar base de datos
+
+    Con `user_id`, sus recetas favoritas, de la más reciente a la más
+    antigua; sin él, todo el catálogo.
+
+    - `cursor`: valor de `siguiente` de la página anterior
+    - `fields`: campos a devolver separados por comas (p. ej. `id,nombre,calorias`)
+    - `formato=ndjson`: transmite una receta por línea desde el cursor hasta el final
+    - `alergias`: alérgenos a excluir separados por comas (p. ej. `gluten,lactosa`)
+    - `dieta`: `vegetariana` o `vegana`
     """
-    return {
-        "success": True,
-        "recetas": RECETAS_EJEMPLO,
-        "total": len(RECETAS_EJEMPLO)
-    }
+    campos = _parsear_campos(fields)
+    despues_de = _decodificar_cursor(cursor)
+    excluidos = _parsear_exclusion(alergias, dieta)
+    if user_id is not None:
+        return await _favoritas_usuario(user_id, despues_de, limite, campos, formato, excluidos)
+
+    if formato == "ndjson":
+        if despues_de is not None and await repositorio.obtener(despues_de) is None:
+            raise HTTPException(status_code=400, detail="Cursor no válido")
+
+        async def lineas():
+            async for receta in repositorio.recorrer(despues_de, excluidos):
+                yield codificar_json(_proyectar(receta, campos)) + b"\n"
+
+        return StreamingResponse(lineas(), media_type="application/x-ndjson")
+
+    async def construir():
+        try:
+            if campos is None:
+                # Recetas completas: se unen ya codificadas
+                recetas, siguiente = await repositorio.pagina_json(despues_de, limite, excluidos)
+            else:
+                recetas, siguiente = await repositorio.pagina(despues_de, limite, excluidos)
+                recetas = [_proyectar(receta, campos) for receta in recetas]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor no válido")
+        return Ensamblado(
+            success=True,
+            recetas=recetas,
+            total=await repositorio.contar(excluidos),
+            siguiente=_codificar_cursor(siguiente)
+        )
+
+    # Sin Anotado: cada página incluye decenas de recetas y casi cualquier
+    # feed toca alguna, así que se quitan con todos los cambios
+    clave = ("recetas-guardadas", despues_de, limite, campos, excluidos)
+    return respuesta_cacheada(request, await cache_respuestas.obtener_o_crear_async(clave, construir))
+
+@app.get("/api/buscar")
+async def buscar_recetas(
+    request: Request,
+    q: Optional[str] = None,
+    productos: Optional[str] = None,
+    tipo_comida: Optional[str] = None,
+    alergias: Optional[str] = None,
+    dieta: Optional[str] = None,
+    limite: int = Query(20, ge=1, le=LIMITE_PAGINA_MAXIMO),
+):
+    """
+    Busca recetas por texto y por los productos que se tienen
+
+    - `q`: palabras a buscar en nombre, descripción e ingredientes, sin
+      importar tildes ni plurales ("calabacin" encuentra "Calabacín")
+    - `productos`: producto_id separados por comas; primero las recetas
+      cuyos productos están casi todos entre ellos
+    - `tipo_comida`, `alergias` y `dieta` filtran los resultados
+
+    Devuelve las recetas por relevancia con su puntuación y el total de
+    recetas que encajan.
+    """
+    if not q and not productos:
+        raise HTTPException(status_code=400, detail="Indica `q`, `productos` o ambos")
+    try:
+        productos_ids = tuple(int(p) for p in (productos or "").split(",") if p.strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="`productos` deben ser ids separados por comas")
+    excluidos = _parsear_exclusion(alergias, dieta)
+
+    def construir():
+        posiciones, puntuaciones, total = busqueda.buscar(
+            q or "", productos_ids, tipo_comida, excluidos, limite
+        )
+        posiciones = posiciones.tolist()
+        if fragmentos is not None:
+            recetas = fragmentos.en(posiciones)
+        else:
+            recetas = [catalogo.todas().receta(posicion) for posicion in posiciones]
+        return Anotado(Ensamblado(
+            success=True,
+            recetas=recetas,
+            puntuaciones=[round(p, 4) for p in puntuaciones.tolist()],
+            total=total,
+        ), posiciones)
+
+    clave = ("buscar", tuple(tokenizar(q)), productos_ids, tipo_comida,
+             excluidos, limite)
+    return respuesta_cacheada(request, cache_respuestas.obtener_o_crear(clave, construir))
+
+@app.get("/api/recomendaciones")
+async def recomendaciones(
+    request: Request,
+    recetas: str,
+    tipo_comida: Optional[str] = None,
+    alergias: Optional[str] = None,
+    dieta: Optional[str] = None,
+    limite: int = Query(10, ge=1, le=LIMITE_PAGINA_MAXIMO),
+):
+    """
+    Recetas parecidas a las que le gustan al usuario
+
+    - `recetas`: ids de las recetas guardadas o que le gustan, separados por comas
+    - `tipo_comida`, `alergias` y `dieta` filtran los resultados
+
+    El parecido combina ingredientes, calorías, tiempo y estilo. Devuelve
+    las recetas de más a menos parecidas (sin las de `recetas`) con su
+    similitud, de 0 a 1.
+    """
+    try:
+        recetas_ids = tuple(sorted({int(r) for r in recetas.split(",") if r.strip()}))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="`recetas` deben ser ids separados por comas")
+    if not recetas_ids:
+        raise HTTPException(status_code=400, detail="Indica al menos una receta en `recetas`")
+    excluidos = _parsear_exclusion(alergias, dieta)
+
+    def construir():
+        resultado = recomendador.recomendar(recetas_ids, tipo_comida, excluidos, limite)
+        if resultado is None:
+            raise HTTPException(status_code=404, detail="Ninguna de las recetas existe")
+        posiciones, similitudes, total = resultado
+        posiciones = posiciones.tolist()
+        if fragmentos is not None:
+            elegidas = fragmentos.en(posiciones)
+        else:
+            elegidas = [catalogo.todas().receta(posicion) for posicion in posiciones]
+        return Anotado(Ensamblado(
+            success=True,
+            recetas=elegidas,
+            similitudes=[round(s, 4) for s in similitudes.tolist()],
+            total=total,
+        ), posiciones)
+
+    clave = ("recomendaciones", recetas_ids, tipo_comida, excluidos, limite)
+    return respuesta_cacheada(request, cache_respuestas.obtener_o_crear(clave, construir))
+
+@app.get("/api/usuarios/{user_id}/favoritas")
+async def favoritas_usuario(user_id: int):
+    """Ids de las recetas favoritas del usuario, de la más reciente a la más antigua"""
+    return {"success": True, "favoritas": await usuarios.favoritas(user_id)}
+
+@app.post("/api/usuarios/{user_id}/favoritas")
+async def marcar_favorita(user_id: int, receta_id: int = Body(..., embed=True)):
+    """Marca una receta como favorita; `nueva` es False si ya lo era"""
+    if catalogo.posicion(receta_id) is None:
+        raise HTTPException(status_code=404, detail="Receta no encontrada")
+    return {"success": True, "nueva": await usuarios.marcar_favorita(user_id, receta_id)}
+
+@app.delete("/api/usuarios/{user_id}/favoritas/{receta_id}")
+async def quitar_favorita(user_id: int, receta_id: int):
+    """Quita una receta de las favoritas del usuario"""
+    if not await usuarios.quitar_favorita(user_id, receta_id):
+        raise HTTPException(status_code=404, detail="La receta no es favorita del usuario")
+    return {"success": True}
+
+@app.get("/api/usuarios/{user_id}/menus")
+async def menus_usuario(user_id: int, limite: int = Query(10, ge=1, le=MENUS_POR_USUARIO)):
+    """Últimos menús generados para el usuario, con las recetas como ids"""
+    return {"success": True, "menus": await usuarios.menus(user_id, limite)}
+
+@app.get("/api/usuarios/{user_id}/carrito")
+async def carrito_usuario(user_id: int):
+    """Último carrito del usuario, con las recetas y la marca con que se creó"""
+    carrito = await usuarios.carrito(user_id)
+    if carrito is None:
+        raise HTTPException(status_code=404, detail="El usuario no tiene carrito")
+    return {"success": True, **carrito}
+
+@app.post("/api/precios")
+async def ingerir_precios(request: Request,
+                          formato: Optional[str] = Query(None, pattern="^(csv|ndjson)$")):
+    """
+    Aplica un feed de precios por producto, en CSV o NDJSON
+
+    Cada línea es `producto_id,precio[,unidad]` (con o sin esa cabecera) o
+    un objeto con esas claves; `precio` es por `unidad` ("kg", "l",
+    "unidad"...) o, sin ella, por la unidad de precio del producto. El
+    formato sale de `formato` o del Content-Type. El cuerpo se lee a trozos
+    según llega y el feed se aplica de una vez al terminar: se recalculan
+    solo las recetas que usan los productos que cambian, y con ellas sus
+    costes, los menús y los carritos. Las líneas con errores se saltan. Con
+    servidor.py el feed llega también a los demás trabajadores.
+    """
+    formato = formato or formato_de(request.headers.get("content-type"))
+    if formato is None:
+        raise HTTPException(status_code=415,
+                            detail="Indica `formato` (csv o ndjson) o un Content-Type text/csv "
+                                   "o application/x-ndjson")
+    lector = LectorFeed(formato)
+    async for trozo in request.stream():
+        lector.alimentar(trozo)
+    lector.terminar()
+    with tramo("precios.aplicar"):
+        resultado = diario_precios.publicar(lector)
+    return {"success": True, **resultado}
+
+@app.get("/api/precios/{producto_id}")
+async def precio_producto(producto_id: int):
+    """Precio por unidad de un producto y cuántas recetas lo usan"""
+    precio = precios.precio(producto_id)
+    if precio is None:
+        raise HTTPException(status_code=404, detail="Producto sin precio")
+    return {"success": True, "producto_id": producto_id, "precio": precio[0], "unidad": precio[1],
+            "recetas": len(catalogo.posiciones_producto(producto_id))}
+
+@app.get("/api/cache/estadisticas")
+async def estadisticas_cache():
+    """Aciertos, fallos y ocupación de la caché de respuestas (y del generador, si lo hay)"""
+    estadisticas = {"success": True, "cache": cache_respuestas.estadisticas()}
+    if servicio_generacion is not None:
+        estadisticas["generacion"] = servicio_generacion.estadisticas()
+    return estadisticas
+
+@app.get("/metrics", include_in_schema=False)
+async def metricas():
+    """Métricas en el formato de texto de Prometheus"""
+    return PlainTextResponse(REGISTRO.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/api/perfil/iniciar", include_in_schema=False)
+async def iniciar_perfil(intervalo_ms: float = Query(5.0, ge=0.5, le=1000)):
+    """Activa el perfilador por muestreo (requiere SUPERMERCAI_PERFILADOR=1)"""
+    if perfilador is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if perfilador.activo:
+        raise HTTPException(status_code=409, detail="El perfilador ya está activo")
+    perfilador.intervalo = intervalo_ms / 1000
+    perfilador.iniciar()
+    return {"success": True, "intervalo_ms": intervalo_ms}
+
+@app.post("/api/perfil/detener", include_in_schema=False)
+async def detener_perfil():
+    """
+    Detiene el perfilador y devuelve las pilas plegadas, listas para
+    flamegraph.pl o speedscope
+    """
+    if perfilador is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not perfilador.activo:
+        raise HTTPException(status_code=409, detail="El perfilador no está activo")
+    return PlainTextResponse(perfilador.detener())
 
 # ==================== EJECUCIÓN ====================
 
+# Desarrollo, con recarga automática; en producción: python servidor.py --workers N
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -0,0 +1,378 @@
+"""
+SUPERMERCAI - Métricas de rendimiento
+Latencia por ruta, tramos con nombre, exposición en formato Prometheus y
+perfilador por muestreo
+"""
+
+import asyncio
+import gc
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# ==================== CONFIGURACIÓN ====================
+
+PREFIJO = "supermercai"
+# Límites superiores (segundos) de los histogramas de latencia
+LIMITES = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIN_RUTA = "sin_ruta"
+
+# (nombre, tipo, ayuda, etiquetas, valor) que devuelve cada recolector
+Muestra = Tuple[str, str, str, Dict[str, str], float]
+
+
+# ==================== HISTOGRAMAS ====================
+
+class Histograma:
+    """Cuentas por intervalo, suma y número de observaciones"""
+
+    __slots__ = ("limites", "cuentas", "suma", "total")
+
+    def __init__(self, limites: Tuple[float, ...] = LIMITES):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)  # el último, por encima del mayor límite
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float) -> None:
+        self.cuentas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    def acumuladas(self) -> Iterator[Tuple[str, int]]:
+        """(le, observaciones menores o iguales) en el orden de Prometheus"""
+        acumulado = 0
+        for limite, cuenta in zip(self.limites, self.cuentas):
+            acumulado += cuenta
+            yield _numero(limite), acumulado
+        yield "+Inf", self.total
+
+
+def _numero(valor: float) -> str:
+    if isinstance(valor, int):
+        return str(valor)
+    if valor != valor:
+        return "NaN"
+    if valor in (float("inf"), float("-inf")):
+        return "+Inf" if valor > 0 else "-Inf"
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+def _etiquetas(etiquetas: Dict[str, str]) -> str:
+    if not etiquetas:
+        return ""
+    partes = []
+    for clave, valor in etiquetas.items():
+        valor = str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+# ==================== REGISTRO ====================
+
+class RegistroMetricas:
+    """
+    Contadores y histogramas de las peticiones y de los tramos con nombre
+
+    Las observaciones llegan del bucle de eventos y de hilos (SQLite,
+    recolectores), así que cada actualización toma un cerrojo; son unas
+    pocas sumas, muy por debajo del coste de cualquier petición.
+    """
+
+    def __init__(self, limites: Tuple[float, ...] = LIMITES):
+        self.limites = limites
+        self._lock = threading.Lock()
+        self._duraciones: Dict[Tuple[str, str], Histograma] = {}
+        self._peticiones: Dict[Tuple[str, str, str], int] = {}
+        self._errores: Dict[Tuple[str, str], int] = {}
+        self._en_curso: Dict[Tuple[str, str], int] = {}
+        self._tramos: Dict[str, Histograma] = {}
+        self._recolectores: List[Callable[[], Iterable[Muestra]]] = []
+
+    # ----- peticiones -----
+
+    def entrar(self, metodo: str, ruta: str) -> None:
+        with self._lock:
+            self._en_curso[metodo, ruta] = self._en_curso.get((metodo, ruta), 0) + 1
+
+    def salir(self, metodo: str, ruta: str, estado: int, duracion: float) -> None:
+        clave = (metodo, ruta)
+        with self._lock:
+            self._en_curso[clave] -= 1
+            histograma = self._duraciones.get(clave)
+            if histograma is None:
+                histograma = self._duraciones[clave] = Histograma(self.limites)
+            histograma.observar(duracion)
+            contador = (metodo, ruta, str(estado))
+            self._peticiones[contador] = self._peticiones.get(contador, 0) + 1
+            if estado >= 500:
+                self._errores[clave] = self._errores.get(clave, 0) + 1
+
+    # ----- tramos -----
+
+    def observar_tramo(self, nombre: str, duracion: float) -> None:
+        with self._lock:
+            histograma = self._tramos.get(nombre)
+            if histograma is None:
+                histograma = self._tramos[nombre] = Histograma(self.limites)
+            histograma.observar(duracion)
+
+    def tramo(self, nombre: str) -> "_Tramo":
+        """Mide el bloque `with` en el histograma del tramo `nombre`"""
+        return _Tramo(self, nombre)
+
+    # ----- exposición -----
+
+    def registrar(self, recolector: Callable[[], Iterable[Muestra]]) -> None:
+        """Añade una función que devuelve muestras calculadas al exponer"""
+        self._recolectores.append(recolector)
+
+    def exponer(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus (0.0.4)"""
+        lineas: List[str] = []
+
+        def cabecera(nombre: str, tipo: str, ayuda: str) -> None:
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+
+        def histogramas(nombre: str, ayuda: str, series) -> None:
+            cabecera(nombre, "histogram", ayuda)
+            for etiquetas, histograma in series:
+                for le, cuenta in histograma.acumuladas():
+                    lineas.append(f"{nombre}_bucket{_etiquetas({**etiquetas, 'le': le})} {cuenta}")
+                lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(histograma.suma)}")
+                lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {histograma.total}")
+
+        with self._lock:
+            duraciones = sorted(self._duraciones.items())
+            peticiones = sorted(self._peticiones.items())
+            errores = sorted(self._errores.items())
+            en_curso = sorted(self._en_curso.items())
+            tramos = sorted(self._tramos.items())
+            # Copias para formatear fuera del cerrojo
+            duraciones = [(clave, _copiar(h)) for clave, h in duraciones]
+            tramos = [(nombre, _copiar(h)) for nombre, h in tramos]
+
+        nombre = f"{PREFIJO}_peticiones_total"
+        cabecera(nombre, "counter", "Peticiones HTTP atendidas por ruta y estado")
+        for (metodo, ruta, estado), valor in peticiones:
+            lineas.append(f"{nombre}{_etiquetas({'metodo': metodo, 'ruta': ruta, 'estado': estado})} {valor}")
+
+        nombre = f"{PREFIJO}_errores_total"
+        cabecera(nombre, "counter", "Peticiones HTTP con estado 5xx o excepción")
+        for (metodo, ruta), valor in errores:
+            lineas.append(f"{nombre}{_etiquetas({'metodo': metodo, 'ruta': ruta})} {valor}")
+
+        nombre = f"{PREFIJO}_peticiones_en_curso"
+        cabecera(nombre, "gauge", "Peticiones HTTP en curso por ruta")
+        for (metodo, ruta), valor in en_curso:
+            lineas.append(f"{nombre}{_etiquetas({'metodo': metodo, 'ruta': ruta})} {valor}")
+
+        histogramas(f"{PREFIJO}_duracion_peticion_segundos",
+                    "Latencia de las peticiones HTTP hasta el último byte",
+                    [({"metodo": metodo, "ruta": ruta}, h) for (metodo, ruta), h in duraciones])
+        histogramas(f"{PREFIJO}_duracion_tramo_segundos",
+                    "Duración de los tramos con nombre del código",
+                    [({"tramo": nombre}, h) for nombre, h in tramos])
+
+        muestras: Dict[str, Tuple[str, str, List[Tuple[Dict[str, str], float]]]] = {}
+        for recolector in (_proceso, *self._recolectores):
+            for nombre, tipo, ayuda, etiquetas, valor in recolector():
+                muestras.setdefault(nombre, (tipo, ayuda, []))[2].append((etiquetas, valor))
+        for nombre, (tipo, ayuda, valores) in muestras.items():
+            cabecera(nombre, tipo, ayuda)
+            for etiquetas, valor in valores:
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {_numero(valor)}")
+
+        return "\n".join(lineas) + "\n"
+
+
+class _Tramo:
+    """Gestor de contexto de `RegistroMetricas.tramo` (más ligero que @contextmanager)"""
+
+    __slots__ = ("registro", "nombre", "inicio")
+
+    def __init__(self, registro: RegistroMetricas, nombre: str):
+        self.registro = registro
+        self.nombre = nombre
+
+    def __enter__(self) -> None:
+        self.inicio = time.perf_counter()
+
+    def __exit__(self, *excepcion) -> None:
+        self.registro.observar_tramo(self.nombre, time.perf_counter() - self.inicio)
+
+
+def _copiar(histograma: Histograma) -> Histograma:
+    copia = Histograma(histograma.limites)
+    copia.cuentas = list(histograma.cuentas)
+    copia.suma, copia.total = histograma.suma, histograma.total
+    return copia
+
+
+def _proceso() -> Iterator[Muestra]:
+    """Memoria residente y recolecciones del recolector de basura"""
+    try:
+        with open("/proc/self/statm") as statm:
+            residente = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        yield (f"{PREFIJO}_memoria_residente_bytes", "gauge",
+               "Memoria residente del proceso", {}, residente)
+    except (OSError, ValueError, IndexError):
+        pass  # fuera de Linux no hay /proc
+    for generacion, estadisticas in enumerate(gc.get_stats()):
+        etiquetas = {"generacion": str(generacion)}
+        yield (f"{PREFIJO}_gc_recolecciones_total", "counter",
+               "Pasadas del recolector de basura por generación", etiquetas,
+               estadisticas["collections"])
+        yield (f"{PREFIJO}_gc_objetos_liberados_total", "counter",
+               "Objetos liberados por el recolector de basura por generación", etiquetas,
+               estadisticas["collected"])
+
+
+# Registro del proceso: lo usan el middleware, /metrics y los tramos de los módulos
+REGISTRO = RegistroMetricas()
+
+
+def tramo(nombre: str):
+    """Mide un bloque `with` en el registro del proceso"""
+    return REGISTRO.tramo(nombre)
+
+
+# ==================== MIDDLEWARE ====================
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI que mide cada petición HTTP hasta su último byte
+
+    La ruta es la plantilla (`/api/receta/{receta_id}`), no la URL, para no
+    crear una serie por receta; las URLs que no casan con ninguna ruta
+    comparten `sin_ruta`.
+    """
+
+    def __init__(self, app, registro: Optional[RegistroMetricas] = None):
+        self.app = app
+        self.registro = registro or REGISTRO
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metodo = scope["method"]
+        ruta = _plantilla(scope)
+        estado = 500
+        self.registro.entrar(metodo, ruta)
+        inicio = time.perf_counter()
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        except asyncio.CancelledError:
+            estado = 499  # el cliente cerró la conexión
+            raise
+        except BaseException:
+            estado = 500
+            raise
+        finally:
+            self.registro.salir(metodo, ruta, estado, time.perf_counter() - inicio)
+
+
+def _plantilla(scope) -> str:
+    """
+    Ruta de la aplicación que atenderá la petición
+
+    Solo compara la expresión regular y el método de cada ruta: `matches()`
+    además convierte los parámetros y cuesta diez veces más.
+    """
+    router = getattr(scope.get("app"), "router", None)
+    if router is None:
+        return SIN_RUTA
+    camino, raiz = scope["path"], scope.get("root_path", "")
+    if raiz and camino.startswith(raiz):
+        camino = camino[len(raiz):]
+    parcial = None
+    for ruta in router.routes:
+        expresion = getattr(ruta, "path_regex", None)
+        if expresion is None or not expresion.match(camino):
+            continue
+        metodos = getattr(ruta, "methods", None)
+        if metodos is None or scope["method"] in metodos:
+            return ruta.path
+        if parcial is None:
+            parcial = ruta.path  # método no permitido
+    return parcial or SIN_RUTA
+
+
+# ==================== PERFILADOR ====================
+
+class PerfiladorMuestreo:
+    """
+    Perfilador por muestreo de las pilas de todos los hilos
+
+    Un hilo aparte lee `sys._current_frames()` cada `intervalo` segundos y
+    cuenta cada pila; `plegadas()` las devuelve en el formato plegado de
+    flamegraph.pl / speedscope (`hilo;archivo:funcion;... muestras`).
+    No instrumenta el código, así que solo cuesta mientras está activo.
+    """
+
+    def __init__(self, intervalo: float = 0.005, profundidad: int = 128):
+        self.intervalo = intervalo
+        self.profundidad = profundidad
+        self.muestras: Counter = Counter()
+        self.lecturas = 0
+        self._hilo: Optional[threading.Thread] = None
+        self._parar = threading.Event()
+
+    @property
+    def activo(self) -> bool:
+        return self._hilo is not None
+
+    def iniciar(self) -> None:
+        if self._hilo is not None:
+            raise RuntimeError("El perfilador ya está activo")
+        self.muestras.clear()
+        self.lecturas = 0
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="perfilador", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> str:
+        """Detiene el muestreo y devuelve las pilas plegadas"""
+        if self._hilo is None:
+            raise RuntimeError("El perfilador no está activo")
+        self._parar.set()
+        self._hilo.join()
+        self._hilo = None
+        return self.plegadas()
+
+    def plegadas(self) -> str:
+        return "".join(f"{pila} {cuenta}\n" for pila, cuenta in self.muestras.most_common())
+
+    def _bucle(self) -> None:
+        propio = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != propio:
+                    self.muestras[self._pila(nombres.get(ident, str(ident)), frame)] += 1
+            self.lecturas += 1
+
+    def _pila(self, hilo: str, frame) -> str:
+        marcos = []
+        while frame is not None and len(marcos) < self.profundidad:
+            codigo = frame.f_code
+            nombre = getattr(codigo, "co_qualname", codigo.co_name)
+            marcos.append(f"{os.path.basename(codigo.co_filename)}:{nombre}")
+            frame = frame.f_back
+        marcos.append(hilo)
+        return ";".join(reversed(marcos))
@@ -0,0 +1,583 @@
+"""
+SUPERMERCAI - Planificador de menús semanales
+Selección de 7 x (desayuno, comida, cena) respetando las preferencias
+"""
+
+import heapq
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from alergenos import mascara_exclusion
+from almacen import AUSENTE
+from catalogo import CatalogoRecetas, DerivadoCatalogo
+from metricas import tramo
+from resumenes import TIEMPO_MAXIMO, ResumenesRecetas, TablaResumenes, coste_receta
+
+
+# ==================== CONFIGURACIÓN ====================
+
+DIAS_SEMANA = 7
+TIPOS_COMIDA = ("desayuno", "comida", "cena")
+
+# Calorías diarias por ración según el objetivo y su reparto entre comidas
+CALORIAS_DIARIAS = {
+    "ganar_masa": 1600,
+    "comer_sano": 1200,
+    "definir": 1000,
+    "adelgazar": 900,
+}
+REPARTO_CALORIAS = {"desayuno": 0.25, "comida": 0.40, "cena": 0.35}
+
+PENALIZACION_ESTILO = 0.5
+PESO_AFINIDAD = 0.5  # lo que mejora la puntuación una receta igual que las favoritas
+TAMANO_CANDIDATOS = 40  # candidatos por criterio y tipo de comida
+ITERACIONES_PRESUPUESTO = 16
+PESO_COSTE_MAXIMO = 1e6
+
+
+# ==================== GRUPOS DE CANDIDATOS ====================
+
+class _Grupo:
+    """
+    Posiciones de recetas que comparten tiempo, dieta, alérgenos y estilo,
+    ordenadas por calorías y por coste por ración
+    """
+
+    __slots__ = ("clase_tiempo", "alergenos", "estilo",
+                 "calorias", "por_calorias", "costes", "por_coste")
+
+    def __init__(self, clave: tuple):
+        self.clase_tiempo, self.alergenos, self.estilo = clave
+        self.calorias: List[int] = []
+        self.por_calorias: List[int] = []
+        self.costes: List[float] = []
+        self.por_coste: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.por_calorias)
+
+    def insertar(self, posicion: int, calorias: int, coste: float) -> None:
+        i = _hueco(self.calorias, self.por_calorias, calorias, posicion)
+        self.calorias.insert(i, calorias)
+        self.por_calorias.insert(i, posicion)
+        i = _hueco(self.costes, self.por_coste, coste, posicion)
+        self.costes.insert(i, coste)
+        self.por_coste.insert(i, posicion)
+
+    def quitar(self, posicion: int, calorias: int, coste: float) -> None:
+        i = bisect_left(self.calorias, calorias)
+        while self.por_calorias[i] != posicion:
+            i += 1
+        del self.calorias[i], self.por_calorias[i]
+        i = bisect_left(self.costes, coste)
+        while self.por_coste[i] != posicion:
+            i += 1
+        del self.costes[i], self.por_coste[i]
+
+    def mas_cercanos(self, objetivo: float, penalizacion: float) -> Iterator[Tuple[float, int]]:
+        """(puntuación, posición) en orden creciente de distancia calórica al objetivo"""
+        derecha = bisect_left(self.calorias, objetivo)
+        izquierda = derecha - 1
+        calorias, posiciones = self.calorias, self.por_calorias
+        while izquierda >= 0 or derecha < len(calorias):
+            if derecha >= len(calorias) or (
+                izquierda >= 0 and objetivo - calorias[izquierda] <= calorias[derecha] - objetivo
+            ):
+                yield abs(calorias[izquierda] - objetivo) / objetivo + penalizacion, posiciones[izquierda]
+                izquierda -= 1
+            else:
+                yield abs(calorias[derecha] - objetivo) / objetivo + penalizacion, posiciones[derecha]
+                derecha += 1
+
+    def mas_baratos(self) -> Iterator[Tuple[float, int]]:
+        return zip(self.costes, self.por_coste)
+
+
+def _hueco(valores: list, posiciones: list, valor, posicion: int) -> int:
+    """Dónde insertar (valor, posicion): los empates quedan en orden de posición, como al construir"""
+    inicio = bisect_left(valores, valor)
+    fin = bisect_right(valores, valor, inicio)
+    if fin == inicio or posiciones[fin - 1] < posicion:
+        return fin
+    return inicio + bisect_left(posiciones[inicio:fin], posicion)
+
+
+class _Grupos:
+    """Grupos por tipo de comida y la clave con la que se indexó cada posición"""
+
+    def __init__(self):
+        self.por_tipo: Dict[str, Dict[tuple, _Grupo]] = {tipo: {} for tipo in TIPOS_COMIDA}
+        self.indexadas: Dict[int, Tuple[str, tuple, int, float]] = {}
+
+    def indexar(self, posicion: int, tipo: str, tabla: TablaResumenes) -> None:
+        """(Re)indexa una posición según los valores actuales de la tabla"""
+        anterior = self.indexadas.pop(posicion, None)
+        if anterior is not None:
+            tipo_anterior, clave, calorias, coste = anterior
+            grupos = self.por_tipo[tipo_anterior]
+            grupos[clave].quitar(posicion, calorias, coste)
+            if not len(grupos[clave]):
+                del grupos[clave]
+
+        if tipo not in self.por_tipo:
+            return
+        clave = (int(tabla.clase_tiempo[posicion]), int(tabla.alergenos[posicion]),
+                 tabla.estilo[posicion])
+        calorias = int(tabla.calorias[posicion])
+        coste = float(tabla.coste_racion[posicion])
+        grupo = self.por_tipo[tipo].get(clave)
+        if grupo is None:
+            grupo = self.por_tipo[tipo][clave] = _Grupo(clave)
+        grupo.insertar(posicion, calorias, coste)
+        self.indexadas[posicion] = (tipo, clave, calorias, coste)
+
+    def actualizar_costes(self, posiciones: List[int], tabla: TablaResumenes) -> None:
+        """
+        Recoge el coste actual de las posiciones, que no cambian de grupo, y
+        reordena por coste de una vez cada grupo afectado
+        """
+        indexadas = self.indexadas
+        afectados = set()
+        for posicion, coste in zip(posiciones, tabla.coste_racion[posiciones].tolist()):
+            anterior = indexadas.get(posicion)
+            if anterior is not None and anterior[3] != coste:
+                tipo, clave, calorias, _ = anterior
+                indexadas[posicion] = (tipo, clave, calorias, coste)
+                afectados.add((tipo, clave))
+        for tipo, clave in afectados:
+            grupo = self.por_tipo[tipo][clave]
+            miembros = np.asarray(grupo.por_coste, dtype=np.int64)
+            costes = tabla.coste_racion[miembros]
+            orden = np.lexsort((miembros, costes))
+            grupo.costes = costes[orden].tolist()
+            grupo.por_coste = miembros[orden].tolist()
+
+
+# ==================== PLANIFICADOR ====================
+
+class PlanificadorMenus(DerivadoCatalogo):
+    """
+    Planificador de menús semanales sobre los resúmenes del catálogo
+
+    Las posiciones de cada tipo de comida se agrupan por tiempo, dieta,
+    alérgenos y estilo. Cada petición descarta grupos enteros según las
+    preferencias, extrae un conjunto acotado de candidatos (los más cercanos
+    al objetivo calórico y los más baratos) y busca con relajación
+    lagrangiana el peso del coste que hace caber el menú en el presupuesto.
+    Con un recomendador, las recetas parecidas a las favoritas del usuario
+    entran también como candidatas y puntúan mejor.
+    Los cambios sueltos del catálogo reindexan solo las posiciones afectadas;
+    los de precios solo reordenan por coste los grupos que las contienen.
+    """
+
+    def __init__(self, catalogo: CatalogoRecetas, resumenes: ResumenesRecetas,
+                 recomendador=None):
+        # Se suscribe después de los resúmenes, así que sus parches ya están aplicados
+        self.resumenes = resumenes
+        self.recomendador = recomendador
+        super().__init__(catalogo)
+
+    def _construir(self) -> _Grupos:
+        """
+        Agrupa todas las posiciones de una vez: ordena cada tipo de comida
+        por (grupo, calorías, posición) y por (grupo, coste, posición), el
+        mismo orden que dejarían las inserciones de una en una
+        """
+        tabla = self.resumenes.tabla()
+        grupos = _Grupos()
+        recetas = self.catalogo.todas()
+        tipos = recetas.tipo.vista()
+        # El estilo internado en el almacén identifica el mismo grupo que el de la tabla
+        estilos = recetas.estilo.vista()
+        for codigo in np.unique(tipos).tolist():
+            tipo = recetas.cadenas[codigo]
+            if tipo not in grupos.por_tipo:
+                continue
+            posiciones = np.flatnonzero(tipos == codigo)
+            clases = tabla.clase_tiempo[posiciones]
+            alergenos = tabla.alergenos[posiciones]
+            codigos_estilo = estilos[posiciones]
+            calorias = tabla.calorias[posiciones]
+            costes = tabla.coste_racion[posiciones]
+            por_calorias = np.lexsort((posiciones, calorias, codigos_estilo, alergenos, clases))
+            por_coste = np.lexsort((posiciones, costes, codigos_estilo, alergenos, clases))
+
+            claves = np.stack([clases[por_calorias], alergenos[por_calorias],
+                               codigos_estilo[por_calorias]]).astype(np.int64)
+            cortes = np.flatnonzero(np.any(claves[:, 1:] != claves[:, :-1], axis=0)) + 1
+            limites = [0, *cortes.tolist(), len(posiciones)]
+            for inicio, fin in zip(limites, limites[1:]):
+                clase, mascara, estilo = claves[:, inicio].tolist()
+                clave = (clase, mascara, recetas.cadenas[estilo] if estilo != AUSENTE else None)
+                grupo = grupos.por_tipo[tipo][clave] = _Grupo(clave)
+                filas = por_calorias[inicio:fin]
+                grupo.calorias = calorias[filas].tolist()
+                grupo.por_calorias = posiciones[filas].tolist()
+                filas = por_coste[inicio:fin]
+                grupo.costes = costes[filas].tolist()
+                grupo.por_coste = posiciones[filas].tolist()
+                grupos.indexadas.update(zip(
+                    grupo.por_calorias,
+                    ((tipo, clave, c, coste) for c, coste in
+                     zip(grupo.calorias, costes[por_calorias[inicio:fin]].tolist())),
+                ))
+        return grupos
+
+    def _parchear(self, grupos: _Grupos, posiciones: List[int]) -> None:
+        tabla = self.resumenes.tabla()
+        recetas = self.catalogo.todas()
+        for posicion in posiciones:
+            grupos.indexar(posicion, recetas.tipo_en(posicion), tabla)
+
+    def _parchear_precios(self, grupos: _Grupos, posiciones: List[int]) -> None:
+        grupos.actualizar_costes(posiciones, self.resumenes.tabla())
+
+    def coste_recetas(self, recetas_ids: List[int], num_personas: int,
+                      externas: Optional[Dict[int, dict]] = None) -> float:
+        """
+        Coste actual de unas recetas (por id, con repeticiones) para `num_personas`
+
+        `externas` son recetas de fuera del catálogo (p. ej. generadas) por id.
+        """
+        posiciones = [p for p in map(self.catalogo.posicion, recetas_ids) if p is not None]
+        return float(self.resumenes.tabla().coste_personas(
+            np.asarray(posiciones, dtype=np.int64), num_personas
+        ).sum()) + _coste_externas(recetas_ids, externas, num_personas)
+
+    def _compatibles(self, grupos: Dict[tuple, _Grupo], preferencias,
+                     excluidos: int) -> List[_Grupo]:
+        """Grupos que cumplen las restricciones duras de las preferencias"""
+        clase_maxima = _clase_maxima(preferencias)
+        return [
+            grupo for grupo in grupos.values()
+            if grupo.clase_tiempo <= clase_maxima
+            and not grupo.alergenos & excluidos
+        ]
+
+    def _afinidad(self, preferencias) -> Optional[np.ndarray]:
+        """Similitud de cada posición con las recetas favoritas, si hay recomendador y favoritas"""
+        if self.recomendador is None or not preferencias.favoritas:
+            return None
+        return self.recomendador.afinidad(preferencias.favoritas)
+
+    def _afines(self, tipo: str, preferencias, excluidos: int, afinidad: np.ndarray,
+                tabla: TablaResumenes) -> Iterator[Tuple[float, int]]:
+        """
+        (afinidad negativa, posición) de las recetas de `tipo` que cumplen las
+        restricciones duras, de más a menos parecida a las favoritas
+        """
+        posiciones = self.catalogo.posiciones_tipo(tipo)
+        posiciones = posiciones[(tabla.clase_tiempo[posiciones] <= _clase_maxima(preferencias))
+                                & tabla.compatibles(excluidos)[posiciones]]
+        valores = afinidad[posiciones]
+        # Solo hacen falta las primeras; de sobra por si alguna se descarta después
+        if len(posiciones) > 4 * TAMANO_CANDIDATOS:
+            primeras = np.argpartition(-valores, 4 * TAMANO_CANDIDATOS)[:4 * TAMANO_CANDIDATOS]
+            posiciones, valores = posiciones[primeras], valores[primeras]
+        orden = np.lexsort((posiciones, -valores))
+        return zip((-valores[orden]).tolist(), posiciones[orden].tolist())
+
+    def _candidatos(self, compatibles: List[_Grupo], objetivo: float, estilo: str,
+                    libres: List[str], tabla: TablaResumenes,
+                    excluidas: frozenset = frozenset(),
+                    afinidad: Optional[np.ndarray] = None,
+                    afines: Iterator[Tuple[float, int]] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Posiciones del conjunto acotado de candidatos y su puntuación (menor es
+        mejor), sin las posiciones de `excluidas`; con `afinidad`, las más
+        parecidas a las favoritas (`afines`) también son candidatas
+        """
+        mejores = heapq.merge(*(
+            grupo.mas_cercanos(
+                objetivo,
+                PENALIZACION_ESTILO if grupo.estilo is not None and grupo.estilo != estilo else 0.0,
+            )
+            for grupo in compatibles
+        ))
+        baratos = heapq.merge(*(grupo.mas_baratos() for grupo in compatibles))
+
+        puntuados: Dict[int, float] = {}
+        for origen in (mejores, baratos, afines):
+            tomados = 0
+            for _, posicion in origen:
+                if tomados == TAMANO_CANDIDATOS:
+                    break
+                if posicion in excluidas:
+                    continue
+                # Alergias sin bit propio: se buscan como texto en los ingredientes
+                if any(alergia in tabla.texto[posicion] for alergia in libres):
+                    continue
+                puntuados[posicion] = None
+                tomados += 1
+
+        posiciones = np.fromiter(puntuados, dtype=np.int64, count=len(puntuados))
+        puntuaciones = np.abs(tabla.calorias[posiciones] - objetivo) / objetivo
+        estilos = [tabla.estilo[p] for p in puntuados]
+        puntuaciones += np.array(
+            [PENALIZACION_ESTILO if e is not None and e != estilo else 0.0 for e in estilos],
+            dtype=np.float64,
+        )
+        if afinidad is not None:
+            puntuaciones -= PESO_AFINIDAD * afinidad[posiciones]
+        return posiciones, puntuaciones
+
+    def candidatos(self, preferencias) -> Optional[List[Tuple[np.ndarray, np.ndarray]]]:
+        """
+        Posiciones candidatas y su puntuación por tipo de comida, o None si
+        alguno no tiene ninguna receta compatible
+
+        No dependen del presupuesto ni del número de comensales, así que se
+        comparten entre preferencias que solo difieren en eso.
+        """
+        grupos = self.datos()
+        tabla = self.resumenes.tabla()
+        diarias = CALORIAS_DIARIAS.get(preferencias.objetivo, CALORIAS_DIARIAS["comer_sano"])
+        # El estilo vegetariano es a la vez una dieta: sus marcas también excluyen
+        excluidos, libres = mascara_exclusion(preferencias.alergias, preferencias.estilo_cocina)
+        afinidad = self._afinidad(preferencias)
+
+        candidatos = []
+        with tramo("menu.candidatos"):
+            for tipo in TIPOS_COMIDA:
+                compatibles = self._compatibles(grupos.por_tipo[tipo], preferencias, excluidos)
+                posiciones, puntuaciones = self._candidatos(
+                    compatibles, diarias * REPARTO_CALORIAS[tipo],
+                    preferencias.estilo_cocina, libres, tabla, afinidad=afinidad,
+                    afines=(self._afines(tipo, preferencias, excluidos, afinidad, tabla)
+                            if afinidad is not None else ()),
+                )
+                if not len(posiciones):
+                    return None
+                candidatos.append((posiciones, puntuaciones))
+        return candidatos
+
+    def elegir_semanas(self, preferencias, semanas: int = 1,
+                       candidatos=None) -> Optional[List[Tuple[List[int], float]]]:
+        """
+        Posiciones de las recetas (por día y tipo de comida) y coste de cada
+        semana, o None si no hay recetas compatibles
+
+        Cada semana evita las recetas de la anterior mientras queden al menos
+        DIAS_SEMANA candidatas de cada tipo.
+        """
+        if candidatos is None:
+            candidatos = self.candidatos(preferencias)
+        if candidatos is None:
+            return None
+        tabla = self.resumenes.tabla()
+
+        elegidas, evitar = [], None
+        for _ in range(semanas):
+            conjuntos = []
+            for posiciones, puntuaciones in candidatos:
+                if evitar is not None:
+                    nuevas = ~np.isin(posiciones, evitar)
+                    if np.count_nonzero(nuevas) >= DIAS_SEMANA:
+                        posiciones, puntuaciones = posiciones[nuevas], puntuaciones[nuevas]
+                costes = tabla.coste_personas(posiciones, preferencias.num_personas)
+                conjuntos.append((posiciones, puntuaciones, costes))
+
+            with tramo("menu.presupuesto"):
+                elegidos = _resolver(conjuntos, preferencias.presupuesto)
+            menu = [
+                int(posiciones[seleccion[dia % len(seleccion)]])
+                for dia in range(DIAS_SEMANA)
+                for (posiciones, _, _), seleccion in zip(conjuntos, elegidos)
+            ]
+            elegidas.append((menu, _coste(conjuntos, elegidos)))
+            evitar = np.array(menu, dtype=np.int64)
+        return elegidas
+
+    def planificar_semanas(self, preferencias, semanas: int = 1) -> Optional[List[dict]]:
+        """Menús de varias semanas seguidas (ver `elegir_semanas`)"""
+        elegidas = self.elegir_semanas(preferencias, semanas)
+        if elegidas is None:
+            return None
+        recetas = self.catalogo.todas()
+        return [
+            componer_menu([recetas[p] for p in menu], coste, preferencias.presupuesto)
+            for menu, coste in elegidas
+        ]
+
+    def planificar(self, preferencias) -> Optional[dict]:
+        """
+        Genera el menú semanal o None si algún tipo de comida no tiene
+        ninguna receta compatible con las preferencias
+        """
+        menus = self.planificar_semanas(preferencias, 1)
+        return menus[0] if menus else None
+
+    def sustitutos(self, preferencias, tipo_comida: str, menu: List[int],
+                   receta_id: Optional[int] = None, cantidad: int = 1,
+                   externas: Optional[Dict[int, dict]] = None) -> List[dict]:
+        """
+        Mejores recetas para sustituir `receta_id` en el hueco de `tipo_comida`
+
+        `menu` son los ids de todas las recetas del menú actual (con la que se
+        sustituye), que quedan excluidas salvo que no haya otras. Primero van los candidatos que caben
+        en el presupuesto que deja el resto del menú, por puntuación; si
+        ninguno cabe, los más baratos. Cada elemento lleva la receta, su coste
+        y el coste total del menú con ella. `externas` son las recetas del
+        menú que no están en el catálogo (p. ej. generadas), que cuentan para
+        el presupuesto. Lanza ValueError si el tipo de comida no existe.
+        """
+        if tipo_comida not in TIPOS_COMIDA:
+            raise ValueError(f"Tipo de comida desconocido: {tipo_comida}")
+        grupos = self.datos()
+        tabla = self.resumenes.tabla()
+
+        en_menu = [p for p in map(self.catalogo.posicion, menu) if p is not None]
+        coste_resto = float(tabla.coste_personas(
+            np.array(en_menu, dtype=np.int64), preferencias.num_personas
+        ).sum()) + _coste_externas(menu, externas, preferencias.num_personas)
+        actual = self.catalogo.posicion(receta_id) if receta_id is not None else None
+        if actual in en_menu:
+            coste_resto -= float(tabla.coste_personas(actual, preferencias.num_personas))
+        elif externas and receta_id in externas and receta_id in menu:
+            coste_resto -= coste_receta(externas[receta_id], preferencias.num_personas)
+        margen = preferencias.presupuesto - coste_resto
+
+        diarias = CALORIAS_DIARIAS.get(preferencias.objetivo, CALORIAS_DIARIAS["comer_sano"])
+        excluidos, libres = mascara_exclusion(preferencias.alergias, preferencias.estilo_cocina)
+        compatibles = self._compatibles(grupos.por_tipo[tipo_comida], preferencias, excluidos)
+        objetivo = diarias * REPARTO_CALORIAS[tipo_comida]
+        afinidad = self._afinidad(preferencias)
+
+        def afines():
+            if afinidad is None:
+                return ()
+            return self._afines(tipo_comida, preferencias, excluidos, afinidad, tabla)
+
+        posiciones, puntuaciones = self._candidatos(
+            compatibles, objetivo, preferencias.estilo_cocina, libres, tabla,
+            frozenset(en_menu) | {actual}, afinidad, afines(),
+        )
+        if not len(posiciones):
+            # Catálogo pequeño: se admite repetir otra receta del menú
+            posiciones, puntuaciones = self._candidatos(
+                compatibles, objetivo, preferencias.estilo_cocina, libres, tabla,
+                frozenset([actual]), afinidad, afines(),
+            )
+        if not len(posiciones):
+            return []
+
+        costes = tabla.coste_personas(posiciones, preferencias.num_personas)
+        caben = costes <= margen + 1e-9
+        # Los que caben por puntuación; los que no, detrás y por coste
+        orden = np.lexsort((costes, np.where(caben, puntuaciones, costes), ~caben))
+
+        recetas = self.catalogo.todas()
+        return [
+            {
+                "receta": recetas[posiciones[i]],
+                "coste": round(float(costes[i]), 2),
+                "costo_total": round(coste_resto + float(costes[i]), 2),
+                "dentro_presupuesto": bool(caben[i]),
+            }
+            for i in orden[:cantidad].tolist()
+        ]
+
+
+def _coste_externas(recetas_ids: List[int], externas: Optional[Dict[int, dict]],
+                    num_personas: int) -> float:
+    """Coste de las recetas de `recetas_ids` que están en `externas`"""
+    if not externas:
+        return 0.0
+    return sum(coste_receta(externas[rid], num_personas) for rid in recetas_ids if rid in externas)
+
+
+def _clase_maxima(preferencias) -> int:
+    """Última clase de TIEMPO_MAXIMO que admite el tiempo de cocina de las preferencias"""
+    tiempos = list(TIEMPO_MAXIMO)
+    if preferencias.tiempo_cocina in TIEMPO_MAXIMO:
+        return tiempos.index(preferencias.tiempo_cocina)
+    return len(tiempos) - 1
+
+
+def componer_menu(recetas: List[dict], coste_total: float, presupuesto: float) -> dict:
+    """Menú de respuesta a partir de las recetas elegidas, en orden de día y tipo de comida"""
+    menu = []
+    for indice, receta in enumerate(recetas):
+        receta = receta.copy()
+        receta["dia"] = indice // len(TIPOS_COMIDA) + 1
+        menu.append(receta)
+    return {
+        "recetas": menu,
+        "costo_total": round(coste_total, 2),
+        "dentro_presupuesto": coste_total <= presupuesto,
+    }
+
+
+# ==================== RESOLUCIÓN ====================
+
+def _elegir(conjuntos, peso_coste: float) -> List[np.ndarray]:
+    """Índices de los DIAS_SEMANA mejores candidatos de cada conjunto para un peso de coste"""
+    elegidos = []
+    for _, puntuaciones, costes in conjuntos:
+        orden = np.lexsort((costes, puntuaciones + peso_coste * costes))
+        elegidos.append(orden[:DIAS_SEMANA])
+    return elegidos
+
+
+def _coste(conjuntos, elegidos: List[np.ndarray]) -> float:
+    """Coste semanal, repitiendo recetas si un conjunto tiene menos de 7"""
+    total = 0.0
+    for (_, _, costes), seleccion in zip(conjuntos, elegidos):
+        repetidas = seleccion[np.arange(DIAS_SEMANA) % len(seleccion)]
+        total += float(costes[repetidas].sum())
+    return total
+
+
+def _resolver(conjuntos, presupuesto: float) -> List[np.ndarray]:
+    """
+    Busca el menor peso del coste que cumple el presupuesto y después
+    aprovecha el margen sobrante con intercambios voraces
+    """
+    elegidos = _elegir(conjuntos, 0.0)
+    if _coste(conjuntos, elegidos) <= presupuesto:
+        return elegidos
+
+    # Con el peso máximo el orden es, en la práctica, solo por coste
+    mas_baratos = _elegir(conjuntos, PESO_COSTE_MAXIMO)
+    if _coste(conjuntos, mas_baratos) > presupuesto:
+        return mas_baratos  # inviable: el menú más barato
+
+    bajo, alto = 0.0, 1.0
+    while True:
+        elegidos = _elegir(conjuntos, alto)
+        if _coste(conjuntos, elegidos) <= presupuesto:
+            break
+        bajo, alto = alto, alto * 4
+
+    for _ in range(ITERACIONES_PRESUPUESTO):
+        medio = (bajo + alto) / 2
+        prueba = _elegir(conjuntos, medio)
+        if _coste(conjuntos, prueba) <= presupuesto:
+            alto, elegidos = medio, prueba
+        else:
+            bajo = medio
+
+    return _mejorar(conjuntos, elegidos, presupuesto)
+
+
+def _mejorar(conjuntos, elegidos: List[np.ndarray], presupuesto: float) -> List[np.ndarray]:
+    """Sustituye recetas por otras mejor puntuadas mientras quepan en el presupuesto"""
+    margen = presupuesto - _coste(conjuntos, elegidos)
+    for (_, puntuaciones, costes), seleccion in zip(conjuntos, elegidos):
+        if len(seleccion) < DIAS_SEMANA:
+            continue
+        usados = set(seleccion.tolist())
+        alternativas = [i for i in np.argsort(puntuaciones, kind="stable").tolist()
+                        if i not in usados]
+        for alternativa in alternativas:
+            peor = int(np.argmax(puntuaciones[seleccion]))
+            actual = seleccion[peor]
+            if puntuaciones[alternativa] >= puntuaciones[actual]:
+                break
+            diferencia = costes[alternativa] - costes[actual]
+            if diferencia <= margen:
+                seleccion[peor] = alternativa
+                margen -= diferencia
+    return elegidos
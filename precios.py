@@ -0,0 +1,442 @@
+"""
+SUPERMERCAI - Tabla de precios de los productos
+Precio unitario normalizado de cada producto e ingesta de feeds de precios
+"""
+
+import csv
+import json
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin servidor.py con varios procesos, no hace falta
+    fcntl = None
+
+import numpy as np
+
+from almacen import AlmacenRecetas
+from catalogo import CatalogoRecetas, DerivadoCatalogo
+from productos import CatalogoProductos
+from unidades import normalizar_cantidad
+
+# Errores de un feed que se devuelven en la respuesta (el resto solo se cuentan)
+MAX_ERRORES = 20
+
+FORMATOS = ("csv", "ndjson")
+
+# Columnas de un CSV sin cabecera, en orden
+COLUMNAS_CSV = ("producto_id", "precio", "unidad")
+
+# Bytes que se leen de cada vez de un feed en disco
+TROZO = 1024 * 1024
+
+
+# ==================== TABLA DE PRECIOS ====================
+
+class TablaPrecios:
+    """
+    Precio de cada producto por unidad de su unidad de precio
+
+    La unidad de precio es la de venta del catálogo de productos (g, ml o
+    unidad) y, si el producto no está en él, la unidad canónica en que más
+    lo usan las recetas. Al construirse, el precio de cada producto es la
+    mediana del precio por unidad de sus ingredientes; desde entonces manda
+    la tabla: un feed cambia su precio y el de cada ingrediente pasa a ser
+    su cantidad en la unidad de precio por el precio unitario. Los
+    ingredientes cuya unidad no se puede convertir (una "pizca" de un
+    producto que se vende por gramos sin equivalencia) cambian en la misma
+    proporción que el precio unitario.
+    """
+
+    def __init__(self, almacen: AlmacenRecetas, productos: Optional[CatalogoProductos] = None):
+        self.productos = productos
+        self.precio: Dict[int, float] = {}
+        self.unidad: Dict[int, str] = {}
+        self.incluir(almacen, almacen.filas_de(np.arange(len(almacen))))
+
+    def __len__(self) -> int:
+        return len(self.precio)
+
+    def _unidad_venta(self, producto_id: int) -> Optional[str]:
+        producto = self.productos.obtener(producto_id) if self.productos is not None else None
+        return producto["unidad"] if producto is not None else None
+
+    def factor(self, producto_id: int, unidad: str, destino: str) -> float:
+        """Cuánto de `destino` es una `unidad` de un producto, o nan si no hay conversión"""
+        cantidad, canonica = normalizar_cantidad(1.0, unidad)
+        if canonica == destino:
+            return cantidad
+        producto = self.productos.obtener(producto_id) if self.productos is not None else None
+        if producto is not None and producto["unidad"] == destino:
+            equivalencia = producto.get("equivalencias", {}).get(canonica)
+            if equivalencia is not None:
+                return cantidad * equivalencia
+        return math.nan
+
+    def _pares(self, almacen: AlmacenRecetas, filas: np.ndarray) -> Tuple[list, list, np.ndarray]:
+        """(producto_id, unidad) distintos de las filas y el par de cada fila"""
+        num_cadenas = len(almacen.cadenas) + 1
+        claves, inversa = np.unique(
+            almacen.ing_producto.datos[filas] * num_cadenas + almacen.ing_unidad.datos[filas],
+            return_inverse=True,
+        )
+        productos, unidades = np.divmod(claves, num_cadenas)
+        cadenas = almacen.cadenas
+        return productos.tolist(), [cadenas[u] for u in unidades.tolist()], inversa
+
+    def cantidades(self, almacen: AlmacenRecetas, filas: np.ndarray) -> np.ndarray:
+        """Cantidad de cada fila en la unidad de precio de su producto (nan si no hay conversión)"""
+        productos, unidades, inversa = self._pares(almacen, filas)
+        factores = np.fromiter(
+            (self.factor(p, u, self.unidad[p]) if p in self.unidad else math.nan
+             for p, u in zip(productos, unidades)),
+            dtype=np.float64, count=len(productos),
+        )
+        return almacen.ing_cantidad.datos[filas] * factores[inversa]
+
+    def incluir(self, almacen: AlmacenRecetas, filas: np.ndarray) -> None:
+        """Añade los productos de esas filas que no estaban, con la mediana de sus precios"""
+        if len(self.precio):
+            conocidos = np.fromiter(self.precio, dtype=np.int64, count=len(self.precio))
+            filas = filas[~np.isin(almacen.ing_producto.datos[filas], conocidos)]
+        if not len(filas):
+            return
+
+        # Unidad de precio: la de venta o, sin ella, la canónica más usada
+        productos, unidades, inversa = self._pares(almacen, filas)
+        usos: Dict[int, Dict[str, int]] = {}
+        for producto_id, unidad, n in zip(productos, unidades,
+                                         np.bincount(inversa).tolist()):
+            canonica = normalizar_cantidad(1.0, unidad)[1]
+            por_unidad = usos.setdefault(producto_id, {})
+            por_unidad[canonica] = por_unidad.get(canonica, 0) + n
+        for producto_id, por_unidad in usos.items():
+            self.unidad[producto_id] = (self._unidad_venta(producto_id)
+                                        or max(por_unidad, key=por_unidad.get))
+
+        cantidades = self.cantidades(almacen, filas)
+        validas = np.isfinite(cantidades) & (cantidades > 0)
+        producto = almacen.ing_producto.datos[filas][validas]
+        unitario = almacen.ing_precio.datos[filas][validas] / cantidades[validas]
+        orden = np.lexsort((unitario, producto))
+        producto, unitario = producto[orden], unitario[orden]
+        claves, inicios, cuentas = np.unique(producto, return_index=True, return_counts=True)
+        medianas = (unitario[inicios + (cuentas - 1) // 2] + unitario[inicios + cuentas // 2]) / 2
+        self.precio.update(zip(claves.tolist(), np.round(medianas, 6).tolist()))
+        # Sin ninguna cantidad convertible no hay precio: la unidad la fijará un feed
+        for producto_id in usos.keys() - self.precio.keys():
+            del self.unidad[producto_id]
+
+    def convertir(self, producto_id: int, precio: float,
+                  unidad: Optional[str]) -> Tuple[float, str]:
+        """
+        Precio por unidad de precio del producto a partir de un precio por
+        `unidad` (sin ella, ya en la unidad de precio). Los productos nuevos
+        toman la unidad de venta o la del feed. Lanza ValueError si la
+        unidad no se puede convertir.
+        """
+        destino = self.unidad.get(producto_id)
+        if unidad is None:
+            if destino is None:
+                raise ValueError(f"producto {producto_id}: falta la unidad (producto sin precio)")
+            return precio, destino
+        if destino is None:
+            destino = self._unidad_venta(producto_id) or normalizar_cantidad(1.0, unidad)[1]
+        factor = self.factor(producto_id, unidad, destino)
+        if not factor > 0:
+            raise ValueError(f"producto {producto_id}: la unidad {unidad!r} no se convierte a {destino}")
+        return precio / factor, destino
+
+
+class PreciosProductos(DerivadoCatalogo):
+    """
+    Tabla de precios de los productos, construida a partir del catálogo
+
+    Los cambios sueltos del catálogo solo añaden los productos nuevos; los
+    precios cambian con `aplicar`, que reescribe los ingredientes de las
+    recetas afectadas a través del índice por producto del catálogo.
+    """
+
+    def __init__(self, catalogo: CatalogoRecetas, productos: Optional[CatalogoProductos] = None):
+        self.productos = productos
+        super().__init__(catalogo)
+
+    def _construir(self) -> TablaPrecios:
+        return TablaPrecios(self.catalogo.todas(), self.productos)
+
+    def _parchear(self, tabla: TablaPrecios, posiciones: List[int]) -> None:
+        almacen = self.catalogo.todas()
+        tabla.incluir(almacen, almacen.filas_de(posiciones))
+
+    def _parchear_precios(self, tabla: TablaPrecios, posiciones: List[int]) -> None:
+        pass  # los cambios de precios salen de la propia tabla
+
+    def tabla(self) -> TablaPrecios:
+        return self.datos()
+
+    def precio(self, producto_id: int) -> Optional[Tuple[float, str]]:
+        """(precio unitario, unidad de precio) de un producto, o None si no tiene"""
+        tabla = self.datos()
+        if producto_id not in tabla.precio:
+            return None
+        return tabla.precio[producto_id], tabla.unidad[producto_id]
+
+    def aplicar(self, precios: Dict[int, Tuple[float, Optional[str]]]) -> dict:
+        """
+        Aplica de una vez los precios de un feed, {producto_id: (precio, unidad)}
+
+        Los productos sin recetas solo se guardan en la tabla. Devuelve los
+        productos que cambiaron, los que ya tenían ese precio, las recetas
+        recalculadas, los errores y la versión del catálogo.
+        """
+        errores = []
+        sin_cambios = 0
+        with self._lock:
+            tabla = self.datos()
+            nuevos: Dict[int, float] = {}
+            proporciones: Dict[int, float] = {}
+            for producto_id, (precio, unidad) in precios.items():
+                try:
+                    unitario, destino = tabla.convertir(producto_id, precio, unidad)
+                except ValueError as error:
+                    errores.append(str(error))
+                    continue
+                unitario = round(unitario, 6)
+                anterior = tabla.precio.get(producto_id)
+                if anterior == unitario:
+                    sin_cambios += 1
+                    continue
+                tabla.precio[producto_id] = nuevos[producto_id] = unitario
+                tabla.unidad[producto_id] = destino
+                proporciones[producto_id] = unitario / anterior if anterior else 1.0
+            version, recetas = self.catalogo.repreciar(
+                nuevos, _calculo(tabla, nuevos, proporciones)
+            )
+        return {"productos": len(nuevos), "sin_cambios": sin_cambios, "recetas": recetas,
+                "errores": errores, "version": version}
+
+
+def _calculo(tabla: TablaPrecios, nuevos: Dict[int, float], proporciones: Dict[int, float]):
+    """Función de CatalogoRecetas.repreciar con los precios nuevos de la tabla"""
+    ids = np.fromiter(sorted(nuevos), dtype=np.int64, count=len(nuevos))
+    unitarios = np.fromiter((nuevos[p] for p in ids.tolist()), dtype=np.float64, count=len(ids))
+    factores = np.fromiter((proporciones[p] for p in ids.tolist()), dtype=np.float64, count=len(ids))
+
+    def calcular(almacen: AlmacenRecetas, filas: np.ndarray) -> np.ndarray:
+        indice = np.searchsorted(ids, almacen.ing_producto.datos[filas])
+        cantidades = tabla.cantidades(almacen, filas)
+        precios = np.where(np.isfinite(cantidades), cantidades * unitarios[indice],
+                           almacen.ing_precio.datos[filas] * factores[indice])
+        return np.round(precios, 4)
+
+    return calcular
+
+
+# ==================== FEEDS ====================
+
+def formato_de(tipo_contenido: Optional[str]) -> Optional[str]:
+    """Formato de feed que corresponde a un Content-Type, o None"""
+    tipo = (tipo_contenido or "").split(";")[0].strip().lower()
+    if tipo in ("text/csv", "application/csv"):
+        return "csv"
+    if tipo in ("application/x-ndjson", "application/ndjson", "application/jsonl",
+                "application/json-lines"):
+        return "ndjson"
+    return None
+
+
+class LectorFeed:
+    """
+    Lee un feed de precios a trozos, según llega
+
+    En CSV, una fila `producto_id,precio[,unidad]` por línea, con o sin esa
+    cabecera; en NDJSON, un objeto con esas claves por línea. `precio` es
+    por una `unidad` ("kg", "l", "unidad"...); sin ella, por la unidad de
+    precio del producto. Si un producto se repite vale la última línea, así
+    que la memoria crece con los productos distintos, no con las líneas.
+    Las líneas con errores se saltan.
+    """
+
+    def __init__(self, formato: str):
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato desconocido: {formato}")
+        self.formato = formato
+        self.precios: Dict[int, Tuple[float, Optional[str]]] = {}
+        self.filas = 0
+        self.errores: List[str] = []
+        self.num_errores = 0
+        self._numero = 0
+        self._resto = b""
+        self._columnas: Optional[Dict[str, int]] = None
+
+    def alimentar(self, trozo: bytes) -> None:
+        """Procesa las líneas completas de un trozo y guarda la última, a medias"""
+        lineas = (self._resto + trozo).split(b"\n")
+        self._resto = lineas.pop()
+        for linea in lineas:
+            self._linea(linea)
+
+    def terminar(self) -> "LectorFeed":
+        if self._resto:
+            self._linea(self._resto)
+            self._resto = b""
+        return self
+
+    def error(self, mensaje: str) -> None:
+        self.num_errores += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append(mensaje)
+
+    def _linea(self, linea: bytes) -> None:
+        self._numero += 1
+        linea = linea.strip()
+        if not linea:
+            return
+        try:
+            texto = linea.decode("utf-8")
+            if self.formato == "csv":
+                fila = self._csv(texto)
+                if fila is None:
+                    return
+            else:
+                fila = _ndjson(texto)
+        except (ValueError, KeyError, IndexError, TypeError) as error:
+            detalle = f"falta {error}" if isinstance(error, KeyError) else str(error)
+            self.error(f"línea {self._numero}: {detalle}")
+            return
+        producto_id, precio, unidad = fila
+        self.filas += 1
+        self.precios[producto_id] = (precio, unidad)
+
+    def _csv(self, texto: str) -> Optional[Tuple[int, float, Optional[str]]]:
+        campos = [campo.strip() for campo in next(csv.reader([texto]))]
+        if self._columnas is None:
+            if campos[0].lower() == "producto_id":
+                self._columnas = {nombre.lower(): i for i, nombre in enumerate(campos)}
+                for nombre in COLUMNAS_CSV[:2]:
+                    if nombre not in self._columnas:
+                        raise ValueError(f"la cabecera no tiene la columna {nombre}")
+                return None
+            self._columnas = {nombre: i for i, nombre in enumerate(COLUMNAS_CSV)}
+        columnas = self._columnas
+        unidad = None
+        if "unidad" in columnas and columnas["unidad"] < len(campos):
+            unidad = campos[columnas["unidad"]] or None
+        return (int(campos[columnas["producto_id"]]),
+                _precio(float(campos[columnas["precio"]])), unidad)
+
+
+def _ndjson(texto: str) -> Tuple[int, float, Optional[str]]:
+    objeto = json.loads(texto)
+    if not isinstance(objeto, dict):
+        raise ValueError("cada línea debe ser un objeto")
+    producto_id = objeto["producto_id"]
+    if not isinstance(producto_id, int) or isinstance(producto_id, bool):
+        raise ValueError("producto_id debe ser un entero")
+    precio = objeto["precio"]
+    if not isinstance(precio, (int, float)) or isinstance(precio, bool):
+        raise ValueError("precio debe ser un número")
+    unidad = objeto.get("unidad")
+    if unidad is not None and not isinstance(unidad, str):
+        raise ValueError("unidad debe ser una cadena")
+    return producto_id, _precio(float(precio)), unidad or None
+
+
+def _precio(precio: float) -> float:
+    if not math.isfinite(precio) or precio < 0:
+        raise ValueError(f"precio no válido: {precio}")
+    return precio
+
+
+def leer_feed(ruta: str) -> LectorFeed:
+    """Lee un feed de un archivo (.csv o, si no, NDJSON) sin cargarlo entero"""
+    lector = LectorFeed("csv" if ruta.lower().endswith(".csv") else "ndjson")
+    with open(ruta, "rb") as archivo:
+        while trozo := archivo.read(TROZO):
+            lector.alimentar(trozo)
+    return lector.terminar()
+
+
+def aplicar_feed(precios: PreciosProductos, lector: LectorFeed) -> dict:
+    """Aplica un feed ya leído y une sus errores de lectura con los de aplicarlo"""
+    resultado = precios.aplicar(lector.precios)
+    errores = lector.errores + resultado.pop("errores")
+    return {"filas": lector.filas, **resultado, "errores": errores[:MAX_ERRORES],
+            "num_errores": lector.num_errores + len(errores) - len(lector.errores)}
+
+
+# ==================== DIARIO DE FEEDS ====================
+
+class DiarioFeeds:
+    """
+    Feeds recibidos en caliente, compartidos por los trabajadores de servidor.py
+
+    Sin `compartir` no hace nada: cada feed se aplica solo en su proceso.
+    Con un fichero compartido, cada feed se aplica y se añade a él como una
+    línea JSON, con el fichero bloqueado; antes de cada petición los demás
+    trabajadores aplican, en el orden del fichero, las líneas que aún no han
+    visto, así que todos acaban con los mismos precios. Un trabajador
+    relanzado empieza desde el principio y se pone al día.
+    """
+
+    def __init__(self, precios: PreciosProductos):
+        self.precios = precios
+        self.ruta: Optional[str] = None
+        self._leidos = 0  # bytes del fichero ya aplicados
+
+    def compartir(self, ruta: str) -> None:
+        """Usa ese fichero (vacío) desde ahora; antes de bifurcar los trabajadores"""
+        self.ruta = ruta
+        self._leidos = 0
+
+    def ponerse_al_dia(self) -> int:
+        """Aplica los feeds del fichero que este proceso aún no ha visto; devuelve cuántos"""
+        if self.ruta is None:
+            return 0
+        tamano = os.stat(self.ruta).st_size
+        if tamano <= self._leidos:
+            return 0
+        with open(self.ruta, "rb") as archivo:
+            archivo.seek(self._leidos)
+            datos = archivo.read(tamano - self._leidos)
+        # Una línea a medio escribir se deja para la próxima vez
+        completos = datos.rfind(b"\n") + 1
+        self._leidos += completos
+        lineas = datos[:completos].splitlines()
+        for linea in lineas:
+            self.precios.aplicar({producto_id: (precio, unidad)
+                                  for producto_id, precio, unidad in json.loads(linea)})
+        return len(lineas)
+
+    def publicar(self, lector: LectorFeed) -> dict:
+        """Aplica un feed ya leído y, si el fichero es compartido, lo añade a él"""
+        if self.ruta is None:
+            return aplicar_feed(self.precios, lector)
+        linea = json.dumps([[producto_id, precio, unidad]
+                            for producto_id, (precio, unidad) in lector.precios.items()],
+                           separators=(",", ":")) + "\n"
+        with open(self.ruta, "ab") as archivo:
+            # Con el bloqueo nadie más escribe: lo anterior se aplica antes que
+            # este feed, en el mismo orden que en los demás trabajadores
+            fcntl.flock(archivo, fcntl.LOCK_EX)
+            self.ponerse_al_dia()
+            resultado = aplicar_feed(self.precios, lector)
+            archivo.write(linea.encode("utf-8"))
+            archivo.flush()
+            self._leidos = archivo.tell()
+        return resultado
+
+
+class MiddlewareDiario:
+    """Middleware ASGI que pone al día los precios con el diario antes de cada petición"""
+
+    def __init__(self, app, diario: DiarioFeeds):
+        self.app = app
+        self.diario = diario
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            self.diario.ponerse_al_dia()
+        await self.app(scope, receive, send)
@@ -0,0 +1,321 @@
+"""
+SUPERMERCAI - Productos del supermercado y elección de envases
+Cada producto se vende en envases de tamaño fijo; las tablas de coste mínimo
+por producto y preferencia de marca se precalculan al cargar el catálogo
+"""
+
+import math
+from functools import reduce
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+# Tipos de envase que descarta cada preferencia_marca (si el producto tiene
+# envases de otro tipo; si no, se usan todos)
+DESCARTADOS = {
+    "marca_blanca": frozenset({"fabricante"}),
+    "otras": frozenset({"marca_blanca"}),
+}
+
+# Las cantidades de los envases se redondean a milésimas de su unidad
+_ESCALA = 1000
+
+# Envases del mayor tamaño hasta los que llega como mucho cada tabla
+ENVASES_TABLA = 20
+
+
+def _envase(nombre: str, tipo: str, cantidad: float, precio: float) -> dict:
+    return {"nombre": nombre, "tipo": tipo, "cantidad": cantidad, "precio": precio}
+
+
+# ==================== DATOS DE EJEMPLO ====================
+
+# `unidad` es la unidad de venta (g, ml o unidad) y `equivalencias` cuánto de
+# ella es una unidad de receta que no coincide ("diente" de ajo -> 0.1 cabezas)
+PRODUCTOS_EJEMPLO = [
+    {"id": 1, "nombre": "Pechuga de pollo", "unidad": "g", "envases": [
+        _envase("Bandeja 500 g", "marca_blanca", 500, 3.95),
+        _envase("Bandeja familiar 1 kg", "marca_blanca", 1000, 7.49),
+        _envase("Pechuga campera 1 kg", "fabricante", 1000, 8.50)]},
+    {"id": 2, "nombre": "Pimiento rojo", "unidad": "unidad", "envases": [
+        _envase("Malla 3 unidades", "marca_blanca", 3, 1.99),
+        _envase("Pieza", "granel", 1, 0.85)]},
+    {"id": 3, "nombre": "Calabacín", "unidad": "unidad", "equivalencias": {"g": 1 / 300}, "envases": [
+        _envase("Pieza", "granel", 1, 0.89)]},
+    {"id": 4, "nombre": "Aceite de oliva virgen extra", "unidad": "ml", "envases": [
+        _envase("Botella 1 l", "marca_blanca", 1000, 8.95),
+        _envase("Garrafa 5 l", "marca_blanca", 5000, 39.95),
+        _envase("Botella 750 ml", "fabricante", 750, 9.50)]},
+    {"id": 5, "nombre": "Lechuga romana", "unidad": "unidad", "equivalencias": {"g": 1 / 400}, "envases": [
+        _envase("Pieza", "granel", 1, 0.99),
+        _envase("Pack 2 unidades", "marca_blanca", 2, 1.49)]},
+    {"id": 6, "nombre": "Queso parmesano", "unidad": "g", "envases": [
+        _envase("Cuña 100 g", "marca_blanca", 100, 1.95),
+        _envase("Cuña 200 g", "fabricante", 200, 4.80)]},
+    {"id": 7, "nombre": "Pan tostado", "unidad": "g", "envases": [
+        _envase("Paquete 200 g", "marca_blanca", 200, 1.10),
+        _envase("Paquete 270 g", "fabricante", 270, 2.15)]},
+    {"id": 8, "nombre": "Pasta", "unidad": "g", "envases": [
+        _envase("Paquete 500 g", "marca_blanca", 500, 0.85),
+        _envase("Paquete 1 kg", "marca_blanca", 1000, 1.60),
+        _envase("Paquete 500 g", "fabricante", 500, 1.45)]},
+    {"id": 9, "nombre": "Tomate triturado", "unidad": "g", "envases": [
+        _envase("Lata 400 g", "marca_blanca", 400, 0.65),
+        _envase("Lata 800 g", "marca_blanca", 800, 1.09),
+        _envase("Lata 800 g", "fabricante", 800, 1.55)]},
+    {"id": 10, "nombre": "Ajo", "unidad": "unidad", "equivalencias": {"diente": 0.1}, "envases": [
+        _envase("Malla 3 cabezas", "marca_blanca", 3, 1.29),
+        _envase("Cabeza", "granel", 1, 0.55)]},
+    {"id": 11, "nombre": "Albahaca fresca", "unidad": "unidad", "equivalencias": {"manojo": 1}, "envases": [
+        _envase("Maceta", "granel", 1, 1.49)]},
+    {"id": 12, "nombre": "Huevos", "unidad": "unidad", "envases": [
+        _envase("Media docena", "marca_blanca", 6, 1.45),
+        _envase("Docena", "marca_blanca", 12, 2.70),
+        _envase("Docena camperos", "fabricante", 12, 3.60)]},
+    {"id": 13, "nombre": "Espinacas frescas", "unidad": "g", "envases": [
+        _envase("Bolsa 300 g", "marca_blanca", 300, 1.35),
+        _envase("Bolsa 250 g", "fabricante", 250, 1.89)]},
+    {"id": 14, "nombre": "Calabaza", "unidad": "g", "envases": [
+        _envase("Trozo 500 g", "granel", 500, 1.19),
+        _envase("Pieza 1 kg", "granel", 1000, 1.99)]},
+    {"id": 15, "nombre": "Cebolla", "unidad": "unidad", "equivalencias": {"g": 1 / 150}, "envases": [
+        _envase("Malla 6 unidades", "marca_blanca", 6, 1.49),
+        _envase("Pieza", "granel", 1, 0.35)]},
+    {"id": 16, "nombre": "Jengibre", "unidad": "g", "envases": [
+        _envase("Bandeja 100 g", "granel", 100, 0.60)]},
+    {"id": 17, "nombre": "Caldo de verduras", "unidad": "ml", "envases": [
+        _envase("Brik 1 l", "marca_blanca", 1000, 0.99),
+        _envase("Brik 1 l", "fabricante", 1000, 1.85)]},
+    {"id": 18, "nombre": "Yogur natural", "unidad": "g", "equivalencias": {"unidad": 125}, "envases": [
+        _envase("Pack 4 x 125 g", "marca_blanca", 500, 0.79),
+        _envase("Pack 4 x 125 g", "fabricante", 500, 1.69)]},
+    {"id": 19, "nombre": "Frutas variadas", "unidad": "g", "envases": [
+        _envase("Bandeja 500 g", "granel", 500, 1.49),
+        _envase("Bolsa 1 kg", "marca_blanca", 1000, 2.49)]},
+    {"id": 20, "nombre": "Miel", "unidad": "g", "equivalencias": {"ml": 1.4}, "envases": [
+        _envase("Tarro 500 g", "marca_blanca", 500, 3.49),
+        _envase("Tarro 350 g", "fabricante", 350, 3.99)]},
+    {"id": 21, "nombre": "Arroz", "unidad": "g", "envases": [
+        _envase("Paquete 1 kg", "marca_blanca", 1000, 1.15),
+        _envase("Paquete 1 kg", "fabricante", 1000, 2.10)]},
+    {"id": 22, "nombre": "Muslos de pollo", "unidad": "g", "envases": [
+        _envase("Bandeja 600 g", "marca_blanca", 600, 2.79),
+        _envase("Bandeja 1 kg", "marca_blanca", 1000, 3.99)]},
+    {"id": 23, "nombre": "Caldo de pollo", "unidad": "ml", "envases": [
+        _envase("Brik 1 l", "marca_blanca", 1000, 0.99),
+        _envase("Brik 1 l", "fabricante", 1000, 1.95)]},
+    {"id": 24, "nombre": "Filete de salmón", "unidad": "g", "envases": [
+        _envase("Bandeja 2 filetes 250 g", "marca_blanca", 250, 3.99),
+        _envase("Bandeja 400 g", "fabricante", 400, 7.50)]},
+    {"id": 25, "nombre": "Limón", "unidad": "unidad", "envases": [
+        _envase("Malla 6 unidades", "marca_blanca", 6, 1.59),
+        _envase("Pieza", "granel", 1, 0.35)]},
+    {"id": 26, "nombre": "Pan integral de molde", "unidad": "g", "equivalencias": {"rebanada": 30}, "envases": [
+        _envase("Paquete 450 g", "marca_blanca", 450, 1.35),
+        _envase("Paquete 600 g", "fabricante", 600, 2.29)]},
+    {"id": 27, "nombre": "Aguacate", "unidad": "unidad", "envases": [
+        _envase("Malla 4 unidades", "marca_blanca", 4, 3.49),
+        _envase("Pieza", "granel", 1, 1.10)]},
+    {"id": 28, "nombre": "Sal", "unidad": "g", "equivalencias": {"pizca": 0.5}, "envases": [
+        _envase("Paquete 1 kg", "marca_blanca", 1000, 0.35)]},
+    {"id": 29, "nombre": "Lentejas", "unidad": "g", "envases": [
+        _envase("Paquete 1 kg", "marca_blanca", 1000, 1.65),
+        _envase("Paquete 500 g", "fabricante", 500, 1.39)]},
+    {"id": 30, "nombre": "Zanahoria", "unidad": "unidad", "equivalencias": {"g": 1 / 100}, "envases": [
+        _envase("Bolsa 1 kg (10 unidades)", "marca_blanca", 10, 0.99),
+        _envase("Pieza", "granel", 1, 0.15)]},
+    {"id": 31, "nombre": "Pimiento verde", "unidad": "unidad", "envases": [
+        _envase("Bandeja 3 unidades", "marca_blanca", 3, 1.19),
+        _envase("Pieza", "granel", 1, 0.45)]},
+    {"id": 32, "nombre": "Plátano", "unidad": "unidad", "envases": [
+        _envase("Bolsa 6 unidades", "marca_blanca", 6, 1.69),
+        _envase("Pieza", "granel", 1, 0.30)]},
+    {"id": 33, "nombre": "Leche semidesnatada", "unidad": "ml", "envases": [
+        _envase("Brik 1 l", "marca_blanca", 1000, 0.89),
+        _envase("Pack 6 x 1 l", "marca_blanca", 6000, 5.19),
+        _envase("Brik 1 l", "fabricante", 1000, 1.29)]},
+    {"id": 34, "nombre": "Copos de avena", "unidad": "g", "envases": [
+        _envase("Paquete 500 g", "marca_blanca", 500, 1.19),
+        _envase("Paquete 500 g", "fabricante", 500, 2.29)]},
+    {"id": 35, "nombre": "Masa para pizza", "unidad": "unidad", "envases": [
+        _envase("Masa refrigerada", "marca_blanca", 1, 1.29),
+        _envase("Masa refrigerada", "fabricante", 1, 1.99)]},
+    {"id": 36, "nombre": "Tomate frito", "unidad": "g", "envases": [
+        _envase("Brik 400 g", "marca_blanca", 400, 0.75),
+        _envase("Frasco 350 g", "fabricante", 350, 1.35)]},
+    {"id": 37, "nombre": "Mozzarella", "unidad": "g", "envases": [
+        _envase("Bola 125 g", "marca_blanca", 125, 0.89),
+        _envase("Bola 125 g", "fabricante", 125, 1.59)]},
+    {"id": 38, "nombre": "Verduras variadas congeladas", "unidad": "g", "envases": [
+        _envase("Bolsa 400 g", "marca_blanca", 400, 1.49),
+        _envase("Bolsa 1 kg", "marca_blanca", 1000, 2.99)]},
+    {"id": 39, "nombre": "Tortillas de trigo", "unidad": "unidad", "envases": [
+        _envase("Paquete 8 unidades", "marca_blanca", 8, 1.29),
+        _envase("Paquete 6 unidades", "fabricante", 6, 1.89)]},
+    {"id": 40, "nombre": "Tomate", "unidad": "unidad", "equivalencias": {"g": 1 / 150}, "envases": [
+        _envase("Bandeja 6 unidades", "marca_blanca", 6, 1.99),
+        _envase("Pieza", "granel", 1, 0.40)]},
+    {"id": 41, "nombre": "Garbanzos cocidos", "unidad": "g", "envases": [
+        _envase("Tarro 400 g", "marca_blanca", 400, 0.59),
+        _envase("Tarro 570 g", "fabricante", 570, 1.25)]},
+    {"id": 42, "nombre": "Pan de hamburguesa", "unidad": "unidad", "envases": [
+        _envase("Paquete 4 unidades", "marca_blanca", 4, 1.15),
+        _envase("Paquete 6 unidades", "fabricante", 6, 2.10)]},
+    {"id": 43, "nombre": "Fideos finos", "unidad": "g", "envases": [
+        _envase("Paquete 500 g", "marca_blanca", 500, 0.79),
+        _envase("Paquete 500 g", "fabricante", 500, 1.35)]},
+    {"id": 44, "nombre": "Puerro", "unidad": "unidad", "envases": [
+        _envase("Bandeja 3 unidades", "marca_blanca", 3, 1.69),
+        _envase("Pieza", "granel", 1, 0.75)]},
+    {"id": 45, "nombre": "Champiñones", "unidad": "g", "envases": [
+        _envase("Bandeja 250 g", "marca_blanca", 250, 1.29),
+        _envase("Bandeja 500 g", "marca_blanca", 500, 2.29)]},
+]
+
+
+# ==================== TABLA DE ENVASES ====================
+
+class TablaEnvases:
+    """
+    Coste mínimo de cubrir cualquier cantidad con los envases de un producto
+
+    Las cantidades se cuentan en pasos (el máximo común divisor de los
+    tamaños de envase). coste[k] y cuentas[k] son el coste mínimo y los
+    envases de cada tipo que cubren al menos k pasos, hasta `limite`. Por
+    encima, una solución óptima usa sobre todo el envase de menor precio por
+    paso: el resto de envases suma menos de mejor_pasos * max(pasos) (si no,
+    un subconjunto suyo sumaría un múltiplo de mejor_pasos y saldría igual o
+    más barato con envases del mejor), así que basta con añadir envases del
+    mejor hasta volver a la tabla. La tabla se corta en ENVASES_TABLA envases
+    del mayor tamaño; si el mejor ocupa más pasos que eso (tamaños casi
+    primos entre sí, como 330 ml y 5 l), por encima del corte el resultado
+    puede no ser el óptimo exacto.
+    """
+
+    __slots__ = ("envases", "paso", "pasos", "mejor", "limite", "coste", "cuentas")
+
+    def __init__(self, envases: List[dict]):
+        self.envases = envases
+        enteros = [max(1, round(e["cantidad"] * _ESCALA)) for e in envases]
+        divisor = reduce(math.gcd, enteros)
+        self.paso = divisor / _ESCALA
+        self.pasos = np.asarray([n // divisor for n in enteros], dtype=np.int64)
+        precios = np.asarray([e["precio"] for e in envases], dtype=np.float64)
+        self.mejor = int(np.argmin(precios / self.pasos))
+        mayor = int(self.pasos.max())
+        self.limite = (min(int(self.pasos[self.mejor]), ENVASES_TABLA) + 1) * mayor
+
+        # Mochila no acotada: el último envase añadido a una solución de k
+        # pasos deja una solución óptima de k - pasos[j]. Las tablas son
+        # pequeñas y el bucle escalar es más rápido que operar por bloques.
+        envases_pasos = list(enumerate(zip(self.pasos.tolist(), precios.tolist())))
+        coste = [0.0] * (self.limite + 1)
+        cuentas = [(0,) * len(envases)] * (self.limite + 1)
+        for k in range(1, self.limite + 1):
+            mejor_coste, elegido, previo = math.inf, 0, 0
+            for j, (p, precio) in envases_pasos:
+                resto = k - p if k > p else 0
+                if coste[resto] + precio < mejor_coste:
+                    mejor_coste, elegido, previo = coste[resto] + precio, j, resto
+            coste[k] = mejor_coste
+            fila = list(cuentas[previo])
+            fila[elegido] += 1
+            cuentas[k] = tuple(fila)
+        self.coste = np.asarray(coste)
+        self.cuentas = np.asarray(cuentas, dtype=np.int32)
+
+    def elegir(self, cantidad: float) -> Tuple[List[int], float]:
+        """Envases de cada tipo que cubren `cantidad` al menor precio, y ese precio"""
+        k = max(0, math.ceil(cantidad / self.paso - 1e-9))
+        extra = 0
+        if k > self.limite:
+            mejor_pasos = int(self.pasos[self.mejor])
+            extra = -(-(k - self.limite) // mejor_pasos)
+            k -= extra * mejor_pasos
+        cuentas = self.cuentas[k].tolist()
+        cuentas[self.mejor] += extra
+        coste = float(self.coste[k]) + extra * self.envases[self.mejor]["precio"]
+        return cuentas, coste
+
+
+# ==================== CATÁLOGO DE PRODUCTOS ====================
+
+class CatalogoProductos:
+    """
+    Productos por id con sus tablas de envases precalculadas para cada
+    preferencia_marca
+    """
+
+    def __init__(self, productos: Iterable[dict]):
+        self.productos: Dict[int, dict] = {}
+        self._tablas: Dict[Tuple[int, str], TablaEnvases] = {}
+        for producto in productos:
+            self.productos[producto["id"]] = producto
+            por_envases: Dict[tuple, TablaEnvases] = {}
+            for preferencia, descartados in DESCARTADOS.items():
+                envases = [e for e in producto["envases"] if e["tipo"] not in descartados]
+                envases = envases or producto["envases"]
+                # Si las dos preferencias dejan los mismos envases, comparten tabla
+                clave = tuple(map(id, envases))
+                if clave not in por_envases:
+                    por_envases[clave] = TablaEnvases(envases)
+                self._tablas[producto["id"], preferencia] = por_envases[clave]
+
+    def __len__(self) -> int:
+        return len(self.productos)
+
+    def obtener(self, producto_id: int) -> Optional[dict]:
+        return self.productos.get(producto_id)
+
+    def convertir(self, producto: dict, cantidad: float, unidad: str) -> Optional[float]:
+        """Cantidad en la unidad de venta del producto, o None si no hay equivalencia"""
+        if unidad == producto["unidad"]:
+            return cantidad
+        factor = producto.get("equivalencias", {}).get(unidad)
+        return cantidad * factor if factor is not None else None
+
+    def resolver(self, lineas: List[dict], preferencia_marca: str = "marca_blanca") -> dict:
+        """
+        Compra más barata que cubre las líneas agregadas del carrito
+
+        Las líneas del mismo producto en distintas unidades se suman en su
+        unidad de venta. Las de productos sin envases o sin equivalencia se
+        devuelven en `sin_envase` y cuentan en el total con su precio de receta.
+        """
+        if preferencia_marca not in DESCARTADOS:
+            preferencia_marca = "marca_blanca"
+
+        necesidades: Dict[int, float] = {}
+        sin_envase = []
+        for linea in lineas:
+            producto_id = linea["producto_id"]
+            producto = self.productos.get(producto_id)
+            cantidad = None
+            if producto is not None:
+                cantidad = self.convertir(producto, linea["cantidad"], linea["unidad"])
+            if cantidad is None:
+                sin_envase.append(linea)
+            else:
+                necesidades[producto_id] = necesidades.get(producto_id, 0.0) + cantidad
+
+        compra = []
+        total = 0.0
+        for producto_id, necesario in necesidades.items():
+            producto = self.productos[producto_id]
+            tabla = self._tablas[producto_id, preferencia_marca]
+            cuentas, coste = tabla.elegir(necesario)
+            envases = [{**envase, "unidades": n} for envase, n in zip(tabla.envases, cuentas) if n]
+            comprado = sum(envase["cantidad"] * envase["unidades"] for envase in envases)
+            total += coste
+            compra.append({
+                "producto_id": producto_id,
+                "nombre": producto["nombre"],
+                "necesario": round(necesario, 2),
+                "unidad": producto["unidad"],
+                "envases": envases,
+                "comprado": round(comprado, 2),
+                "precio": round(coste, 2),
+            })
+        total += sum(linea["precio"] for linea in sin_envase)
+        return {"compra": compra, "sin_envase": sin_envase, "total": round(total, 2)}
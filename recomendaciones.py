@@ -0,0 +1,226 @@
+"""
+SUPERMERCAI - Recomendaciones por similitud
+Cada receta como vector de ingredientes, nutrición y estilo en una matriz de NumPy
+"""
+
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from almacen import AUSENTE, AlmacenRecetas
+from busqueda import mejores
+from catalogo import CatalogoRecetas, DerivadoCatalogo
+from metricas import tramo
+from resumenes import TIEMPO_MAXIMO, ResumenesRecetas, TablaResumenes
+
+# Columnas de cada bloque del vector. Los productos y los estilos se reparten
+# por hash entre un número fijo de columnas, así que la matriz no crece con
+# el catálogo de productos (dos productos pueden compartir columna)
+DIMENSIONES_PRODUCTO = 64
+TRAMOS_CALORIAS = (250, 350, 450, 550)  # límites de los tramos de calorías
+DIMENSIONES_ESTILO = 24
+DIMENSIONES = (DIMENSIONES_PRODUCTO + len(TRAMOS_CALORIAS) + 1 + len(TIEMPO_MAXIMO)
+               + DIMENSIONES_ESTILO)
+
+# Parte de la similitud que aporta cada bloque (suman 1)
+PESO_INGREDIENTES = 0.6
+PESO_NUTRICION = 0.25
+PESO_ESTILO = 0.15
+
+_NUTRICION = DIMENSIONES_PRODUCTO
+_TIEMPO = _NUTRICION + len(TRAMOS_CALORIAS) + 1
+_ESTILO = _TIEMPO + len(TIEMPO_MAXIMO)
+
+
+# ==================== VECTORES ====================
+
+def _ingredientes(almacen: AlmacenRecetas, posiciones: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(índice en `posiciones`, columna del producto) de cada ingrediente"""
+    longitudes = almacen.ing_longitud.datos[posiciones]
+    indices = np.repeat(np.arange(len(posiciones)), longitudes)
+    filas = np.repeat(almacen.ing_inicio.datos[posiciones], longitudes) + (
+        np.arange(len(indices)) - np.repeat(np.cumsum(longitudes) - longitudes, longitudes)
+    )
+    return indices, almacen.ing_producto.datos[filas] % DIMENSIONES_PRODUCTO
+
+
+def _idf(almacen: AlmacenRecetas) -> np.ndarray:
+    """Peso de cada columna de producto: los productos de casi todas las recetas cuentan poco"""
+    n = len(almacen)
+    indices, columnas = _ingredientes(almacen, np.arange(n))
+    distintos = np.unique(indices.astype(np.int64) * DIMENSIONES_PRODUCTO + columnas)
+    recetas = np.bincount(distintos % DIMENSIONES_PRODUCTO, minlength=DIMENSIONES_PRODUCTO)
+    return (np.log((1 + n) / (1 + recetas)) + 1).astype(np.float32)
+
+
+def _columna_estilo(cadena: str) -> int:
+    # crc32 y no hash(): tiene que dar lo mismo en todos los procesos
+    return _ESTILO + zlib.crc32(cadena.encode("utf-8")) % DIMENSIONES_ESTILO
+
+
+def _normalizar(bloque: np.ndarray, peso: float) -> None:
+    """Escala cada fila del bloque a norma √peso (las filas a cero se quedan igual)"""
+    normas = np.linalg.norm(bloque, axis=1, keepdims=True)
+    np.divide(bloque * np.float32(np.sqrt(peso)), normas, out=bloque, where=normas > 0)
+
+
+def _codificar(almacen: AlmacenRecetas, tabla: TablaResumenes, posiciones: np.ndarray,
+               idf: np.ndarray) -> np.ndarray:
+    """Vectores de norma 1 de las recetas de `posiciones`, uno por fila"""
+    vectores = np.zeros((len(posiciones), DIMENSIONES), dtype=np.float32)
+    filas = np.arange(len(posiciones))
+
+    indices, columnas = _ingredientes(almacen, posiciones)
+    vectores[indices, columnas] = idf[columnas]
+    _normalizar(vectores[:, :_NUTRICION], PESO_INGREDIENTES)
+
+    vectores[filas, _NUTRICION + np.searchsorted(TRAMOS_CALORIAS, tabla.calorias[posiciones],
+                                                 side="right")] = 1
+    vectores[filas, _TIEMPO + tabla.clase_tiempo[posiciones]] = 1
+    _normalizar(vectores[:, _NUTRICION:_ESTILO], PESO_NUTRICION)
+
+    # El tipo de comida y el estilo, internados en el almacén: se calcula la
+    # columna de cada cadena distinta una sola vez
+    for codigos, prefijo in ((almacen.tipo.datos[posiciones], "tipo:"),
+                             (almacen.estilo.datos[posiciones], "estilo:")):
+        distintos, inversos = np.unique(codigos, return_inverse=True)
+        columnas = np.array([
+            _columna_estilo(prefijo + almacen.cadenas[codigo]) if codigo != AUSENTE else -1
+            for codigo in distintos.tolist()
+        ], dtype=np.int64)[inversos]
+        conocidas = columnas >= 0
+        vectores[filas[conocidas], columnas[conocidas]] = 1
+    _normalizar(vectores[:, _ESTILO:], PESO_ESTILO)
+
+    # Sin estilo o sin ingredientes la norma no llega a 1
+    _normalizar(vectores, 1.0)
+    return vectores
+
+
+class TablaVectores:
+    """
+    Matriz de vectores de las recetas, una fila por posición del catálogo
+
+    Los vectores tienen norma 1, así que el producto con el perfil de un
+    usuario (también de norma 1) es la similitud del coseno con cada
+    receta, para todo el catálogo en una sola multiplicación. La matriz
+    reserva filas de sobra para añadir recetas sin copiarla cada vez.
+    """
+
+    # Arrays de la tabla, en el orden en que se guardan (la matriz, aplanada)
+    COLUMNAS = ("vectores", "idf")
+
+    def __init__(self, almacen: AlmacenRecetas, tabla: TablaResumenes):
+        self.n = len(almacen)
+        self.idf = _idf(almacen)
+        self.vectores = _codificar(almacen, tabla, np.arange(self.n), self.idf)
+
+    @classmethod
+    def desde_columnas(cls, columnas) -> "TablaVectores":
+        """Tabla sobre arrays ya calculados (p. ej. mapeados de una instantánea)"""
+        tabla = cls.__new__(cls)
+        tabla.vectores = columnas["vectores"].reshape(-1, DIMENSIONES)
+        tabla.idf = columnas["idf"]
+        tabla.n = len(tabla.vectores)
+        return tabla
+
+    def __len__(self) -> int:
+        return self.n
+
+    def matriz(self) -> np.ndarray:
+        """Las filas ocupadas (una vista)"""
+        return self.vectores[:self.n]
+
+    def actualizar(self, posiciones: List[int], almacen: AlmacenRecetas,
+                   tabla: TablaResumenes) -> None:
+        """Recalcula las filas de `posiciones` con el idf de la construcción"""
+        necesarias = max(posiciones) + 1
+        if necesarias > len(self.vectores):
+            nuevos = np.zeros((max(2 * len(self.vectores), necesarias, 16), DIMENSIONES),
+                              dtype=np.float32)
+            nuevos[:self.n] = self.vectores[:self.n]
+            self.vectores = nuevos
+        self.n = max(self.n, necesarias)
+        posiciones = np.asarray(posiciones, dtype=np.int64)
+        self.vectores[posiciones] = _codificar(almacen, tabla, posiciones, self.idf)
+
+    def perfil(self, posiciones: Iterable[int]) -> np.ndarray:
+        """Vector de norma 1 en la dirección media de las recetas de `posiciones`"""
+        perfil = self.vectores[np.asarray(list(posiciones), dtype=np.int64)].sum(axis=0)
+        norma = np.linalg.norm(perfil)
+        return perfil / norma if norma else perfil
+
+    def similitud(self, perfiles: np.ndarray) -> np.ndarray:
+        """
+        Similitud de cada receta con cada perfil: (recetas,) para un perfil,
+        (recetas, perfiles) para una matriz de perfiles por filas
+        """
+        return self.matriz() @ perfiles.T
+
+
+# ==================== RECOMENDADOR ====================
+
+class Recomendador(DerivadoCatalogo):
+    """
+    Recetas parecidas a las que le gustan a un usuario
+
+    La matriz se construye en el primer acceso y cada cambio suelto del
+    catálogo recalcula solo las filas afectadas. El peso de cada producto
+    (idf) se fija al construir: las recetas añadidas después no lo cambian
+    hasta la siguiente recarga.
+    """
+
+    def __init__(self, catalogo: CatalogoRecetas, resumenes: ResumenesRecetas):
+        # Se suscribe después de los resúmenes, así que sus parches ya están aplicados
+        self.resumenes = resumenes
+        super().__init__(catalogo)
+
+    def _construir(self) -> TablaVectores:
+        return TablaVectores(self.catalogo.todas(), self.resumenes.tabla())
+
+    def _parchear(self, tabla: TablaVectores, posiciones: List[int]) -> None:
+        tabla.actualizar(posiciones, self.catalogo.todas(), self.resumenes.tabla())
+
+    def _parchear_precios(self, tabla: TablaVectores, posiciones: List[int]) -> None:
+        pass  # los precios no intervienen en los vectores
+
+    def _posiciones(self, recetas_ids: Iterable[int]) -> List[int]:
+        posiciones = (self.catalogo.posicion(receta_id) for receta_id in recetas_ids)
+        return list(dict.fromkeys(p for p in posiciones if p is not None))
+
+    def afinidad(self, recetas_ids: Iterable[int]) -> Optional[np.ndarray]:
+        """
+        Similitud (de 0 a 1) de cada posición del catálogo con las recetas
+        de `recetas_ids`, o None si ninguna existe
+        """
+        posiciones = self._posiciones(recetas_ids)
+        return self._afinidad(posiciones) if posiciones else None
+
+    def _afinidad(self, posiciones: List[int]) -> np.ndarray:
+        with tramo("recomendaciones.similitud"):
+            tabla = self.datos()
+            return tabla.similitud(tabla.perfil(posiciones))
+
+    def recomendar(self, recetas_ids: Iterable[int], tipo_comida: Optional[str] = None,
+                   excluidos: int = 0,
+                   limite: int = 10) -> Optional[Tuple[np.ndarray, np.ndarray, int]]:
+        """
+        Posiciones de las `limite` recetas más parecidas a las de
+        `recetas_ids` (sin ellas), su similitud y el número de recetas que
+        cumplen los filtros; None si ninguna de `recetas_ids` existe
+        """
+        posiciones = self._posiciones(recetas_ids)
+        if not posiciones:
+            return None
+        afinidad = self._afinidad(posiciones)
+        with tramo("recomendaciones.ordenar"):
+            if tipo_comida is not None:
+                candidatas = self.catalogo.posiciones_tipo(tipo_comida)
+            else:
+                candidatas = np.arange(len(afinidad))
+            candidatas = candidatas[~np.isin(candidatas, posiciones)]
+            if excluidos:
+                candidatas = candidatas[self.resumenes.tabla().compatibles(excluidos)[candidatas]]
+            elegidas = mejores(candidatas, afinidad, limite)
+        return elegidas, afinidad[elegidas], len(candidatas)
@@ -0,0 +1,368 @@
+"""
+SUPERMERCAI - Repositorio de recetas
+Acceso a las recetas en memoria e importación a SQLite
+
+La aplicación sirve sus rutas desde el catálogo en memoria
+(RepositorioMemoria); la base de datos SQLite es el almacén en frío del que
+se carga ese catálogo al arrancar (cargar_recetas).
+
+Importación masiva desde la línea de comandos:
+    python repositorio.py importar recetas.json --db supermercai.db
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from alergenos import analizar_receta
+from cache import Fragmento, codificar_json
+from catalogo import CatalogoRecetas
+from fragmentos import FragmentosRecetas
+from resumenes import ResumenesRecetas
+
+TAMANO_LOTE = 500
+
+
+# ==================== INTERFAZ ====================
+
+class RepositorioRecetas:
+    """
+    Operaciones de lectura de recetas que usan las rutas
+
+    `excluidos` es una máscara de alergenos.BITS: se omiten las recetas que
+    tengan alguna de esas marcas (0 = sin filtro).
+    """
+
+    @property
+    def version(self) -> int:
+        """Cambia cada vez que cambia el contenido (para claves de caché)"""
+        raise NotImplementedError
+
+    async def obtener(self, receta_id: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def obtener_varias(self, recetas_ids: Iterable[int]) -> List[dict]:
+        raise NotImplementedError
+
+    async def por_tipo(self, tipo_comida: str) -> List[dict]:
+        raise NotImplementedError
+
+    async def por_producto(self, producto_id: int) -> List[dict]:
+        raise NotImplementedError
+
+    async def contar(self, excluidos: int = 0) -> int:
+        raise NotImplementedError
+
+    async def pagina(self, despues_de: Optional[int] = None, limite: int = 50,
+                     excluidos: int = 0) -> Tuple[List[dict], Optional[int]]:
+        """Recetas en orden de carga tras `despues_de` y el id de la siguiente página"""
+        raise NotImplementedError
+
+    async def pagina_json(self, despues_de: Optional[int] = None, limite: int = 50,
+                          excluidos: int = 0) -> Tuple[List[Fragmento], Optional[int]]:
+        """Como `pagina`, con cada receta ya codificada en JSON"""
+        recetas, siguiente = await self.pagina(despues_de, limite, excluidos)
+        return [Fragmento(codificar_json(receta)) for receta in recetas], siguiente
+
+    async def recorrer(self, despues_de: Optional[int] = None,
+                       excluidos: int = 0) -> AsyncIterator[dict]:
+        """Todas las recetas tras `despues_de`, leídas por lotes"""
+        while True:
+            recetas, siguiente = await self.pagina(despues_de, TAMANO_LOTE, excluidos)
+            for receta in recetas:
+                yield receta
+            if siguiente is None:
+                return
+            despues_de = siguiente
+
+    def cerrar(self) -> None:
+        """Libera conexiones y hilos (nada que hacer en memoria)"""
+
+
+# ==================== MEMORIA ====================
+
+class RepositorioMemoria(RepositorioRecetas):
+    """
+    Repositorio sobre el catálogo indexado en memoria
+
+    Los filtros de alérgenos y dieta se resuelven con una única operación
+    vectorizada sobre las máscaras de la tabla de resúmenes. Con
+    `fragmentos`, las páginas en JSON se montan con las recetas ya codificadas.
+    """
+
+    def __init__(self, catalogo: CatalogoRecetas, resumenes: ResumenesRecetas,
+                 fragmentos: Optional[FragmentosRecetas] = None):
+        self.catalogo = catalogo
+        self.resumenes = resumenes
+        self.fragmentos = fragmentos
+
+    @property
+    def version(self) -> int:
+        return self.catalogo.version
+
+    async def obtener(self, receta_id: int) -> Optional[dict]:
+        return self.catalogo.obtener(receta_id)
+
+    async def obtener_varias(self, recetas_ids: Iterable[int]) -> List[dict]:
+        return self.catalogo.obtener_varias(recetas_ids)
+
+    async def por_tipo(self, tipo_comida: str) -> List[dict]:
+        return self.catalogo.por_tipo(tipo_comida)
+
+    async def por_producto(self, producto_id: int) -> List[dict]:
+        return self.catalogo.por_producto(producto_id)
+
+    async def contar(self, excluidos: int = 0) -> int:
+        if not excluidos:
+            return len(self.catalogo)
+        return int(np.count_nonzero(self.resumenes.tabla().compatibles(excluidos)))
+
+    def _posiciones(self, despues_de: Optional[int], excluidos: int) -> np.ndarray:
+        """Posiciones compatibles desde la siguiente a `despues_de`"""
+        inicio = self.catalogo.inicio(despues_de)
+        compatibles = self.resumenes.tabla().compatibles(excluidos)
+        return np.flatnonzero(compatibles[inicio:]) + inicio
+
+    async def pagina(self, despues_de: Optional[int] = None, limite: int = 50,
+                     excluidos: int = 0) -> Tuple[List[dict], Optional[int]]:
+        if not excluidos:
+            return self.catalogo.pagina(despues_de, limite)
+        recetas = self.catalogo.todas()
+        posiciones = self._posiciones(despues_de, excluidos)
+        pagina = [recetas[posicion] for posicion in posiciones[:limite].tolist()]
+        siguiente = pagina[-1]["id"] if len(posiciones) > limite else None
+        return pagina, siguiente
+
+    async def pagina_json(self, despues_de: Optional[int] = None, limite: int = 50,
+                          excluidos: int = 0) -> Tuple[List[Fragmento], Optional[int]]:
+        if self.fragmentos is None:
+            return await super().pagina_json(despues_de, limite, excluidos)
+        if excluidos:
+            posiciones = self._posiciones(despues_de, excluidos)
+            pagina, hay_mas = posiciones[:limite].tolist(), len(posiciones) > limite
+        else:
+            inicio = self.catalogo.inicio(despues_de)
+            pagina = list(range(inicio, min(inicio + limite, len(self.catalogo))))
+            hay_mas = inicio + limite < len(self.catalogo)
+        siguiente = self.catalogo.todas().id_en(pagina[-1]) if hay_mas else None
+        return self.fragmentos.en(pagina), siguiente
+
+    async def recorrer(self, despues_de: Optional[int] = None,
+                       excluidos: int = 0) -> AsyncIterator[dict]:
+        # Sin lotes: recorre la instantánea actual sin copiarla
+        if not excluidos:
+            for receta in self.catalogo.desde(despues_de):
+                yield receta
+            return
+        recetas = self.catalogo.todas()
+        for posicion in self._posiciones(despues_de, excluidos).tolist():
+            yield recetas[posicion]
+
+
+# ==================== SQLITE ====================
+
+ESQUEMA = [
+    """CREATE TABLE IF NOT EXISTS recetas (
+    id INTEGER PRIMARY KEY,
+    posicion INTEGER NOT NULL UNIQUE,
+    tipo_comida TEXT NOT NULL,
+    calorias INTEGER NOT NULL,
+    tiempo_preparacion INTEGER NOT NULL,
+    alergenos INTEGER NOT NULL,
+    datos TEXT NOT NULL
+)""",
+    """CREATE TABLE IF NOT EXISTS ingredientes (
+    receta_id INTEGER NOT NULL,
+    producto_id INTEGER NOT NULL,
+    PRIMARY KEY (producto_id, receta_id)
+) WITHOUT ROWID""",
+    "CREATE TABLE IF NOT EXISTS metadatos (clave TEXT PRIMARY KEY, valor TEXT NOT NULL)",
+]
+# Índices secundarios: se crean después de insertar
+INDICES = ["CREATE INDEX IF NOT EXISTS recetas_tipo ON recetas (tipo_comida, posicion)"]
+
+SQL_VERSION = "SELECT valor FROM metadatos WHERE clave = 'version'"
+
+
+class PoolSQLite:
+    """
+    Conexiones SQLite de solo lectura, una por hilo de un ejecutor acotado
+
+    Cada hilo abre su conexión la primera vez que la necesita y la reutiliza;
+    sqlite3 mantiene las sentencias preparadas en caché por conexión, así que
+    las consultas frecuentes no se vuelven a compilar.
+    """
+
+    def __init__(self, ruta: str, tamano: int = 4):
+        self.ruta = ruta
+        self.tamano = tamano
+        self._iniciar()
+        if hasattr(os, "register_at_fork"):
+            # Los hilos y las conexiones no sobreviven a fork: cada proceso
+            # hijo (servidor.py) abre los suyos
+            referencia = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: _reiniciar_pool(referencia))
+
+    def _iniciar(self) -> None:
+        self._ejecutor = ThreadPoolExecutor(max_workers=self.tamano, thread_name_prefix="sqlite")
+        self._local = threading.local()
+        self._conexiones: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _conexion(self) -> sqlite3.Connection:
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(
+                f"file:{self.ruta}?mode=ro", uri=True,
+                check_same_thread=False, cached_statements=64,
+            )
+            conexion.execute("PRAGMA query_only = ON")
+            self._local.conexion = conexion
+            with self._lock:
+                self._conexiones.append(conexion)
+        return conexion
+
+    def _ejecutar_varias(self, consultas: List[tuple]) -> List[List[tuple]]:
+        conexion = self._conexion()
+        return [conexion.execute(sql, parametros).fetchall() for sql, parametros in consultas]
+
+    async def consultar_varias(self, consultas: List[tuple]) -> List[List[tuple]]:
+        """Varias consultas (sql, parámetros) seguidas en un solo viaje al pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._ejecutor, self._ejecutar_varias, consultas)
+
+    def cerrar(self) -> None:
+        self._ejecutor.shutdown(wait=True)
+        with self._lock:
+            for conexion in self._conexiones:
+                conexion.close()
+            self._conexiones.clear()
+
+
+def _reiniciar_pool(referencia: weakref.ref) -> None:
+    # Las conexiones heredadas se abandonan sin cerrar: SQLite no admite usar
+    # en el hijo una conexión abierta antes de fork
+    pool = referencia()
+    if pool is not None:
+        pool._iniciar()
+
+
+def cargar_recetas(ruta: str) -> List[dict]:
+    """Todas las recetas de una base de datos creada con `importar`, en orden de carga"""
+    conexion = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+    try:
+        filas = conexion.execute("SELECT datos FROM recetas ORDER BY posicion").fetchall()
+    finally:
+        conexion.close()
+    return [json.loads(fila[0]) for fila in filas]
+
+
+# ==================== IMPORTACIÓN MASIVA ====================
+
+def importar(recetas: Iterable[dict], ruta: str) -> int:
+    """
+    Sustituye el contenido de la base de datos por las recetas dadas
+
+    Borrado, creación de tablas e inserción van en una sola transacción: si
+    algo falla, la base de datos queda como estaba. Se inserta con
+    executemany y los índices secundarios se crean al final. Devuelve el
+    número de recetas importadas.
+    """
+    # Sin transacciones implícitas: en modo por defecto sqlite3 confirma cada
+    # DROP y CREATE por separado
+    conexion = sqlite3.connect(ruta, isolation_level=None)
+    try:
+        conexion.execute("PRAGMA journal_mode = WAL")
+        conexion.execute("PRAGMA synchronous = OFF")
+        conexion.execute("BEGIN")
+        try:
+            total = _reemplazar(conexion, recetas)
+            conexion.execute("COMMIT")
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+        conexion.execute("PRAGMA synchronous = NORMAL")
+        conexion.execute("ANALYZE")
+        return total
+    finally:
+        conexion.close()
+
+
+def _reemplazar(conexion: sqlite3.Connection, recetas: Iterable[dict]) -> int:
+    conexion.execute("DROP INDEX IF EXISTS recetas_tipo")
+    # La tabla se recrea para que las bases de datos antiguas tomen las columnas nuevas
+    conexion.execute("DROP TABLE IF EXISTS recetas")
+    for sentencia in ESQUEMA:
+        conexion.execute(sentencia)
+    conexion.execute("DELETE FROM ingredientes")
+    filas_version = conexion.execute(SQL_VERSION).fetchall()
+    version = int(filas_version[0][0]) + 1 if filas_version else 1
+
+    total = 0
+    lote_recetas, lote_ingredientes = [], []
+    for posicion, receta in enumerate(recetas):
+        lote_recetas.append((
+            receta["id"], posicion, receta["tipo_comida"], receta["calorias"],
+            receta["tiempo_preparacion"], analizar_receta(receta)[0],
+            json.dumps(receta, ensure_ascii=False, separators=(",", ":")),
+        ))
+        lote_ingredientes.extend(
+            (receta["id"], producto_id)
+            for producto_id in dict.fromkeys(i["producto_id"] for i in receta["ingredientes"])
+        )
+        if len(lote_recetas) >= 10_000:
+            total += _volcar(conexion, lote_recetas, lote_ingredientes)
+    total += _volcar(conexion, lote_recetas, lote_ingredientes)
+    conexion.execute(
+        "INSERT OR REPLACE INTO metadatos (clave, valor) VALUES ('version', ?)", (str(version),)
+    )
+    for sentencia in INDICES:
+        conexion.execute(sentencia)
+    return total
+
+
+def _volcar(conexion: sqlite3.Connection, recetas: list, ingredientes: list) -> int:
+    conexion.executemany("INSERT INTO recetas VALUES (?, ?, ?, ?, ?, ?, ?)", recetas)
+    conexion.executemany("INSERT OR IGNORE INTO ingredientes VALUES (?, ?)", ingredientes)
+    total = len(recetas)
+    recetas.clear()
+    ingredientes.clear()
+    return total
+
+
+def leer_recetas(ruta: str) -> Iterable[dict]:
+    """Recetas de un fichero JSON (lista) o NDJSON (una por línea)"""
+    with open(ruta, encoding="utf-8") as fichero:
+        if ruta.endswith(".ndjson") or ruta.endswith(".jsonl"):
+            for linea in fichero:
+                if linea.strip():
+                    yield json.loads(linea)
+        else:
+            yield from json.load(fichero)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Herramientas del repositorio de recetas")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    importacion = subcomandos.add_parser("importar", help="Importa recetas desde JSON o NDJSON")
+    importacion.add_argument("fichero")
+    importacion.add_argument("--db", default="supermercai.db")
+    argumentos = parser.parse_args()
+
+    inicio = time.perf_counter()
+    total = importar(leer_recetas(argumentos.fichero), argumentos.db)
+    print(f"{total} recetas importadas en {argumentos.db} "
+          f"({time.perf_counter() - inicio:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+SUPERMERCAI - Resúmenes precalculados por receta
+Coste, calorías, tiempo y marcas de alérgenos y dieta en arrays alineados con el catálogo
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+from alergenos import analizar_receta, compatibles
+from catalogo import DerivadoCatalogo
+
+# Raciones para las que están escritas las cantidades de una receta si no
+# indica "raciones" (coincide con el num_personas por defecto)
+RACIONES_BASE = 2
+
+# Minutos máximos por receta según el tiempo disponible (None = sin límite)
+TIEMPO_MAXIMO = {"poco": 30, "medio": 45, "mucho": None}
+
+
+def clase_tiempo(minutos: int) -> int:
+    """Posición del primer tiempo de cocina de TIEMPO_MAXIMO que admite la receta"""
+    for clase, maximo in enumerate(TIEMPO_MAXIMO.values()):
+        if maximo is None or minutos <= maximo:
+            return clase
+    return len(TIEMPO_MAXIMO) - 1
+
+
+def coste_receta(receta: dict, num_personas: int) -> float:
+    """Coste de una receta suelta para los comensales, como en TablaResumenes"""
+    coste = sum(ing["precio"] for ing in receta["ingredientes"])
+    return coste / receta.get("raciones", RACIONES_BASE) * num_personas
+
+
+class TablaResumenes:
+    """
+    Una fila por receta, en la misma posición que en el catálogo
+
+    Los valores numéricos viven en arrays de NumPy para filtrar y puntuar
+    sin recorrer los diccionarios de las recetas; estilo y texto de
+    ingredientes quedan en listas porque solo se consultan por posición.
+    """
+
+    def __init__(self, recetas: List[dict]):
+        n = len(recetas)
+        self.coste = np.zeros(n, dtype=np.float64)
+        self.coste_racion = np.zeros(n, dtype=np.float64)
+        self.calorias = np.zeros(n, dtype=np.int32)
+        self.tiempo = np.zeros(n, dtype=np.int32)
+        self.clase_tiempo = np.zeros(n, dtype=np.int8)
+        self.alergenos = np.zeros(n, dtype=np.uint32)
+        self.estilo: List[str] = [None] * n
+        self.texto: List[str] = [""] * n
+        for posicion, receta in enumerate(recetas):
+            self._rellenar(posicion, receta)
+
+    # Arrays de la tabla, en el orden en que se guardan
+    COLUMNAS = ("coste", "coste_racion", "calorias", "tiempo", "clase_tiempo", "alergenos")
+
+    @classmethod
+    def desde_columnas(cls, columnas: Dict[str, np.ndarray], estilo: List[str],
+                       texto: List[str]) -> "TablaResumenes":
+        """Tabla sobre arrays ya calculados (p. ej. mapeados de una instantánea)"""
+        tabla = cls.__new__(cls)
+        for nombre in cls.COLUMNAS:
+            setattr(tabla, nombre, columnas[nombre])
+        tabla.estilo = estilo
+        tabla.texto = texto
+        return tabla
+
+    def __len__(self) -> int:
+        return len(self.coste)
+
+    def _rellenar(self, posicion: int, receta: dict) -> None:
+        coste = sum(ing["precio"] for ing in receta["ingredientes"])
+        mascara, texto = analizar_receta(receta)
+        self.coste[posicion] = coste
+        self.coste_racion[posicion] = coste / receta.get("raciones", RACIONES_BASE)
+        self.calorias[posicion] = receta["calorias"]
+        self.tiempo[posicion] = receta["tiempo_preparacion"]
+        self.clase_tiempo[posicion] = clase_tiempo(receta["tiempo_preparacion"])
+        self.alergenos[posicion] = mascara
+        self.estilo[posicion] = receta.get("estilo_cocina")
+        self.texto[posicion] = texto
+
+    def actualizar(self, posicion: int, receta: dict) -> None:
+        """Recalcula una fila; una posición nueva amplía los arrays"""
+        if posicion >= len(self):
+            extra = posicion + 1 - len(self)
+            for nombre in self.COLUMNAS:
+                columna = getattr(self, nombre)
+                setattr(self, nombre, np.concatenate([columna, np.zeros(extra, columna.dtype)]))
+            self.estilo.extend([None] * extra)
+            self.texto.extend([""] * extra)
+        self._rellenar(posicion, receta)
+
+    def actualizar_costes(self, posiciones: List[int], almacen) -> None:
+        """Recalcula de una vez el coste de varias recetas a partir de las columnas del almacén"""
+        posiciones = np.asarray(posiciones, dtype=np.int64)
+        longitudes = almacen.ing_longitud.datos[posiciones]
+        receta = np.repeat(np.arange(len(posiciones)), longitudes)
+        coste = np.bincount(receta, weights=almacen.ing_precio.datos[almacen.filas_de(posiciones)],
+                            minlength=len(posiciones))
+        extras = almacen.extras
+        raciones = np.fromiter(
+            (extras[p].get("raciones", RACIONES_BASE) if p in extras else RACIONES_BASE
+             for p in posiciones.tolist()),
+            dtype=np.float64, count=len(posiciones),
+        )
+        self.coste[posiciones] = coste
+        self.coste_racion[posiciones] = coste / raciones
+
+    def compatibles(self, excluidos: int) -> np.ndarray:
+        """Máscara booleana de las recetas sin ninguna marca de `excluidos`"""
+        return compatibles(self.alergenos, excluidos)
+
+    def coste_personas(self, posiciones: np.ndarray, num_personas: int) -> np.ndarray:
+        """Coste de cada receta escalado al número de comensales"""
+        return self.coste_racion[posiciones] * num_personas
+
+
+class ResumenesRecetas(DerivadoCatalogo):
+    """Tabla de resúmenes del catálogo, parcheada fila a fila en cada cambio"""
+
+    def _construir(self) -> TablaResumenes:
+        return TablaResumenes(self.catalogo.todas())
+
+    def _parchear(self, tabla: TablaResumenes, posiciones: List[int]) -> None:
+        recetas = self.catalogo.todas()
+        for posicion in posiciones:
+            tabla.actualizar(posicion, recetas[posicion])
+
+    def _parchear_precios(self, tabla: TablaResumenes, posiciones: List[int]) -> None:
+        tabla.actualizar_costes(posiciones, self.catalogo.todas())
+
+    def tabla(self) -> TablaResumenes:
+        return self.datos()
@@ -0,0 +1,180 @@
+"""
+SUPERMERCAI - Servidor de producción
+Varios procesos uvicorn que comparten el catálogo cargado antes de bifurcar
+
+El proceso principal importa main (catálogo, planificador, carrito y
+fragmentos ya construidos), congela esos objetos para el recolector de
+basura, abre el socket y bifurca los trabajadores. Los hijos heredan las
+páginas del catálogo sin copiarlas mientras no las modifiquen, así que
+cada trabajador más apenas añade memoria. Con SUPERMERCAI_INSTANTANEA el
+catálogo ya está en un fichero mapeado y la precarga se reduce casi a
+construir el planificador. El principal vigila a los hijos, relanza los
+que mueren y, con SIGTERM o SIGINT, los apaga ordenadamente. Los feeds de
+precios que recibe un trabajador pasan a los demás por un fichero compartido
+(precios.DiarioFeeds).
+
+Uso:
+    python servidor.py --workers 4 --port 8000
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import tempfile
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+from lotes import procesos_por_defecto
+
+TIMEOUT_CIERRE = 30  # segundos para terminar las peticiones en curso al apagar
+ESPERA_REINICIO = 1.0  # pausa antes de relanzar un trabajador que murió nada más nacer
+
+logger = logging.getLogger("uvicorn.error")
+
+
+# ==================== PRECARGA ====================
+
+def precargar():
+    """
+    Importa la aplicación y construye todas las estructuras derivadas del
+    catálogo, para que los trabajadores las hereden ya hechas
+    """
+    import main
+
+    for derivado in (main.resumenes, main.planificador, main.agregador_carrito, main.fragmentos,
+                     main.busqueda, main.recomendador, main.precios):
+        if derivado is not None:
+            derivado.datos()
+    # Lo que existe ya no cambia: fuera del alcance del recolector, que si
+    # no recorrería (y escribiría) esas páginas en cada hijo
+    gc.collect()
+    gc.freeze()
+    return main
+
+
+# ==================== SUPERVISOR ====================
+
+class Supervisor:
+    """Abre el socket, bifurca los trabajadores y los mantiene vivos hasta el apagado"""
+
+    def __init__(self, config: uvicorn.Config, trabajadores: int):
+        self.config = config
+        self.trabajadores = trabajadores
+        self._hijos: Dict[int, float] = {}  # pid -> instante de arranque
+        self._deteniendo = False
+        self._socket: Optional[socket.socket] = None
+
+    def ejecutar(self) -> None:
+        self._socket = self.config.bind_socket()
+        signal.signal(signal.SIGTERM, self._detener)
+        signal.signal(signal.SIGINT, self._detener)
+        signal.signal(signal.SIGALRM, self._forzar)
+        for _ in range(self.trabajadores):
+            self._lanzar()
+        logger.info("%d trabajadores atendiendo en http://%s:%d (pid %d)",
+                    self.trabajadores, self.config.host, self.config.port, os.getpid())
+
+        while self._hijos:
+            try:
+                pid, estado = os.wait()
+            except ChildProcessError:
+                break
+            arranque = self._hijos.pop(pid, None)
+            if arranque is None or self._deteniendo:
+                continue
+            logger.warning("El trabajador %d terminó (código %d); se relanza",
+                           pid, os.waitstatus_to_exitcode(estado))
+            if time.monotonic() - arranque < ESPERA_REINICIO:
+                time.sleep(ESPERA_REINICIO)
+            if not self._deteniendo:
+                self._lanzar()
+
+        signal.alarm(0)
+        self._socket.close()
+        logger.info("Servidor detenido")
+
+    def _lanzar(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            codigo = 1
+            try:
+                for senal in (signal.SIGTERM, signal.SIGINT, signal.SIGALRM):
+                    signal.signal(senal, signal.SIG_DFL)
+                # uvicorn instala sus propios manejadores: con SIGTERM deja de
+                # aceptar conexiones y espera a las peticiones en curso
+                uvicorn.Server(self.config).run(sockets=[self._socket])
+                codigo = 0
+            finally:
+                os._exit(codigo)
+        self._hijos[pid] = time.monotonic()
+
+    def _detener(self, senal: int, _frame) -> None:
+        if self._deteniendo:
+            self._forzar(senal, _frame)  # segunda señal: apagado inmediato
+            return
+        self._deteniendo = True
+        logger.info("Apagando %d trabajadores", len(self._hijos))
+        self._enviar(signal.SIGTERM)
+        signal.alarm(int(self.config.timeout_graceful_shutdown or TIMEOUT_CIERRE) + 5)
+
+    def _forzar(self, _senal: int, _frame) -> None:
+        logger.warning("Trabajadores sin terminar: se matan")
+        self._enviar(signal.SIGKILL)
+
+    def _enviar(self, senal: int) -> None:
+        for pid in list(self._hijos):
+            try:
+                os.kill(pid, senal)
+            except ProcessLookupError:
+                pass
+
+
+# ==================== EJECUCIÓN ====================
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de producción de SupermercAI")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--loop", default="auto", choices=["auto", "asyncio", "uvloop"],
+                        help="auto usa uvloop si está instalado")
+    parser.add_argument("--http", default="auto", choices=["auto", "h11", "httptools"],
+                        help="auto usa httptools si está instalado")
+    parser.add_argument("--timeout-cierre", type=int, default=TIMEOUT_CIERRE)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    aplicacion = precargar()
+    # Cada trabajador tiene su pool para los lotes: las CPU se reparten entre ellos
+    aplicacion.generador_lotes.procesos = procesos_por_defecto(args.workers)
+    config = uvicorn.Config(
+        aplicacion.app, host=args.host, port=args.port, loop=args.loop, http=args.http,
+        backlog=args.backlog, timeout_graceful_shutdown=args.timeout_cierre,
+        log_level=args.log_level, access_log=False,
+    )
+    logger.info("Catálogo de %d recetas precargado en %.2f s",
+                len(aplicacion.catalogo), time.perf_counter() - inicio)
+
+    if not hasattr(os, "fork") or args.workers <= 1:
+        uvicorn.Server(config).run()
+        return
+    # Los feeds de precios que recibe un trabajador llegan a los demás a través
+    # de este fichero
+    descriptor, ruta_diario = tempfile.mkstemp(prefix="supermercai-precios-", suffix=".ndjson")
+    os.close(descriptor)
+    aplicacion.diario_precios.compartir(ruta_diario)
+    try:
+        Supervisor(config, args.workers).ejecutar()
+    finally:
+        os.unlink(ruta_diario)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,13 @@ const appState = {
   menuActual: null,
   preferencias: null,
   carrito: [],
-  recetaActual: null
+  recetaActual: null,
+  alternativas: {}  // índice del menú -> sustitutas pendientes para ese hueco
 };
 
+// Sustitutas que se piden de una vez al cambiar una receta
+const ALTERNATIVAS_POR_PETICION = 5;
+
 // ==================== ELEMENTOS DEL DOM ====================
 const elements = {
   // Botones principales
@@ -59,14 +63,21 @@ async function generarMenu(preferencias) {
   }
 }
 
-async function regenerarReceta(dia, preferencias) {
+async function regenerarReceta(receta, menu, preferencias) {
   try {
     const response = await fetch('/api/regenerar-receta', {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json'
       },
-      body: JSON.stringify({ dia, preferencias })
+      body: JSON.stringify({
+        dia: receta.dia,
+        receta_id: receta.id,
+        tipo_comida: receta.tipo_comida,
+        menu: menu.recetas.map(r => r.id),
+        alternativas: ALTERNATIVAS_POR_PETICION,
+        preferencias
+      })
     });
     
     if (!response.ok) {
@@ -82,14 +93,14 @@ async function regenerarReceta(dia, preferencias) {
   }
 }
 
-async function agregarACarrito(recetasIds) {
+async function agregarACarrito(recetasIds, preferenciaMarca) {
   try {
     const response = await fetch('/api/agregar-a-carrito', {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json'
       },
-      body: JSON.stringify({ recetas_ids: recetasIds })
+      body: JSON.stringify({ recetas_ids: recetasIds, preferencia_marca: preferenciaMarca })
     });
     
     if (!response.ok) {
@@ -130,7 +141,7 @@ function mostrarMenu(menuData) {
   elements.menuGrid.innerHTML = '';
   
   menuData.recetas.forEach((receta, index) => {
-    const card = crearTarjetaReceta(receta, index + 1);
+    const card = crearTarjetaReceta(receta, index);
     elements.menuGrid.appendChild(card);
   });
   
@@ -138,12 +149,14 @@ function mostrarMenu(menuData) {
   elements.menuSection.scrollIntoView({ behavior: 'smooth' });
 }
 
-function crearTarjetaReceta(receta, dia) {
+function crearTarjetaReceta(receta, index) {
   const card = document.createElement('div');
   card.className = 'recipe-card';
   
   const dias = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'];
+  const dia = receta.dia || index + 1;
   const nombreDia = dias[dia - 1] || `Día ${dia}`;
+  const etiqueta = receta.tipo_comida ? `${nombreDia} · ${receta.tipo_comida}` : nombreDia;
   
   // Calcular costo de la receta
   const costoReceta = receta.ingredientes.reduce((total, ing) => total + ing.precio, 0);
@@ -153,7 +166,7 @@ function crearTarjetaReceta(receta, dia) {
       🍽️
     </div>
     <div class="recipe-content">
-      <span class="recipe-day">${nombreDia}</span>
+      <span class="recipe-day">${etiqueta}</span>
       <h3>${receta.nombre}</h3>
       <p>${receta.descripcion}</p>
       <div class="recipe-meta">
@@ -165,7 +178,7 @@ function crearTarjetaReceta(receta, dia) {
         <button class="btn-view" onclick="verDetalleReceta(${receta.id})">
           👁️ Ver receta
         </button>
-        <button class="btn-regenerate" onclick="regenerarRecetaIndividual(${dia})">
+        <button class="btn-regenerate" onclick="regenerarRecetaIndividual(${index})">
           🔄 Cambiar
         </button>
       </div>
@@ -243,19 +256,28 @@ window.verDetalleReceta = async function(recetaId) {
   }
 };
 
-window.regenerarRecetaIndividual = async function(dia) {
+window.regenerarRecetaIndividual = async function(index) {
   if (!appState.preferencias) return;
   
+  const receta = appState.menuActual.recetas[index];
+  receta.dia = receta.dia || index + 1;
   const btnRegenerar = event.target;
   btnRegenerar.disabled = true;
   btnRegenerar.textContent = '⏳ Generando...';
   
-  const resultado = await regenerarReceta(dia, appState.preferencias);
+  // Las sustitutas pendientes siguen valiendo mientras el resto del menú no cambie
+  let pendientes = appState.alternativas[index] || [];
+  if (!pendientes.length) {
+    const resultado = await regenerarReceta(receta, appState.menuActual, appState.preferencias);
+    pendientes = resultado && resultado.success ? resultado.alternativas : [];
+  }
   
-  if (resultado && resultado.success) {
+  const alternativa = pendientes.shift();
+  if (alternativa) {
     // Actualizar la receta en el estado
-    const index = dia - 1;
-    appState.menuActual.recetas[index] = resultado.receta;
+    appState.menuActual.recetas[index] = alternativa.receta;
+    appState.menuActual.costo_total = alternativa.costo_total;
+    appState.alternativas = { [index]: pendientes };
     
     // Re-renderizar el menú
     mostrarMenu(appState.menuActual);
@@ -323,6 +345,7 @@ elements.formPreferencias.addEventListener('submit', async (e) => {
   const resultado = await generarMenu(preferencias);
   
   if (resultado && resultado.success) {
+    appState.alternativas = {};
     mostrarMenu(resultado.menu);
   }
 });
@@ -337,6 +360,7 @@ elements.btnRegenerarTodo.addEventListener('click', async () => {
   const resultado = await generarMenu(appState.preferencias);
   
   if (resultado && resultado.success) {
+    appState.alternativas = {};
     mostrarMenu(resultado.menu);
   }
   
@@ -352,7 +376,8 @@ elements.btnConfirmarMenu.addEventListener('click', async () => {
   elements.btnConfirmarMenu.textContent = '⏳ Añadiendo al carrito...';
   
   const recetasIds = appState.menuActual.recetas.map(r => r.id);
-  const resultado = await agregarACarrito(recetasIds);
+  const preferenciaMarca = appState.preferencias ? appState.preferencias.preferencia_marca : undefined;
+  const resultado = await agregarACarrito(recetasIds, preferenciaMarca);
   
   if (resultado && resultado.success) {
     appState.carrito = resultado.carrito.items;
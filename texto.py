@@ -0,0 +1,11 @@
+"""
+SUPERMERCAI - Utilidades de texto
+"""
+
+import unicodedata
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes, para comparar nombres de ingredientes"""
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
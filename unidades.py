@@ -0,0 +1,57 @@
+"""
+SUPERMERCAI - Normalización de unidades de los ingredientes
+"""
+
+from typing import Tuple
+
+from texto import normalizar
+
+
+# Unidad de receta (singular, sin tildes) -> (unidad canónica, factor)
+CONVERSIONES = {
+    "g": ("g", 1.0),
+    "gr": ("g", 1.0),
+    "gramo": ("g", 1.0),
+    "kg": ("g", 1000.0),
+    "ml": ("ml", 1.0),
+    "cl": ("ml", 10.0),
+    "l": ("ml", 1000.0),
+    "litro": ("ml", 1000.0),
+    "cucharada": ("ml", 15.0),
+    "cucharadita": ("ml", 5.0),
+    "taza": ("ml", 250.0),
+    "unidad": ("unidad", 1.0),
+}
+
+# Plurales irregulares; el resto se singulariza quitando la "s" o "es" final
+PLURALES = {
+    "unidades": "unidad",
+    "gramos": "gramo",
+    "litros": "litro",
+}
+
+
+def singular(unidad: str) -> str:
+    """Forma singular y sin tildes de una unidad ("Cucharadas" -> "cucharada")"""
+    unidad = normalizar(unidad.strip())
+    if unidad in PLURALES:
+        return PLURALES[unidad]
+    if unidad in CONVERSIONES:
+        return unidad
+    if unidad.endswith("es") and unidad[:-2] in CONVERSIONES:
+        return unidad[:-2]
+    if unidad.endswith("s") and len(unidad) > 2:
+        return unidad[:-1]
+    return unidad
+
+
+def normalizar_cantidad(cantidad: float, unidad: str) -> Tuple[float, str]:
+    """
+    Convierte una cantidad a su unidad canónica (g, ml o unidad)
+
+    Las unidades sin conversión conocida ("diente", "manojo", "pizca") se
+    conservan en singular para no mezclarlas con otras al sumar.
+    """
+    unidad = singular(unidad)
+    canonica, factor = CONVERSIONES.get(unidad, (unidad, 1.0))
+    return cantidad * factor, canonica
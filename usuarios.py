@@ -0,0 +1,445 @@
+"""
+SUPERMERCAI - Datos de cada usuario
+Recetas favoritas, menús guardados y carrito, con escritura diferida en SQLite
+
+Las lecturas se sirven de una LRU acotada de usuarios; solo los que no
+están en ella se leen del disco, en un hilo. Las escrituras cambian la
+entrada en memoria y dejan la operación pendiente: un hilo las vuelca
+por lotes, en una transacción, cada `intervalo` segundos (o antes si se
+acumulan `max_pendientes`). Ninguna petición espera al disco para
+escribir. Las favoritas pendientes se combinan por (usuario, receta) y
+los carritos por usuario, así que marcar y desmarcar muchas veces entre
+dos volcados escribe una sola fila.
+
+Los carritos y menús guardados llevan el instante en que se calcularon.
+Con `seguir_catalogo`, los que incluyen recetas que han cambiado desde
+entonces (p. ej. por un feed de precios) se recalculan al leerlos y se
+vuelven a guardar por la misma vía diferida.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from repositorio import PoolSQLite
+
+MENUS_POR_USUARIO = 20  # menús más recientes de cada usuario que se guardan en memoria
+# Segundos que se fía de una entrada sin cambios cuando otros procesos
+# (los trabajadores de servidor.py) escriben en la misma base de datos
+VIGENCIA_COMPARTIDA = 2.0
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS favoritas (
+    usuario INTEGER NOT NULL,
+    receta_id INTEGER NOT NULL,
+    creado REAL NOT NULL,
+    PRIMARY KEY (usuario, receta_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS menus (
+    usuario INTEGER NOT NULL,
+    creado REAL NOT NULL,
+    menu TEXT NOT NULL,
+    PRIMARY KEY (usuario, creado)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS carritos (
+    usuario INTEGER PRIMARY KEY,
+    carrito TEXT NOT NULL,
+    actualizado REAL NOT NULL
+);
+"""
+
+SQL_FAVORITAS = "SELECT receta_id, creado FROM favoritas WHERE usuario = ? ORDER BY creado"
+SQL_MENUS = "SELECT creado, menu FROM menus WHERE usuario = ? ORDER BY creado DESC LIMIT ?"
+SQL_CARRITO = "SELECT carrito FROM carritos WHERE usuario = ?"
+
+logger = logging.getLogger(__name__)
+
+
+class DatosUsuario:
+    """Lo que se guarda de un usuario; las favoritas van por receta en orden de marcado"""
+
+    __slots__ = ("favoritas", "menus", "carrito", "leido")
+
+    def __init__(self):
+        self.favoritas: Dict[int, float] = {}
+        self.menus: Deque[dict] = deque(maxlen=MENUS_POR_USUARIO)
+        self.carrito: Optional[dict] = None
+        self.leido = time.monotonic()
+
+    def vacio(self) -> bool:
+        return not self.favoritas and not self.menus and self.carrito is None
+
+
+def _json(valor) -> str:
+    return json.dumps(valor, ensure_ascii=False, separators=(",", ":"))
+
+
+class AlmacenUsuarios:
+    """
+    Datos por usuario en una LRU de `max_usuarios`, persistidos con escritura diferida
+
+    Los usuarios con escrituras sin volcar no se expulsan de la LRU (se
+    leerían del disco sin ellas), así que puede pasarse del límite hasta
+    el siguiente volcado. Sin `ruta` todo queda solo en memoria y los
+    usuarios expulsados se pierden. Consultar a un usuario sin datos no lo
+    añade a la LRU. Las favoritas y los menús se escriben fila a fila, de modo que
+    varios procesos sobre la misma base de datos no se pisan; el carrito
+    se sustituye entero y gana la última escritura.
+    """
+
+    def __init__(self, ruta: Optional[str] = None, max_usuarios: int = 10_000,
+                 intervalo: float = 0.5, max_pendientes: int = 5_000,
+                 vigencia: Optional[float] = None):
+        self.ruta = ruta
+        self.max_usuarios = max_usuarios
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        self.vigencia = vigencia
+        self._pool = None
+        self._catalogo = None
+        self._recalcular_carrito: Optional[Callable[[dict], dict]] = None
+        self._recalcular_menu: Optional[Callable[[dict], dict]] = None
+        self._cambios: Dict[int, float] = {}  # receta_id -> instante de su último cambio
+        self._recarga = 0.0  # instante del último cambio de todo el catálogo
+        if ruta:
+            conexion = sqlite3.connect(ruta)
+            try:
+                conexion.execute("PRAGMA journal_mode = WAL")
+                conexion.executescript(ESQUEMA)
+            finally:
+                conexion.close()
+            self._pool = PoolSQLite(ruta, tamano=2)
+        self._iniciar()
+        if ruta and hasattr(os, "register_at_fork"):
+            # El hilo de escritura no sobrevive a fork; en los trabajadores de
+            # servidor.py hay además otros procesos escribiendo
+            referencia = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: _reiniciar(referencia))
+
+    def _iniciar(self) -> None:
+        self._usuarios: "OrderedDict[int, DatosUsuario]" = OrderedDict()
+        self._cargando: Dict[int, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        # Operaciones pendientes de volcar
+        self._favoritas: Dict[Tuple[int, int], Optional[float]] = {}  # None = quitada
+        self._menus: List[Tuple[int, float, str]] = []
+        self._carritos: Dict[int, Tuple[str, float]] = {}
+        self._sucios: set = set()  # usuarios con operaciones pendientes
+        self._volcando: set = set()  # usuarios del volcado en curso
+        self._despertar = threading.Event()
+        self._detener = False
+        self._hilo: Optional[threading.Thread] = None
+        self.volcados = 0
+        self.filas_escritas = 0
+        self.errores = 0
+        self.segundos_volcando = 0.0
+        self.aciertos = 0
+        self.fallos = 0
+
+    # ---------- Catálogo ----------
+
+    def seguir_catalogo(self, catalogo, recalcular_carrito: Callable[[dict], dict],
+                        recalcular_menu: Callable[[dict], dict]) -> None:
+        """
+        Recalcula al leerlos los carritos y menús con recetas cambiadas
+
+        `recalcular_carrito` y `recalcular_menu` reciben lo guardado y
+        devuelven lo que hay que guardar con el catálogo actual. Lo que se
+        calculó antes de llamar a este método (p. ej. en otra ejecución)
+        se recalcula la primera vez que se lee.
+        """
+        self._catalogo = catalogo
+        self._recalcular_carrito = recalcular_carrito
+        self._recalcular_menu = recalcular_menu
+        self._recarga = time.time()
+        catalogo.suscribir(self._al_cambiar)
+
+    def _al_cambiar(self, version: int, posiciones: Optional[List[int]],
+                    solo_precios: bool = False) -> None:
+        ahora = time.time()
+        almacen = self._catalogo.todas()
+        # Si cambia más de la mitad del catálogo, se trata como una recarga
+        if posiciones is None or 2 * len(posiciones) > len(almacen):
+            self._recarga = ahora
+            self._cambios = {}
+        else:
+            self._cambios.update(dict.fromkeys(almacen.ids.datos[posiciones].tolist(), ahora))
+
+    def _obsoleto(self, recetas_ids: Iterable[int], calculado: float) -> bool:
+        cambios = self._cambios
+        return calculado <= self._recarga or any(
+            cambios.get(receta_id, 0.0) >= calculado for receta_id in recetas_ids
+        )
+
+    def _carrito_al_dia(self, usuario: int, datos: DatosUsuario) -> Optional[dict]:
+        carrito = datos.carrito
+        if (carrito is None or self._catalogo is None
+                or not self._obsoleto(carrito["recetas_ids"], carrito.get("calculado", 0.0))):
+            return carrito
+        self._anotar_carrito(usuario, datos, self._recalcular_carrito(carrito))
+        return datos.carrito
+
+    def _menus_al_dia(self, usuario: int, datos: DatosUsuario) -> Deque[dict]:
+        if self._catalogo is None:
+            return datos.menus
+        for indice in range(len(datos.menus)):
+            menu = datos.menus[indice]
+            if self._obsoleto(menu["recetas"], menu.get("calculado", 0.0)):
+                menu = {**self._recalcular_menu(menu), "creado": menu["creado"],
+                        "calculado": time.time()}
+                datos.menus[indice] = menu
+                self._anotar_menu(usuario, menu)
+        return datos.menus
+
+    # ---------- Lectura ----------
+
+    async def _entrada(self, usuario: int, crear: bool = True) -> DatosUsuario:
+        """
+        Datos del usuario, leídos del disco si no están en la LRU
+
+        Con `crear=False` (solo lectura) un usuario sin datos no entra en la LRU.
+        """
+        datos = self._usuarios.get(usuario)
+        if datos is not None and not self._caducada(usuario, datos):
+            self._usuarios.move_to_end(usuario)
+            self.aciertos += 1
+            return datos
+        self.fallos += 1
+        cargando = self._cargando.get(usuario)
+        if cargando is None:
+            cargando = asyncio.ensure_future(self._leer(usuario))
+            self._cargando[usuario] = cargando
+            cargando.add_done_callback(lambda _: self._cargando.pop(usuario, None))
+        datos = await asyncio.shield(cargando)
+        actual = self._usuarios.get(usuario)
+        if actual is datos:
+            self._usuarios.move_to_end(usuario)
+        elif crear or actual is not None or not datos.vacio():
+            self._usuarios[usuario] = datos
+            self._usuarios.move_to_end(usuario)
+            self._expulsar()
+        return datos
+
+    def _caducada(self, usuario: int, datos: DatosUsuario) -> bool:
+        return (self.vigencia is not None and time.monotonic() - datos.leido > self.vigencia
+                and usuario not in self._sucios and usuario not in self._volcando)
+
+    async def _leer(self, usuario: int) -> DatosUsuario:
+        datos = DatosUsuario()
+        if self._pool is not None:
+            favoritas, menus, carrito = await self._pool.consultar_varias([
+                (SQL_FAVORITAS, (usuario,)),
+                (SQL_MENUS, (usuario, MENUS_POR_USUARIO)),
+                (SQL_CARRITO, (usuario,)),
+            ])
+            datos.favoritas = dict(favoritas)
+            datos.menus.extend({**json.loads(menu), "creado": creado}
+                               for creado, menu in reversed(menus))
+            datos.carrito = json.loads(carrito[0][0]) if carrito else None
+        return datos
+
+    def _expulsar(self) -> None:
+        """Quita los usuarios menos usados que no tengan escrituras pendientes"""
+        exceso = len(self._usuarios) - self.max_usuarios
+        if exceso <= 0:
+            return
+        with self._lock:
+            protegidos = self._sucios | self._volcando
+        for usuario in list(self._usuarios):
+            if exceso <= 0:
+                break
+            if usuario not in protegidos:
+                del self._usuarios[usuario]
+                exceso -= 1
+
+    async def favoritas(self, usuario: int) -> List[int]:
+        """Recetas favoritas, de la más reciente a la más antigua"""
+        return list(reversed((await self._entrada(usuario, crear=False)).favoritas))
+
+    async def menus(self, usuario: int, limite: int = MENUS_POR_USUARIO) -> List[dict]:
+        """Menús guardados, del más reciente al más antiguo"""
+        menus = self._menus_al_dia(usuario, await self._entrada(usuario, crear=False))
+        return [menus[-1 - i] for i in range(min(limite, len(menus)))]
+
+    async def carrito(self, usuario: int) -> Optional[dict]:
+        return self._carrito_al_dia(usuario, await self._entrada(usuario, crear=False))
+
+    # ---------- Escritura ----------
+
+    async def marcar_favorita(self, usuario: int, receta_id: int) -> bool:
+        """Marca una receta como favorita; False si ya lo era"""
+        datos = await self._entrada(usuario)
+        if receta_id in datos.favoritas:
+            return False
+        datos.favoritas[receta_id] = creado = time.time()
+        self._pendiente(usuario, lambda: self._favoritas.__setitem__((usuario, receta_id), creado))
+        return True
+
+    async def quitar_favorita(self, usuario: int, receta_id: int) -> bool:
+        """Desmarca una receta; False si no era favorita"""
+        datos = await self._entrada(usuario)
+        if datos.favoritas.pop(receta_id, None) is None:
+            return False
+        self._pendiente(usuario, lambda: self._favoritas.__setitem__((usuario, receta_id), None))
+        return True
+
+    async def guardar_menu(self, usuario: int, menu: dict) -> dict:
+        """Añade un menú a los del usuario y lo devuelve con su instante de creación"""
+        datos = await self._entrada(usuario)
+        creado = time.time()
+        if datos.menus and datos.menus[-1]["creado"] >= creado:
+            creado = datos.menus[-1]["creado"] + 1e-6  # clave única aunque coincida el reloj
+        menu = {**menu, "creado": creado, "calculado": time.time()}
+        datos.menus.append(menu)
+        self._anotar_menu(usuario, menu)
+        return menu
+
+    def _anotar_menu(self, usuario: int, menu: dict) -> None:
+        """Deja pendiente la fila de un menú; si ya existía, se sustituye"""
+        creado = menu["creado"]
+        texto = _json({clave: valor for clave, valor in menu.items() if clave != "creado"})
+        self._pendiente(usuario, lambda: self._menus.append((usuario, creado, texto)))
+
+    async def guardar_carrito(self, usuario: int, carrito: dict) -> None:
+        self._anotar_carrito(usuario, await self._entrada(usuario), carrito)
+
+    def _anotar_carrito(self, usuario: int, datos: DatosUsuario, carrito: dict) -> None:
+        datos.carrito = carrito = {**carrito, "calculado": time.time()}
+        texto = _json(carrito)
+        self._pendiente(usuario, lambda: self._carritos.__setitem__(usuario, (texto, time.time())))
+
+    def _pendiente(self, usuario: int, anotar) -> None:
+        """Anota una operación para el próximo volcado, sin tocar el disco"""
+        if self.ruta is None:
+            return
+        with self._lock:
+            anotar()
+            self._sucios.add(usuario)
+            pendientes = len(self._favoritas) + len(self._menus) + len(self._carritos)
+        if self._hilo is None:
+            self._arrancar()
+        if pendientes >= self.max_pendientes:
+            self._despertar.set()
+
+    # ---------- Volcado ----------
+
+    def _arrancar(self) -> None:
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._escribir, name="usuarios-volcado",
+                                              daemon=True)
+                self._hilo.start()
+
+    def _escribir(self) -> None:
+        conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+        conexion.execute("PRAGMA synchronous = NORMAL")
+        try:
+            while not self._detener:
+                self._despertar.wait(self.intervalo)
+                self._despertar.clear()
+                self._volcar(conexion)
+            self._volcar(conexion)
+        finally:
+            conexion.close()
+
+    def _volcar(self, conexion: sqlite3.Connection) -> None:
+        """Escribe en una transacción todo lo pendiente; si falla, lo devuelve a la cola"""
+        with self._lock:
+            if not self._sucios:
+                return
+            favoritas, self._favoritas = self._favoritas, {}
+            menus, self._menus = self._menus, []
+            carritos, self._carritos = self._carritos, {}
+            self._volcando, self._sucios = self._sucios, set()
+
+        inicio = time.perf_counter()
+        try:
+            with conexion:
+                conexion.executemany(
+                    "INSERT OR REPLACE INTO favoritas (usuario, receta_id, creado) VALUES (?, ?, ?)",
+                    [(u, r, creado) for (u, r), creado in favoritas.items() if creado is not None],
+                )
+                conexion.executemany(
+                    "DELETE FROM favoritas WHERE usuario = ? AND receta_id = ?",
+                    [clave for clave, creado in favoritas.items() if creado is None],
+                )
+                conexion.executemany(
+                    "INSERT OR REPLACE INTO menus (usuario, creado, menu) VALUES (?, ?, ?)", menus
+                )
+                conexion.executemany(
+                    "INSERT OR REPLACE INTO carritos (usuario, carrito, actualizado) VALUES (?, ?, ?)",
+                    [(u, texto, actualizado) for u, (texto, actualizado) in carritos.items()],
+                )
+        except sqlite3.Error:
+            logger.exception("No se pudieron guardar los datos de %d usuarios; se reintenta",
+                             len(self._volcando))
+            with self._lock:
+                # Lo anotado durante el volcado es más reciente: no se pisa
+                for clave, creado in favoritas.items():
+                    self._favoritas.setdefault(clave, creado)
+                self._menus[:0] = menus
+                for usuario, carrito in carritos.items():
+                    self._carritos.setdefault(usuario, carrito)
+                self._sucios |= self._volcando
+                self._volcando = set()
+                self.errores += 1
+            return
+
+        with self._lock:
+            self._volcando = set()
+            self.volcados += 1
+            self.filas_escritas += len(favoritas) + len(menus) + len(carritos)
+            self.segundos_volcando += time.perf_counter() - inicio
+
+    def volcar(self) -> None:
+        """Escribe ya lo pendiente, en el hilo que llama (pruebas y apagado)"""
+        if self.ruta is None:
+            return
+        conexion = sqlite3.connect(self.ruta)
+        try:
+            self._volcar(conexion)
+        finally:
+            conexion.close()
+
+    def pendientes(self) -> int:
+        with self._lock:
+            return len(self._favoritas) + len(self._menus) + len(self._carritos)
+
+    def estadisticas(self) -> dict:
+        return {
+            "usuarios": len(self._usuarios),
+            "max_usuarios": self.max_usuarios,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "pendientes": self.pendientes(),
+            "volcados": self.volcados,
+            "filas_escritas": self.filas_escritas,
+            "errores": self.errores,
+            "segundos_volcando": round(self.segundos_volcando, 4),
+        }
+
+    def cerrar(self) -> None:
+        """Detiene el hilo de escritura tras volcar lo pendiente"""
+        if self._hilo is not None:
+            self._detener = True
+            self._despertar.set()
+            self._hilo.join()
+            self._hilo = None
+        else:
+            self.volcar()
+        if self._pool is not None:
+            self._pool.cerrar()
+
+
+def _reiniciar(referencia: weakref.ref) -> None:
+    almacen = referencia()
+    if almacen is not None:
+        almacen._iniciar()
+        almacen.vigencia = VIGENCIA_COMPARTIDA if almacen.vigencia is None else almacen.vigencia